@@ -1,22 +1,19 @@
 import os
 import datetime
 import requests
-import boto3
 from googleapiclient.discovery import build
 from groq import Groq
 
+from auth_middleware import authenticate
+
 # ==============================
 # LOAD ENV VARIABLES (Lambda)
 # ==============================
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GCP_API_KEY = os.getenv("GCP_API_KEY")
-USERS_TABLE = os.getenv("USERS_TABLE")
 
-# ==============================
-# DYNAMODB SETUP
-# ==============================
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(USERS_TABLE)
+# Only these users-table attributes are needed for the greeting
+USER_FIELDS = ["first_name", "country"]
 
 # ==============================
 # COUNTRY MAPPINGS
@@ -170,40 +167,18 @@ def lambda_handler(event, context):
         return cors_response(200, {"message": "CORS preflight success"})
 
     # ---------------------------
-    # Get Cognito Sub from Authorization Header
+    # Authenticate and Fetch User
     # ---------------------------
-    headers = event.get("headers") or {}
-    auth_header = headers.get("Authorization") or headers.get("authorization")
+    cognito_sub, user, auth_error = authenticate(event, attributes=USER_FIELDS)
+    if auth_error:
+        return cors_response(*auth_error)
 
-    if not auth_header:
-        return cors_response(
-            401, {"message": "Unauthorized: Missing Authorization header"}
-        )
+    # Convert country name → ISO code
+    country_name = user.get("country", "united states").lower()
+    user_country = COUNTRY_NAME_TO_CODE.get(country_name, "US")
 
-    if auth_header.lower().startswith("bearer "):
-        cognito_sub = auth_header.split(" ", 1)[1]
-    else:
-        cognito_sub = auth_header
-
-    # ---------------------------
-    # Fetch User from DynamoDB
-    # ---------------------------
-    try:
-        response = table.get_item(Key={"cognito_sub": cognito_sub})
-        user = response.get("Item")
-
-        if not user:
-            return cors_response(404, {"message": "User not found"})
-
-        # Convert country name → ISO code
-        country_name = user.get("country", "united states").lower()
-        user_country = COUNTRY_NAME_TO_CODE.get(country_name, "US")
-
-        first_name = user.get("first_name", "User")
-        first_name = first_name.strip().title()
-
-    except Exception as e:
-        return cors_response(500, {"message": f"DynamoDB Error: {str(e)}"})
+    first_name = user.get("first_name", "User")
+    first_name = first_name.strip().title()
 
     # ---------------------------
     # Continue Existing Flow
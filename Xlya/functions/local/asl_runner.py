@@ -0,0 +1,421 @@
+"""
+XYLA INSIGHTS — Local ASL Runner
+Interprets the subset of Amazon States Language used by
+statemachine/definition.asl.json and runs the real handler modules in-process
+(thread mode) or in worker processes (process mode).
+
+Supported: Task, Parallel, Pass, Succeed and Fail states; InputPath,
+ResultPath, OutputPath, TimeoutSeconds, Retry and Catch. Parameters,
+ResultSelector, Choice, Map and service integrations are rejected up front,
+rather than silently run differently from the cloud.
+
+Every state entered is recorded with its latency, attempts and payload sizes;
+critical_path() walks the trace and, at each Parallel state, follows the
+slowest branch.
+"""
+import sys
+import copy
+import json
+import time
+import uuid
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+# Step Functions rejects state input/output larger than this
+PAYLOAD_LIMIT_BYTES = 256 * 1024
+
+SUPPORTED_TYPES = {"Task", "Parallel", "Pass", "Succeed", "Fail"}
+UNSUPPORTED_FIELDS = {"Parameters", "ResultSelector", "ItemsPath", "ItemSelector", "Arguments", "Output"}
+DEFAULT_TASK_TIMEOUT = 900
+
+
+class UnsupportedDefinition(Exception):
+    pass
+
+
+class StateFailure(Exception):
+    """A state failed with an ASL error name, as Retry/Catch see it"""
+
+    def __init__(self, error, cause=""):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+# ============================================================
+# Definitions and Handlers
+# ============================================================
+def load_definition(path, substitutions=None):
+    """Read an ASL file and apply DefinitionSubstitutions (${Name} -> value)"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    for name, value in (substitutions or {}).items():
+        text = text.replace("${" + name + "}", value)
+    definition = json.loads(text)
+    validate(definition)
+    return definition
+
+
+def validate(definition):
+    for name, state in definition["States"].items():
+        if state["Type"] not in SUPPORTED_TYPES:
+            raise UnsupportedDefinition(f"State '{name}': type {state['Type']} is not supported")
+        unsupported = UNSUPPORTED_FIELDS & set(state)
+        if unsupported:
+            raise UnsupportedDefinition(f"State '{name}': {', '.join(sorted(unsupported))} not supported")
+        if state["Type"] == "Task" and state["Resource"].startswith("arn:aws:states:::"):
+            raise UnsupportedDefinition(f"State '{name}': service integrations are not supported")
+        for branch in state.get("Branches", []):
+            validate(branch)
+
+
+class HandlerSpec:
+    """
+    A Lambda handler on disk. Picklable, so process-mode workers can load it
+    themselves. Every handler file is called app.py, so each gets a unique
+    module name.
+    """
+
+    def __init__(self, code_dir, module="app", function="lambda_handler", extra_paths=()):
+        self.code_dir = str(code_dir)
+        self.module = module
+        self.function = function
+        self.extra_paths = [str(p) for p in extra_paths]
+
+    def load(self):
+        for path in [self.code_dir, *self.extra_paths]:
+            if path not in sys.path:
+                sys.path.insert(0, path)
+        module_name = f"_local_{abs(hash(self.code_dir))}_{self.module}"
+        module = sys.modules.get(module_name)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(module_name, f"{self.code_dir}/{self.module}.py")
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+        return getattr(module, self.function)
+
+
+class LambdaContext:
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+# ============================================================
+# Worker-side Invocation
+# ============================================================
+_worker_handlers = {}
+
+
+def _worker_init(initializer, initargs):
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _invoke(resource, handler, payload_json, timeout_seconds):
+    """
+    Run one handler on a JSON payload; errors come back as values so that
+    process-mode results pickle cleanly. Returns (ok, result_json_or_error).
+    """
+    if handler is None:
+        handler = _worker_handlers.get(resource)
+        if handler is None:
+            raise RuntimeError(f"No handler registered for {resource}")
+        if isinstance(handler, HandlerSpec):
+            handler = _worker_handlers[resource] = handler.load()
+    try:
+        result = handler(json.loads(payload_json), LambdaContext(resource, timeout_seconds))
+        return True, json.dumps(result, default=str)
+    except Exception as e:
+        return False, (type(e).__name__, str(e))
+
+
+def _register_worker_handlers(handlers, initializer, initargs):
+    _worker_init(initializer, initargs)
+    _worker_handlers.update(handlers)
+
+
+# ============================================================
+# JSONPath (the "$.a.b" subset)
+# ============================================================
+def _path_parts(path):
+    if path == "$":
+        return []
+    if not path.startswith("$."):
+        raise UnsupportedDefinition(f"Unsupported path: {path}")
+    return path[2:].split(".")
+
+
+def get_path(data, path):
+    if path is None:
+        return {}
+    for part in _path_parts(path):
+        if not isinstance(data, dict) or part not in data:
+            raise StateFailure("States.Runtime", f"Path {path} not found in input")
+        data = data[part]
+    return data
+
+
+def set_path(data, path, value):
+    if path is None:
+        return data
+    parts = _path_parts(path)
+    if not parts:
+        return value
+    data = copy.deepcopy(data) if isinstance(data, dict) else {}
+    node = data
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+    node[parts[-1]] = value
+    return data
+
+
+def _size(value):
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def _matches(error, error_equals):
+    if "States.ALL" in error_equals or error in error_equals:
+        return True
+    # As in AWS, TaskFailed matches every error except a timeout
+    return "States.TaskFailed" in error_equals and error != "States.Timeout"
+
+
+# ============================================================
+# Runner
+# ============================================================
+class AslRunner:
+    """
+    Usage:
+
+        runner = AslRunner(definition, {"arn:crawler": HandlerSpec("src/crawler", extra_paths=[layer])})
+        result = runner.run(pipeline_input)
+        print(format_report(result))
+
+    resources maps each Task Resource string to a HandlerSpec (or, in thread
+    mode, any callable(event, context)). retry_time_scale multiplies Retry
+    intervals; the default of 0 retries immediately so benchmarks measure work,
+    not back-off.
+    """
+
+    def __init__(self, definition, resources, mode="thread", max_workers=16, retry_time_scale=0.0,
+                 initializer=None, initargs=()):
+        if mode not in ("thread", "process"):
+            raise ValueError("mode must be 'thread' or 'process'")
+        validate(definition)
+        self.definition = definition
+        self.resources = resources
+        self.mode = mode
+        self.retry_time_scale = retry_time_scale
+
+        if mode == "process":
+            for resource, handler in resources.items():
+                if not isinstance(handler, HandlerSpec):
+                    raise ValueError(f"Process mode needs a HandlerSpec for {resource}")
+            self._pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_register_worker_handlers,
+                initargs=(dict(resources), initializer, initargs),
+            )
+            self._handlers = {}
+        else:
+            _worker_init(initializer, initargs)
+            self._pool = ThreadPoolExecutor(max_workers=max_workers)
+            self._handlers = {
+                resource: handler.load() if isinstance(handler, HandlerSpec) else handler
+                for resource, handler in resources.items()
+            }
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # ---------------------------
+    # Execution
+    # ---------------------------
+    def run(self, execution_input):
+        started = time.monotonic()
+        trace = []
+        status, error, output = "SUCCEEDED", None, None
+        try:
+            output = self._run_states(self.definition, execution_input, "", trace)
+        except StateFailure as e:
+            status, error = "FAILED", {"Error": e.error, "Cause": e.cause}
+        return {
+            "status": status,
+            "output": output,
+            "error": error,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            "trace": trace,
+        }
+
+    def _run_states(self, machine, data, prefix, trace):
+        name = machine["StartAt"]
+        while True:
+            state = machine["States"][name]
+            record = {
+                "state": f"{prefix}{name}",
+                "type": state["Type"],
+                "attempts": 0,
+                "input_bytes": _size(data),
+                "branches": [],
+            }
+            trace.append(record)
+            started = time.monotonic()
+            try:
+                data, next_name = self._run_state(name, state, data, record)
+            finally:
+                record["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+            record["output_bytes"] = _size(data)
+            record["over_limit"] = max(record["input_bytes"], record["output_bytes"]) > PAYLOAD_LIMIT_BYTES
+            if next_name is None:
+                return data
+            name = next_name
+
+    def _run_state(self, name, state, data, record):
+        state_type = state["Type"]
+        if state_type == "Succeed":
+            return data, None
+        if state_type == "Fail":
+            raise StateFailure(state.get("Error", "States.Fail"), state.get("Cause", ""))
+
+        effective_input = get_path(data, state.get("InputPath", "$"))
+        retry_counts = {}
+        while True:
+            record["attempts"] += 1
+            try:
+                if state_type == "Task":
+                    result = self._run_task(state, effective_input)
+                elif state_type == "Parallel":
+                    result = self._run_parallel(name, state, effective_input, record)
+                else:  # Pass
+                    result = state.get("Result", effective_input)
+                break
+            except StateFailure as failure:
+                retrier = self._retrier_for(state, failure.error)
+                if retrier is not None:
+                    index, rule = retrier
+                    attempt = retry_counts.get(index, 0)
+                    if attempt < rule.get("MaxAttempts", 3):
+                        retry_counts[index] = attempt + 1
+                        delay = rule.get("IntervalSeconds", 1) * rule.get("BackoffRate", 2.0) ** attempt
+                        time.sleep(delay * self.retry_time_scale)
+                        continue
+                catcher = next(
+                    (c for c in state.get("Catch", []) if _matches(failure.error, c["ErrorEquals"])), None
+                )
+                record["error"] = failure.error
+                if catcher is None:
+                    raise
+                error_output = {"Error": failure.error, "Cause": failure.cause}
+                return set_path(data, catcher.get("ResultPath", "$"), error_output), catcher["Next"]
+
+        output = set_path(data, state.get("ResultPath", "$"), result)
+        output = get_path(output, state.get("OutputPath", "$"))
+        return output, None if state.get("End") else state["Next"]
+
+    @staticmethod
+    def _retrier_for(state, error):
+        for index, rule in enumerate(state.get("Retry", [])):
+            if _matches(error, rule["ErrorEquals"]):
+                return index, rule
+        return None
+
+    def _run_task(self, state, payload):
+        resource = state["Resource"]
+        if resource not in self.resources:
+            raise UnsupportedDefinition(f"No handler registered for resource {resource}")
+        timeout = state.get("TimeoutSeconds", DEFAULT_TASK_TIMEOUT)
+        handler = self._handlers.get(resource)
+        future = self._pool.submit(_invoke, resource, handler, json.dumps(payload, default=str), timeout)
+        try:
+            ok, value = future.result(timeout=timeout)
+        except FutureTimeout:
+            # A running handler cannot be interrupted; it is abandoned like a timed-out Lambda
+            raise StateFailure("States.Timeout", f"{resource} exceeded {timeout}s")
+        if not ok:
+            raise StateFailure(*value)
+        return json.loads(value)
+
+    def _run_parallel(self, name, state, payload, record):
+        record["branches"] = [[] for _ in state["Branches"]]
+        prefix = f"{record['state']}/"
+        with ThreadPoolExecutor(max_workers=len(state["Branches"])) as branch_pool:
+            futures = [
+                branch_pool.submit(self._run_states, branch, payload, prefix, record["branches"][i])
+                for i, branch in enumerate(state["Branches"])
+            ]
+            results, failure = [], None
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except StateFailure as e:
+                    failure = failure or e
+        if failure is not None:
+            # Like Step Functions: one failed branch fails the whole Parallel state
+            raise failure
+        return results
+
+
+# ============================================================
+# Reporting
+# ============================================================
+def critical_path(trace):
+    """States on the longest path; at each Parallel, the slowest branch's states"""
+    path = []
+    for record in trace:
+        branches = [b for b in record["branches"] if b]
+        if record["type"] == "Parallel" and branches:
+            slowest = max(branches, key=lambda b: sum(r["duration_ms"] for r in critical_path(b)))
+            branch_path = critical_path(slowest)
+            overhead = record["duration_ms"] - sum(r["duration_ms"] for r in branch_path)
+            path.append({"state": record["state"], "type": "Parallel", "duration_ms": round(max(0.0, overhead), 1)})
+            path.extend(branch_path)
+        else:
+            path.append({"state": record["state"], "type": record["type"], "duration_ms": record["duration_ms"]})
+    return path
+
+
+def _flatten(trace):
+    for record in trace:
+        yield record
+        for branch in record["branches"]:
+            yield from _flatten(branch)
+
+
+def format_report(result, calls=None):
+    lines = [
+        f"Execution {result['status']} in {result['duration_ms']:.0f} ms"
+        + (f" — {result['error']['Error']}: {result['error']['Cause'][:120]}" if result["error"] else ""),
+        "",
+        f"{'State':<40} {'Type':<9} {'Tries':>5} {'ms':>9} {'in KB':>8} {'out KB':>8}  Error",
+    ]
+    for record in _flatten(result["trace"]):
+        lines.append(
+            f"{record['state']:<40} {record['type']:<9} {record['attempts']:>5} {record['duration_ms']:>9.1f} "
+            f"{record['input_bytes'] / 1024:>8.1f} {record.get('output_bytes', 0) / 1024:>8.1f}  "
+            f"{record.get('error', '')}{'  [>256 KB]' if record.get('over_limit') else ''}"
+        )
+
+    path = critical_path(result["trace"])
+    total = sum(r["duration_ms"] for r in path) or 1.0
+    lines += ["", "Critical path:"]
+    for record in path:
+        lines.append(f"  {record['state']:<38} {record['duration_ms']:>9.1f} ms  {100 * record['duration_ms'] / total:5.1f}%")
+
+    if calls:
+        lines += ["", "Backend calls:"]
+        for name, count in sorted(calls.items()):
+            lines.append(f"  {name:<38} {count:>5}")
+    return "\n".join(lines)
@@ -0,0 +1,265 @@
+"""
+XYLA INSIGHTS — Local Stub Backends
+In-memory stand-ins for the AWS services, the Bedrock LLM, DuckDuckGo search
+and outbound HTTP that the pipeline Lambdas call, with configurable latency,
+so the handlers can be run and benchmarked on a laptop.
+
+install() patches boto3.client / boto3.resource and urllib.request.urlopen,
+and replaces duckduckgo_search.DDGS. It must run before any handler module is
+imported, because the handlers create their clients at import time. boto3 and
+botocore themselves are still required (error types come from botocore).
+"""
+import io
+import sys
+import json
+import time
+import types
+import threading
+import urllib.request
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+# Seconds per call; everything not listed is free
+DEFAULT_LATENCY = {
+    "bedrock": 1.5,
+    "search": 0.8,
+    "http": 0.3,
+    "s3": 0.02,
+    "dynamodb": 0.01,
+}
+
+SAMPLE_HTML = """<html><head><title>Example Co — Widgets for Teams</title>
+<meta name="description" content="Example Co builds collaborative widgets for modern teams.">
+<link rel="canonical" href="https://example.com/"></head>
+<body><h1>Widgets for teams</h1><h2>What is a team widget?</h2><h2>How does pricing work?</h2>
+<p>Example Co helps teams ship faster with shared widgets.</p>
+<img src="a.png" alt="Widget dashboard"><a href="/pricing">Pricing</a><a href="https://other.com">Partner</a>
+</body></html>"""
+
+
+def default_llm_responder(prompt):
+    """An empty JSON object: every analyzer falls back to its own defaults"""
+    return "{}"
+
+
+class Backends:
+    """Shared state of one stub installation: call counts and stored objects"""
+
+    def __init__(self, latency=None, llm_responder=default_llm_responder, html=SAMPLE_HTML, search_results=5):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.llm_responder = llm_responder
+        self.html = html
+        self.search_results = search_results
+        self.calls = Counter()
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend, operation):
+        with self._lock:
+            self.calls[f"{backend}.{operation}"] += 1
+        delay = self.latency.get(backend, 0)
+        if delay:
+            time.sleep(delay)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+
+# ============================================================
+# AWS Clients
+# ============================================================
+class _StubClient:
+    """Any operation not defined explicitly succeeds with an empty response"""
+
+    backend = None
+
+    def __init__(self, backends, service):
+        self._backends = backends
+        self._service = service
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(*args, **kwargs):
+            self._backends.record(self.backend or self._service, operation)
+            return {}
+        return call
+
+
+class _S3Client(_StubClient):
+    backend = "s3"
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._backends.record("s3", "put_object")
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        self._backends.objects[(Bucket, Key)] = data
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._backends.record("s3", "get_object")
+        if (Bucket, Key) not in self._backends.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+        return {"Body": io.BytesIO(self._backends.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._backends.record("s3", "head_object")
+        if (Bucket, Key) not in self._backends.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": Key}}, "HeadObject")
+        return {"ContentLength": len(self._backends.objects[(Bucket, Key)])}
+
+
+class _BedrockClient(_StubClient):
+    backend = "bedrock"
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._backends.record("bedrock", "invoke_model")
+        request = json.loads(body)
+        prompt = " ".join(
+            m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+            for m in request.get("messages", [])
+        )
+        text = self._backends.llm_responder(prompt)
+        payload = {"content": [{"type": "text", "text": text}]}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+class _StepFunctionsClient(_StubClient):
+    backend = "stepfunctions"
+
+    def start_execution(self, stateMachineArn, name, **kwargs):
+        self._backends.record("stepfunctions", "start_execution")
+        return {"executionArn": f"{stateMachineArn}:{name}".replace(":stateMachine:", ":execution:")}
+
+
+class _Table:
+    def __init__(self, backends, name):
+        self._backends = backends
+        self.name = name
+
+    def query(self, **kwargs):
+        self._backends.record("dynamodb", "query")
+        return {"Items": []}
+
+    def scan(self, **kwargs):
+        self._backends.record("dynamodb", "scan")
+        return {"Items": []}
+
+    def batch_writer(self, **kwargs):
+        table = self
+
+        class _Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def put_item(self, Item):
+                table._backends.record("dynamodb", "batch_write_item")
+
+        return _Writer()
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(*args, **kwargs):
+            # get_item misses; put/update/delete succeed
+            self._backends.record("dynamodb", operation)
+            return {}
+        return call
+
+
+class _DynamoDBResource:
+    def __init__(self, backends):
+        self._backends = backends
+
+    def Table(self, name):
+        return _Table(self._backends, name)
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._backends.record("dynamodb", "batch_get_item")
+        return {"Responses": {name: [] for name in RequestItems}, "UnprocessedKeys": {}}
+
+
+CLIENT_TYPES = {
+    "s3": _S3Client,
+    "bedrock-runtime": _BedrockClient,
+    "stepfunctions": _StepFunctionsClient,
+}
+
+
+# ============================================================
+# Search and HTTP
+# ============================================================
+def _ddgs_class(backends):
+    class DDGS:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def text(self, query, max_results=10, **kwargs):
+            backends.record("search", "text")
+            return [
+                {"title": f"Result {i} for {query}", "href": f"https://site{i}.example.org/", "body": query}
+                for i in range(min(max_results, backends.search_results))
+            ]
+
+    return DDGS
+
+
+class _HttpResponse:
+    def __init__(self, html):
+        self.status = 200
+        self._data = html.encode("utf-8")
+        self.headers = types.SimpleNamespace(get_content_charset=lambda: "utf-8")
+
+    def read(self, amount=-1):
+        return self._data if amount is None or amount < 0 else self._data[:amount]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# ============================================================
+# Installation
+# ============================================================
+def install(backends=None):
+    """Route every backend the handlers use to in-memory stubs; returns the Backends"""
+    import boto3
+
+    backends = backends or Backends()
+
+    def client(service_name, *args, **kwargs):
+        return CLIENT_TYPES.get(service_name, _StubClient)(backends, service_name)
+
+    def resource(service_name, *args, **kwargs):
+        if service_name != "dynamodb":
+            raise NotImplementedError(f"No stub resource for {service_name}")
+        return _DynamoDBResource(backends)
+
+    boto3.client = client
+    boto3.resource = resource
+
+    def urlopen(request, *args, **kwargs):
+        backends.record("http", "get")
+        return _HttpResponse(backends.html)
+
+    urllib.request.urlopen = urlopen
+
+    # The search library ships in a Lambda layer and may not be installed locally
+    ddg_module = sys.modules.get("duckduckgo_search")
+    if ddg_module is None:
+        try:
+            import duckduckgo_search as ddg_module
+        except ImportError:
+            ddg_module = types.ModuleType("duckduckgo_search")
+            sys.modules["duckduckgo_search"] = ddg_module
+    ddg_module.DDGS = _ddgs_class(backends)
+
+    return backends
@@ -0,0 +1,169 @@
+"""
+XYLA INSIGHTS — Pipeline Benchmark
+Runs statemachine/definition.asl.json end to end on the local ASL runner,
+against the real handler code and stubbed AWS / LLM / search backends, and
+prints per-state latency, payload sizes and the critical path.
+
+  python bench_pipeline.py                         # thread mode, default latencies
+  python bench_pipeline.py --runs 3 --checkpoints  # later runs resume from checkpoints
+  python bench_pipeline.py --mode process --llm-latency 3
+  python bench_pipeline.py --input task.json       # a recorded pipeline input
+
+Thread mode shares module state (e.g. the rate_limit token buckets) between
+handlers; process mode gives each handler its own, as separate Lambda
+containers would.
+
+Compare the critical path before and after a change to the definition or a
+handler (e.g. moving SeoAnalysis into the Parallel state) to see what it buys.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+from pathlib import Path
+
+LOCAL_DIR = Path(__file__).resolve().parent
+XLYA_DIR = LOCAL_DIR.parents[1]
+DEFINITION = XLYA_DIR / "functions" / "statemachine" / "definition.asl.json"
+HANDLERS_DIR = XLYA_DIR / "seo-aeo-geo-statemachine" / "src"
+SHARED_LAYER = XLYA_DIR / "layers" / "shared" / "python"
+
+sys.path.insert(0, str(LOCAL_DIR))
+
+from asl_runner import AslRunner, HandlerSpec, load_definition, critical_path, format_report  # noqa: E402
+import backends  # noqa: E402
+
+# DefinitionSubstitutions of SeoAeoGeoStateMachine -> handler directory
+PIPELINE_HANDLERS = {
+    "CrawlerLambda": "crawler",
+    "SEOAnalyzerLambda": "seo-analyzer",
+    "AEOAnalyzerLambda": "aeo-analyzer",
+    "GEOAnalyzerLambda": "geo-analyzer",
+    "CompetitorAnalyzerLambda": "competitor-analyzer",
+    "ScoringLambda": "scoring-seoaeogeo",
+}
+
+LOCAL_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "WEBSOCKET_ENDPOINT": "",
+    "S3_BUCKET": "",
+    "STATE_MACHINE_ARN": "",
+}
+
+
+def sample_pipeline_input(markdown_words=1500):
+    """The input the crawler hands the state machine, for a typical page"""
+    return {
+        "task_id": "bench0001",
+        "crawl_data": {
+            "url": "https://example.com",
+            "brand_name": "Example Co",
+            "keywords": "team widgets, collaboration tools, widget pricing",
+            "industry": "SaaS",
+            "title": "Example Co — Widgets for Teams",
+            "description": "Example Co builds collaborative widgets for modern teams.",
+            "statusCode": 200,
+            "markdown": " ".join(["widgets"] * markdown_words),
+            "html_snippet": backends.SAMPLE_HTML[:5000],
+            "headings": {
+                "h1": ["Widgets for teams"],
+                "h2": ["What is a team widget?", "How does pricing work?"],
+                "h3": [], "h4": [], "h5": [], "h6": [],
+            },
+            "links": {"internal": 12, "external": 4, "nofollow": 1, "total": 16},
+            "images": {"total": 3, "with_alt": 2, "without_alt": 1, "alt_texts": ["Widget dashboard", "Team"]},
+            "meta_tags": [{"name": "description", "content": "Example Co builds collaborative widgets."}],
+            "structured_data": [{"type": "Organization", "found": True}],
+            "word_count": markdown_words,
+            "has_robots_meta": True,
+            "has_canonical": True,
+            "has_sitemap_link": False,
+        },
+        "s3_location": {"bucket": "", "key": None, "url": None},
+        "metadata": {
+            "cognito_sub": "bench-user",
+            "brand_name": "Example Co",
+            "keywords": "team widgets, collaboration tools, widget pricing",
+            "industry": "SaaS",
+        },
+    }
+
+
+def install_stubs(latency, env):
+    """Process-mode worker initializer (and the thread-mode setup)"""
+    os.environ.update(env)
+    return backends.install(backends.Backends(latency=latency))
+
+
+def build_runner(mode, latency, env, retry_time_scale):
+    substitutions = {name: f"arn:aws:lambda:local:000000000000:function:{d}" for name, d in PIPELINE_HANDLERS.items()}
+    definition = load_definition(DEFINITION, substitutions)
+    resources = {
+        substitutions[name]: HandlerSpec(HANDLERS_DIR / d, extra_paths=[SHARED_LAYER])
+        for name, d in PIPELINE_HANDLERS.items()
+    }
+
+    if mode == "process":
+        runner = AslRunner(definition, resources, mode="process", retry_time_scale=retry_time_scale,
+                           initializer=install_stubs, initargs=(latency, env))
+        return runner, None
+
+    stub_backends = install_stubs(latency, env)
+    runner = AslRunner(definition, resources, mode="thread", retry_time_scale=retry_time_scale)
+    return runner, stub_backends
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SEO/AEO/GEO pipeline locally")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--input", help="JSON file with a pipeline input (defaults to a sample task)")
+    parser.add_argument("--llm-latency", type=float, default=backends.DEFAULT_LATENCY["bedrock"])
+    parser.add_argument("--search-latency", type=float, default=backends.DEFAULT_LATENCY["search"])
+    parser.add_argument("--http-latency", type=float, default=backends.DEFAULT_LATENCY["http"])
+    parser.add_argument("--retry-scale", type=float, default=0.0, help="multiplier on Retry intervals")
+    parser.add_argument("--checkpoints", action="store_true", help="enable stage checkpoints (in-memory S3)")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args(argv)
+
+    latency = {
+        **backends.DEFAULT_LATENCY,
+        "bedrock": args.llm_latency,
+        "search": args.search_latency,
+        "http": args.http_latency,
+    }
+    env = {**LOCAL_ENV, "CHECKPOINT_BUCKET": "local-checkpoints" if args.checkpoints else ""}
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            execution_input = json.load(f)
+    else:
+        execution_input = sample_pipeline_input()
+
+    runner, stub_backends = build_runner(args.mode, latency, env, args.retry_scale)
+    results = []
+    with runner:
+        for run in range(args.runs):
+            if stub_backends is not None:
+                stub_backends.reset_calls()
+            result = runner.run(execution_input)
+            results.append(result)
+            if args.json:
+                continue
+            print(f"\n=== Run {run + 1}/{args.runs} ({args.mode} mode) ===")
+            # Per-worker call counts are not collected in process mode
+            print(format_report(result, calls=stub_backends.calls if stub_backends else None))
+
+    if args.json:
+        print(json.dumps(
+            [{**r, "output": None, "critical_path": critical_path(r["trace"])} for r in results], indent=2
+        ))
+    elif args.runs > 1:
+        durations = [r["duration_ms"] for r in results]
+        print(f"\nTotal ms — min {min(durations):.0f}, median {statistics.median(durations):.0f}, max {max(durations):.0f}")
+    return 0 if all(r["status"] == "SUCCEEDED" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+"""
+XYLA INSIGHTS — Admission Control
+Per-user and global concurrency limits in front of pipeline start, with weighted
+fair queuing of the excess.
+
+admission-table (pk, sk) holds:
+
+  counter#global       | -           running count and the scheduler's virtual time
+  counter#user#<sub>   | -           running count for one user
+  slots                | <sub>#<id>  one lease per admitted task (expires_at)
+  queue#<sub>          | <ts>#<id>   queued tasks for one user, oldest first
+  queue-users          | <sub>       users with queued work: pass, weight, queued
+
+Admitting a task is one transaction: both counters are incremented under their
+caps and the lease is written. Releasing deletes the lease and decrements both
+counters, conditioned on the lease existing, so duplicate releases are no-ops.
+
+Queued work is dispatched with stride scheduling: each dispatch advances the
+user's pass by STRIDE / weight and the user with the lowest pass goes next.
+Weight comes from the user's coins balance, so a user with a deep queue cannot
+starve a user who just submitted one task.
+"""
+import os
+import json
+import time
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+ADMISSION_TABLE = os.environ.get("ADMISSION_TABLE", "admission-table")
+ADMISSION_USER_MAX_RUNNING = int(os.environ.get("ADMISSION_USER_MAX_RUNNING", "2"))
+ADMISSION_GLOBAL_MAX_RUNNING = int(os.environ.get("ADMISSION_GLOBAL_MAX_RUNNING", "20"))
+ADMISSION_LEASE_SECONDS = int(os.environ.get("ADMISSION_LEASE_SECONDS", "3600"))
+ADMISSION_COINS_PER_WEIGHT = int(os.environ.get("ADMISSION_COINS_PER_WEIGHT", "50"))
+ADMISSION_MAX_WEIGHT = int(os.environ.get("ADMISSION_MAX_WEIGHT", "8"))
+
+STRIDE = 1000
+GLOBAL_COUNTER = "counter#global"
+QUEUE_USERS = "queue-users"
+SLOTS = "slots"
+NO_SORT = "-"
+
+# Outcomes of a claim attempt
+ADMITTED = "admitted"
+USER_FULL = "user_full"
+GLOBAL_FULL = "global_full"
+ALREADY_CLAIMED = "already_claimed"
+CONFLICT = "conflict"
+
+# Retries of a claim cancelled by a concurrent write to the same counter
+CLAIM_CONFLICT_RETRIES = 3
+
+dynamodb = boto3.resource("dynamodb")
+dynamodb_client = boto3.client("dynamodb")
+
+
+def _user_counter(cognito_sub):
+    return f"counter#user#{cognito_sub}"
+
+
+def _queue_pk(cognito_sub):
+    return f"queue#{cognito_sub}"
+
+
+def weight_for_coins(coins):
+    try:
+        coins = int(coins or 0)
+    except (TypeError, ValueError):
+        coins = 0
+    return max(1, min(ADMISSION_MAX_WEIGHT, 1 + coins // ADMISSION_COINS_PER_WEIGHT))
+
+
+# ============================================================
+# Low-level transaction items (client API, typed attribute values)
+# ============================================================
+def _key(pk, sk=NO_SORT):
+    return {"pk": {"S": pk}, "sk": {"S": sk}}
+
+
+def _increment_counter(pk, cap, extra_set=None, extra_values=None):
+    update = "ADD running :one"
+    values = {":one": {"N": "1"}, ":cap": {"N": str(cap)}}
+    if extra_set:
+        update += " SET " + extra_set
+        values.update(extra_values or {})
+    return {
+        "Update": {
+            "TableName": ADMISSION_TABLE,
+            "Key": _key(pk),
+            "UpdateExpression": update,
+            "ConditionExpression": "attribute_not_exists(running) OR running < :cap",
+            "ExpressionAttributeValues": values,
+        }
+    }
+
+
+def _decrement_counter(pk):
+    return {
+        "Update": {
+            "TableName": ADMISSION_TABLE,
+            "Key": _key(pk),
+            "UpdateExpression": "ADD running :minus",
+            "ConditionExpression": "running > :zero",
+            "ExpressionAttributeValues": {":minus": {"N": "-1"}, ":zero": {"N": "0"}},
+        }
+    }
+
+
+def _put_lease(cognito_sub, task_id):
+    now = int(time.time())
+    return {
+        "Put": {
+            "TableName": ADMISSION_TABLE,
+            "Item": {
+                **_key(SLOTS, f"{cognito_sub}#{task_id}"),
+                "cognito_sub": {"S": cognito_sub},
+                "task_id": {"S": task_id},
+                "admitted_at": {"N": str(now)},
+                "expires_at": {"N": str(now + ADMISSION_LEASE_SECONDS)},
+            },
+            "ConditionExpression": "attribute_not_exists(pk)",
+        }
+    }
+
+
+def _claim(items, counter_offset):
+    """
+    Run a claim transaction whose items[counter_offset] / [counter_offset + 1]
+    are the global / user counter increments. Returns an outcome constant.
+    A conflict with a concurrent claim or release on the same counters is
+    retried; CONFLICT means it kept conflicting, not that a cap was reached.
+    """
+    for attempt in range(CLAIM_CONFLICT_RETRIES + 1):
+        try:
+            dynamodb_client.transact_write_items(TransactItems=items)
+            return ADMITTED
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = [r.get("Code") for r in e.response.get("CancellationReasons", [])]
+        if len(reasons) > counter_offset and reasons[counter_offset] == "ConditionalCheckFailed":
+            return GLOBAL_FULL
+        if len(reasons) > counter_offset + 1 and reasons[counter_offset + 1] == "ConditionalCheckFailed":
+            return USER_FULL
+        if "TransactionConflict" not in reasons:
+            return ALREADY_CLAIMED
+        time.sleep(0.05 * (attempt + 1))
+    return CONFLICT
+
+
+# ============================================================
+# Admission
+# ============================================================
+def has_queued(cognito_sub):
+    response = dynamodb.Table(ADMISSION_TABLE).query(
+        KeyConditionExpression=Key("pk").eq(_queue_pk(cognito_sub)),
+        Limit=1,
+        ProjectionExpression="pk",
+    )
+    return bool(response.get("Items"))
+
+
+def has_lease(cognito_sub, task_id):
+    response = dynamodb.Table(ADMISSION_TABLE).get_item(
+        Key={"pk": SLOTS, "sk": f"{cognito_sub}#{task_id}"},
+        ProjectionExpression="pk",
+        ConsistentRead=True,
+    )
+    return "Item" in response
+
+
+def try_admit(cognito_sub, task_id):
+    """
+    Admit immediately if the user has nothing queued and both caps allow it.
+    A task that already holds a slot is ALREADY_CLAIMED whatever the caps say,
+    so a running task is never queued a second time.
+    """
+    if has_lease(cognito_sub, task_id):
+        print(f"[Admission] Task {task_id} for {cognito_sub}: {ALREADY_CLAIMED}")
+        return ALREADY_CLAIMED
+    if has_queued(cognito_sub):
+        return USER_FULL
+    items = [
+        _increment_counter(GLOBAL_COUNTER, ADMISSION_GLOBAL_MAX_RUNNING),
+        _increment_counter(_user_counter(cognito_sub), ADMISSION_USER_MAX_RUNNING),
+        _put_lease(cognito_sub, task_id),
+    ]
+    outcome = _claim(items, counter_offset=0)
+    print(f"[Admission] Task {task_id} for {cognito_sub}: {outcome}")
+    return outcome
+
+
+def enqueue(cognito_sub, task_id, action, coins=0):
+    """
+    Queue a task. action is what dispatch() runs once a slot frees up:
+      {"type": "start_file", "bucket": ..., "key": ..., "body": ...}
+      {"type": "start_execution", "state_machine_arn": ..., "name": ..., "input": ...}
+      {"type": "task_token", "token": ...}
+    """
+    table = dynamodb.Table(ADMISSION_TABLE)
+    enqueued_at = int(time.time() * 1000)
+    table.put_item(
+        Item={
+            "pk": _queue_pk(cognito_sub),
+            "sk": f"{enqueued_at:013d}#{task_id}",
+            "task_id": task_id,
+            "cognito_sub": cognito_sub,
+            "action_json": json.dumps(action),
+        }
+    )
+
+    # A user joining the queue starts at the scheduler's current virtual time,
+    # so idle time does not bank credit
+    vtime = _virtual_time(table)
+    table.update_item(
+        Key={"pk": QUEUE_USERS, "sk": cognito_sub},
+        UpdateExpression="SET #pass = if_not_exists(#pass, :vt), weight = :w ADD queued :one",
+        ExpressionAttributeNames={"#pass": "pass"},
+        ExpressionAttributeValues={":vt": vtime, ":w": weight_for_coins(coins), ":one": 1},
+    )
+    print(f"[Admission] Task {task_id} for {cognito_sub} queued")
+
+
+def _virtual_time(table):
+    item = table.get_item(Key={"pk": GLOBAL_COUNTER, "sk": NO_SORT}).get("Item") or {}
+    return int(item.get("vtime", 0))
+
+
+# ============================================================
+# Release
+# ============================================================
+def release(cognito_sub, task_id):
+    """Free the task's slot; False if it was already released (or never admitted)"""
+    items = [
+        {
+            "Delete": {
+                "TableName": ADMISSION_TABLE,
+                "Key": _key(SLOTS, f"{cognito_sub}#{task_id}"),
+                "ConditionExpression": "attribute_exists(pk)",
+            }
+        },
+        _decrement_counter(GLOBAL_COUNTER),
+        _decrement_counter(_user_counter(cognito_sub)),
+    ]
+    try:
+        dynamodb_client.transact_write_items(TransactItems=items)
+        print(f"[Admission] Released slot of task {task_id}")
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "TransactionCanceledException":
+            return False
+        raise
+
+
+def reap_expired_leases():
+    """Release leases whose holder never reported back (crashed Lambda, lost event)"""
+    table = dynamodb.Table(ADMISSION_TABLE)
+    now = int(time.time())
+    kwargs = {
+        "KeyConditionExpression": Key("pk").eq(SLOTS),
+        "FilterExpression": Attr("expires_at").lt(now),
+        "ProjectionExpression": "cognito_sub, task_id",
+    }
+    reaped = 0
+    while True:
+        response = table.query(**kwargs)
+        for lease in response.get("Items", []):
+            if release(lease["cognito_sub"], lease["task_id"]):
+                reaped += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    if reaped:
+        print(f"[Admission] Reaped {reaped} expired lease(s)")
+    return reaped
+
+
+# ============================================================
+# Weighted Fair Dispatch
+# ============================================================
+def _queued_users(table):
+    users = []
+    kwargs = {"KeyConditionExpression": Key("pk").eq(QUEUE_USERS)}
+    while True:
+        response = table.query(**kwargs)
+        users.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return sorted(users, key=lambda u: (int(u.get("pass", 0)), u["sk"]))
+
+
+def _oldest_queued(table, cognito_sub):
+    response = table.query(
+        KeyConditionExpression=Key("pk").eq(_queue_pk(cognito_sub)),
+        Limit=1,
+    )
+    items = response.get("Items", [])
+    return items[0] if items else None
+
+
+def _drop_idle_user(table, cognito_sub):
+    try:
+        table.delete_item(
+            Key={"pk": QUEUE_USERS, "sk": cognito_sub},
+            ConditionExpression="queued <= :zero",
+            ExpressionAttributeValues={":zero": 0},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _claim_queued(user, queued):
+    cognito_sub = user["sk"]
+    new_pass = int(user.get("pass", 0)) + STRIDE // max(1, int(user.get("weight", 1)))
+    items = [
+        {
+            "Delete": {
+                "TableName": ADMISSION_TABLE,
+                "Key": _key(queued["pk"], queued["sk"]),
+                "ConditionExpression": "attribute_exists(pk)",
+            }
+        },
+        _increment_counter(
+            GLOBAL_COUNTER,
+            ADMISSION_GLOBAL_MAX_RUNNING,
+            extra_set="vtime = :vt",
+            extra_values={":vt": {"N": str(int(user.get("pass", 0)))}},
+        ),
+        _increment_counter(_user_counter(cognito_sub), ADMISSION_USER_MAX_RUNNING),
+        _put_lease(cognito_sub, queued["task_id"]),
+        {
+            "Update": {
+                "TableName": ADMISSION_TABLE,
+                "Key": _key(QUEUE_USERS, cognito_sub),
+                "UpdateExpression": "SET #pass = :pass ADD queued :minus",
+                "ExpressionAttributeNames": {"#pass": "pass"},
+                "ExpressionAttributeValues": {":pass": {"N": str(new_pass)}, ":minus": {"N": "-1"}},
+            }
+        },
+    ]
+    return _claim(items, counter_offset=1)
+
+
+def dispatch(run_action, max_dispatches=50, on_failure=None):
+    """
+    Admit queued tasks in weighted fair order until the global cap is reached or
+    nothing eligible is left. run_action(queued_item, action) starts the task.
+    If it raises, the slot is released again and on_failure(queued_item, action,
+    error) is called: the queue item is already gone, so the caller must settle
+    the task (mark it failed, fail a waiting task token). Returns the number
+    dispatched.
+    """
+    table = dynamodb.Table(ADMISSION_TABLE)
+    dispatched = 0
+
+    while dispatched < max_dispatches:
+        progressed = False
+        for user in _queued_users(table):
+            cognito_sub = user["sk"]
+            queued = _oldest_queued(table, cognito_sub)
+            if queued is None:
+                _drop_idle_user(table, cognito_sub)
+                continue
+
+            outcome = _claim_queued(user, queued)
+            if outcome == GLOBAL_FULL:
+                return dispatched
+            if outcome != ADMITTED:
+                # This user is at their cap (or lost a race, or kept conflicting
+                # with another claim); try the next one
+                continue
+
+            if int(user.get("queued", 1)) <= 1:
+                _drop_idle_user(table, cognito_sub)
+
+            action = json.loads(queued["action_json"])
+            try:
+                run_action(queued, action)
+                dispatched += 1
+            except Exception as e:
+                print(f"[Admission] Dispatch of task {queued['task_id']} failed: {e}")
+                release(cognito_sub, queued["task_id"])
+                if on_failure:
+                    try:
+                        on_failure(queued, action, e)
+                    except Exception as failure_error:
+                        print(f"[Admission] Could not settle task {queued['task_id']}: {failure_error}")
+
+            # Passes changed; re-rank before the next pick
+            progressed = True
+            break
+
+        if not progressed:
+            break
+
+    if dispatched:
+        print(f"[Admission] Dispatched {dispatched} queued task(s)")
+    return dispatched
@@ -0,0 +1,143 @@
+"""
+XYLA INSIGHTS — Auth Middleware
+Shared Authorization handling for the API Lambdas.
+
+The Authorization header carries the caller's cognito_sub, optionally prefixed
+with "Bearer ". authenticate() normalizes it and confirms the user exists in
+users-table. Lookups are cached per container in a bounded LRU with a TTL, keyed
+on (cognito_sub, projected attributes), so warm invocations skip the
+users-table round trip entirely.
+
+The cache is per container: a handler that writes to a user must call
+invalidate_user(), and a handler that must read its own writes across
+containers passes fresh=True.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+import boto3
+from botocore.exceptions import ClientError
+
+USERS_TABLE = os.environ.get("USERS_TABLE", "users-table")
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "512"))
+
+dynamodb = boto3.resource("dynamodb")
+
+
+# ============================================================
+# User Cache
+# ============================================================
+class UserCache:
+    def __init__(self, ttl_seconds=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, cognito_sub):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == cognito_sub]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = UserCache()
+
+
+# ============================================================
+# Header Parsing
+# ============================================================
+def get_cognito_sub(event):
+    """cognito_sub from the Authorization header, or None when missing/empty"""
+    headers = event.get("headers") or {}
+    auth_header = None
+    for name, value in headers.items():
+        if name.lower() == "authorization":
+            auth_header = value
+            break
+    if not auth_header:
+        return None
+
+    auth_header = auth_header.strip()
+    if auth_header.lower().startswith("bearer "):
+        auth_header = auth_header.split(" ", 1)[1].strip()
+    return auth_header or None
+
+
+# ============================================================
+# User Lookup
+# ============================================================
+def get_user(cognito_sub, attributes=None, fresh=False):
+    """
+    users-table item for cognito_sub (only the given attributes plus the key),
+    or None if the user does not exist. Raises ClientError on DynamoDB errors.
+    """
+    projection = tuple(sorted(set(attributes))) if attributes else None
+    cache_key = (cognito_sub, projection)
+
+    if not fresh:
+        user = _cache.get(cache_key)
+        if user is not None:
+            return user
+
+    kwargs = {"Key": {"cognito_sub": cognito_sub}}
+    if projection:
+        names = {f"#a{i}": attr for i, attr in enumerate(("cognito_sub",) + projection)}
+        kwargs["ProjectionExpression"] = ", ".join(names)
+        kwargs["ExpressionAttributeNames"] = names
+    if fresh:
+        kwargs["ConsistentRead"] = True
+
+    user = dynamodb.Table(USERS_TABLE).get_item(**kwargs).get("Item")
+    # Unknown users are not cached so a just-created account works immediately
+    if user is not None:
+        _cache.put(cache_key, user)
+    return user
+
+
+def invalidate_user(cognito_sub):
+    _cache.invalidate(cognito_sub)
+
+
+def authenticate(event, attributes=None, fresh=False):
+    """
+    Returns (cognito_sub, user, error). On failure error is a
+    (status_code, body) pair the handler passes to its own response helper.
+    """
+    cognito_sub = get_cognito_sub(event)
+    if not cognito_sub:
+        return None, None, (401, {"message": "Unauthorized: Missing Authorization header"})
+
+    try:
+        user = get_user(cognito_sub, attributes, fresh=fresh)
+    except ClientError as e:
+        print(f"[Auth] User lookup failed: {e}")
+        return cognito_sub, None, (500, {"message": "Failed to fetch user", "error": str(e)})
+
+    if not user:
+        return cognito_sub, None, (404, {"message": "User not found"})
+    return cognito_sub, user, None
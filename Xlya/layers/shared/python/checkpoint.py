@@ -0,0 +1,137 @@
+"""
+XYLA INSIGHTS — Stage Checkpoints
+Persists each pipeline stage's output to S3 so a failed task can be resumed
+without repeating the crawl or the LLM calls that already succeeded.
+
+  s3://<CHECKPOINT_BUCKET>/checkpoints/<task_id>/<stage>/<input_hash>.json
+
+The key includes a hash of the stage's inputs, so a checkpoint is only reused
+when the stage would be run on exactly the same data. Only complete outputs
+are stored: a stage that raises, or returns a result marked "degraded", is
+re-run on resume.
+"""
+import os
+import json
+import hashlib
+import functools
+import boto3
+from botocore.exceptions import ClientError
+
+from metrics import record_cache
+
+CHECKPOINT_BUCKET = os.environ.get("CHECKPOINT_BUCKET") or os.environ.get("S3_BUCKET", "")
+CHECKPOINT_PREFIX = "checkpoints"
+
+# Pipeline stages in execution order; "crawl" stores the full pipeline input
+PIPELINE_STAGES = ("crawl", "seo", "aeo", "geo", "competitor")
+
+# Values that change on every run without changing what a stage computes
+VOLATILE_KEYS = {"crawl_timestamp"}
+
+s3_client = boto3.client("s3")
+
+
+# ============================================================
+# Input Hashing
+# ============================================================
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def input_hash(inputs):
+    canonical = json.dumps(_strip_volatile(inputs), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def crawl_inputs(task):
+    """What the crawl depends on; task is the start file, batch item or task record"""
+    return {field: str(task.get(field) or "").strip() for field in ("url", "brand_name", "keywords", "industry")}
+
+
+def stage_inputs(event):
+    """What an analyzer stage depends on: the crawl and the brand metadata"""
+    metadata = event.get("metadata") or {}
+    return {
+        "crawl_data": event.get("crawl_data") or {},
+        "metadata": {field: metadata.get(field) for field in ("brand_name", "keywords", "industry")},
+    }
+
+
+def checkpoint_key(task_id, stage, inputs):
+    return f"{CHECKPOINT_PREFIX}/{task_id}/{stage}/{input_hash(inputs)[:32]}.json"
+
+
+# ============================================================
+# Load / Save
+# ============================================================
+def load(task_id, stage, inputs):
+    """Stored output for (task, stage, inputs), or None"""
+    if not CHECKPOINT_BUCKET or not task_id:
+        return None
+    try:
+        response = s3_client.get_object(Bucket=CHECKPOINT_BUCKET, Key=checkpoint_key(task_id, stage, inputs))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            print(f"[Checkpoint] Could not read {stage} checkpoint for {task_id}: {e}")
+        return None
+    return json.loads(response["Body"].read())
+
+
+def exists(task_id, stage, inputs):
+    if not CHECKPOINT_BUCKET or not task_id:
+        return False
+    try:
+        s3_client.head_object(Bucket=CHECKPOINT_BUCKET, Key=checkpoint_key(task_id, stage, inputs))
+        return True
+    except ClientError:
+        return False
+
+
+def save(task_id, stage, inputs, output):
+    """Best effort: a failed write only costs a re-run later"""
+    if not CHECKPOINT_BUCKET or not task_id:
+        return
+    key = checkpoint_key(task_id, stage, inputs)
+    try:
+        s3_client.put_object(
+            Bucket=CHECKPOINT_BUCKET,
+            Key=key,
+            Body=json.dumps(output, default=str),
+            ContentType="application/json",
+        )
+        print(f"[Checkpoint] Saved {stage} for {task_id} to s3://{CHECKPOINT_BUCKET}/{key}")
+    except ClientError as e:
+        print(f"[Checkpoint] Could not save {stage} checkpoint for {task_id}: {e}")
+
+
+# ============================================================
+# Handler Decorator
+# ============================================================
+def checkpointed(stage, inputs_from=stage_inputs):
+    """
+    Wrap a stage Lambda handler: return the stored output when the stage has
+    already completed on the same inputs, otherwise run it and store the result.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            task_id = event.get("task_id")
+            inputs = inputs_from(event)
+
+            cached = load(task_id, stage, inputs)
+            if task_id and CHECKPOINT_BUCKET:
+                record_cache("checkpoint", hit=cached is not None)
+            if cached is not None:
+                print(f"[Checkpoint] Reusing {stage} output for task {task_id}")
+                return cached
+
+            output = handler(event, context)
+            if isinstance(output, dict) and not output.get("degraded"):
+                save(task_id, stage, inputs, output)
+            return output
+        return wrapper
+    return decorator
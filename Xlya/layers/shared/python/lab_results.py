@@ -0,0 +1,394 @@
+"""
+XYLA INSIGHTS — Lab Result Extraction
+Deterministic parser for analyte rows in laboratory reports. Rows come from
+pdfplumber's ruled tables and from column-aligned text lines, are normalised
+against a synonym dictionary, and render as a compact table for the diagnosis
+prompt:
+
+    Analyte | Result | Unit | Reference | Flag
+    Hemoglobin | 11.2 | g/dL | 13.0 - 17.0 | L
+
+Parsing works on plain cell lists; only page_lab_rows needs a pdfplumber page
+(PDF layer). report_date reads when the sample was taken from the report text.
+"""
+import re
+import statistics
+from datetime import datetime, timezone
+
+from reference_ranges import load_index, normalize_unit
+
+# canonical key -> (display name, synonyms as printed on reports)
+ANALYTE_SYNONYMS = {
+    "hemoglobin": ("Hemoglobin", ["hemoglobin", "haemoglobin", "hb", "hgb"]),
+    "hematocrit": ("Hematocrit", ["hematocrit", "haematocrit", "hct", "pcv", "packed cell volume"]),
+    "rbc": ("RBC Count", ["rbc", "rbc count", "red blood cell count", "red blood cells", "total rbc count", "erythrocyte count"]),
+    "wbc": ("WBC Count", ["wbc", "wbc count", "white blood cell count", "total leucocyte count", "total leukocyte count", "tlc", "total wbc count"]),
+    "platelets": ("Platelet Count", ["platelet count", "platelets", "plt", "platelet"]),
+    "mcv": ("MCV", ["mcv", "mean corpuscular volume"]),
+    "mch": ("MCH", ["mch", "mean corpuscular hemoglobin"]),
+    "mchc": ("MCHC", ["mchc", "mean corpuscular hemoglobin concentration"]),
+    "rdw": ("RDW", ["rdw", "rdw cv", "red cell distribution width"]),
+    "neutrophils": ("Neutrophils", ["neutrophils", "neutrophil", "polymorphs"]),
+    "lymphocytes": ("Lymphocytes", ["lymphocytes", "lymphocyte"]),
+    "eosinophils": ("Eosinophils", ["eosinophils", "eosinophil"]),
+    "esr": ("ESR", ["esr", "erythrocyte sedimentation rate"]),
+    "glucose": ("Glucose", ["glucose", "blood glucose", "plasma glucose", "blood sugar", "glucose level"]),
+    "glucose_fasting": ("Fasting Glucose", ["fasting glucose", "glucose fasting", "fasting blood sugar", "fbs", "fasting plasma glucose", "fpg", "blood sugar fasting"]),
+    "glucose_pp": ("Post-prandial Glucose", ["post prandial glucose", "glucose pp", "ppbs", "postprandial blood sugar", "blood sugar pp"]),
+    "glucose_random": ("Random Glucose", ["random glucose", "random blood sugar", "rbs", "glucose random"]),
+    "hba1c": ("HbA1c", ["hba1c", "glycated hemoglobin", "glycosylated hemoglobin", "a1c", "hemoglobin a1c"]),
+    "creatinine": ("Creatinine", ["creatinine", "serum creatinine", "s creatinine"]),
+    "urea": ("Urea", ["urea", "blood urea", "serum urea"]),
+    "bun": ("Blood Urea Nitrogen", ["bun", "blood urea nitrogen", "urea nitrogen"]),
+    "egfr": ("eGFR", ["egfr", "estimated gfr", "estimated glomerular filtration rate"]),
+    "uric_acid": ("Uric Acid", ["uric acid", "serum uric acid"]),
+    "sodium": ("Sodium", ["sodium", "na", "serum sodium"]),
+    "potassium": ("Potassium", ["potassium", "k", "serum potassium"]),
+    "chloride": ("Chloride", ["chloride", "cl", "serum chloride"]),
+    "calcium": ("Calcium", ["calcium", "serum calcium", "total calcium", "ca"]),
+    "magnesium": ("Magnesium", ["magnesium", "serum magnesium", "mg"]),
+    "alt": ("ALT", ["alt", "sgpt", "alanine aminotransferase", "alanine transaminase"]),
+    "ast": ("AST", ["ast", "sgot", "aspartate aminotransferase", "aspartate transaminase"]),
+    "alp": ("Alkaline Phosphatase", ["alp", "alkaline phosphatase"]),
+    "ggt": ("GGT", ["ggt", "gamma gt", "gamma glutamyl transferase"]),
+    "bilirubin_total": ("Total Bilirubin", ["total bilirubin", "bilirubin total", "bilirubin", "t bilirubin"]),
+    "bilirubin_direct": ("Direct Bilirubin", ["direct bilirubin", "bilirubin direct", "conjugated bilirubin"]),
+    "albumin": ("Albumin", ["albumin", "serum albumin"]),
+    "total_protein": ("Total Protein", ["total protein", "serum protein", "protein total"]),
+    "tsh": ("TSH", ["tsh", "thyroid stimulating hormone", "thyrotropin"]),
+    "t3": ("T3", ["t3", "total t3", "triiodothyronine"]),
+    "t4": ("T4", ["t4", "total t4", "thyroxine"]),
+    "free_t3": ("Free T3", ["free t3", "ft3"]),
+    "free_t4": ("Free T4", ["free t4", "ft4"]),
+    "cholesterol_total": ("Total Cholesterol", ["total cholesterol", "cholesterol total", "cholesterol", "serum cholesterol"]),
+    "ldl": ("LDL Cholesterol", ["ldl", "ldl cholesterol", "ldl c", "low density lipoprotein"]),
+    "hdl": ("HDL Cholesterol", ["hdl", "hdl cholesterol", "hdl c", "high density lipoprotein"]),
+    "vldl": ("VLDL Cholesterol", ["vldl", "vldl cholesterol"]),
+    "triglycerides": ("Triglycerides", ["triglycerides", "triglyceride", "tg"]),
+    "vitamin_d": ("Vitamin D (25-OH)", ["vitamin d", "25 oh vitamin d", "vitamin d 25 oh", "25 hydroxy vitamin d", "vitamin d total"]),
+    "vitamin_b12": ("Vitamin B12", ["vitamin b12", "b12", "cobalamin", "cyanocobalamin"]),
+    "folate": ("Folate", ["folate", "folic acid", "serum folate"]),
+    "ferritin": ("Ferritin", ["ferritin", "serum ferritin"]),
+    "iron": ("Iron", ["iron", "serum iron"]),
+    "tibc": ("TIBC", ["tibc", "total iron binding capacity"]),
+    "crp": ("CRP", ["crp", "c reactive protein", "hs crp", "hscrp"]),
+    "inr": ("INR", ["inr", "pt inr"]),
+    "prothrombin_time": ("Prothrombin Time", ["prothrombin time", "pt"]),
+}
+
+# Printed qualifiers that do not change which analyte it is
+NAME_QUALIFIERS = ("serum", "plasma", "blood", "whole blood", "s", "total", "level")
+
+FLAGS = {
+    "h": "high", "high": "high", "↑": "high",
+    "l": "low", "low": "low", "↓": "low",
+    "hh": "critical", "ll": "critical", "critical": "critical",
+    "*": "abnormal", "abnormal": "abnormal",
+}
+FLAG_MARKS = {
+    "high": "H", "low": "L", "critical_high": "HH", "critical_low": "LL", "critical": "C", "abnormal": "*",
+}
+
+_NUMBER = r"-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?"
+VALUE_RE = re.compile(rf"^(?P<qualifier>[<>]=?|[≤≥])?\s*(?P<number>{_NUMBER})\s*(?P<flag>HH|LL|H|L|\*|↑|↓)?$", re.I)
+RANGE_RE = re.compile(rf"^(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})\s*(?P<rest>.*)$", re.I)
+BOUND_RE = re.compile(rf"^(?P<op><=|>=|<|>|≤|≥|up\s*to|upto)\s*(?P<bound>{_NUMBER})\s*(?P<rest>.*)$", re.I)
+
+MAX_NAME_CHARS = 60
+
+# Units a result cell may carry besides those in the reference-range knowledge base
+EXTRA_UNITS = (
+    "mg", "g", "ratio", "index", "mm", "cells/uL", "lakhs/uL", "mIU/mL", "IU/mL", "U/mL",
+    "ng/L", "mg/g", "mg/mmol", "mOsm/kg", "mmHg", "copies/mL", "titre", "titer",
+)
+
+
+def _clean(name):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", name.lower())).strip()
+
+
+_LOOKUP = {_clean(synonym): key for key, (_, synonyms) in ANALYTE_SYNONYMS.items() for synonym in synonyms}
+
+
+def _number(text):
+    return float(text.replace(",", ""))
+
+
+_units = None
+
+
+def lab_units():
+    """Normalised units (reference_ranges.normalize_unit) accepted as a result's unit"""
+    global _units
+    if _units is None:
+        units = set(EXTRA_UNITS)
+        for canonical, conversions, _, _ in load_index().values():
+            units.add(canonical)
+            units.update(conversions)
+        _units = {normalize_unit(unit) for unit in units} - {""}
+    return _units
+
+
+def _looks_like_unit(cell):
+    return bool(re.search(r"[A-Za-z%µ/]", cell)) and len(cell) <= 20
+
+
+# ============================================================
+# Name Normalisation
+# ============================================================
+def normalize_analyte(name):
+    """Canonical analyte key for a printed test name, or None"""
+    cleaned = _clean(name)
+    if cleaned in _LOOKUP:
+        return _LOOKUP[cleaned]
+
+    # "ALT (SGPT)", "Glucose - Fasting", "Hb / Hemoglobin"
+    for part in re.split(r"[()\[\]/,;:]", name):
+        part = _clean(part)
+        if part in _LOOKUP:
+            return _LOOKUP[part]
+
+    words = cleaned.split()
+    while words and words[0] in NAME_QUALIFIERS:
+        words = words[1:]
+    while words and words[-1] in NAME_QUALIFIERS:
+        words = words[:-1]
+    return _LOOKUP.get(" ".join(words))
+
+
+def analyte_key(name):
+    """normalize_analyte, falling back to the cleaned name for analytes outside the dictionary"""
+    return normalize_analyte(name) or _clean(name).replace(" ", "_")
+
+
+# ============================================================
+# Row Parsing
+# ============================================================
+def _parse_reference(cell):
+    """(reference text, low, high, trailing text) if the cell starts with a range or bound"""
+    match = RANGE_RE.match(cell)
+    if match:
+        reference = f"{match.group('low')} - {match.group('high')}"
+        return reference, _number(match.group("low")), _number(match.group("high")), match.group("rest").strip()
+    match = BOUND_RE.match(cell)
+    if match:
+        op = match.group("op").lower().replace(" ", "")
+        bound = _number(match.group("bound"))
+        if op in ("<", "<=", "≤", "upto"):
+            return f"< {match.group('bound')}", None, bound, match.group("rest").strip()
+        return f"> {match.group('bound')}", bound, None, match.group("rest").strip()
+    return None
+
+
+def parse_cells(cells):
+    """An analyte row from one table row or text line split into cells, or None"""
+    cells = [str(cell).strip() for cell in cells if cell is not None and str(cell).strip()]
+    if len(cells) < 2:
+        return None
+
+    value_index = next((i for i in range(1, len(cells)) if VALUE_RE.match(cells[i])), None)
+    if value_index is None:
+        return None
+
+    raw_name = " ".join(cells[:value_index])
+    # An exact synonym is trusted as printed, however short ("K", "Na")
+    analyte = _LOOKUP.get(_clean(raw_name))
+    if analyte is None:
+        if len(raw_name) > MAX_NAME_CHARS or not re.search(r"[A-Za-z]{2}", raw_name) or raw_name[0].isdigit():
+            return None
+        analyte = normalize_analyte(raw_name)
+
+    value_match = VALUE_RE.match(cells[value_index])
+    flag = FLAGS.get((value_match.group("flag") or "").lower(), "")
+    unit = ""
+    # A unit-like cell outside lab_units(); kept only for a known analyte, whose
+    # unit the knowledge base validates again on conversion
+    other_unit = ""
+    reference, ref_low, ref_high = "", None, None
+
+    for cell in cells[value_index + 1:]:
+        if not flag and cell.lower() in FLAGS:
+            flag = FLAGS[cell.lower()]
+            continue
+        parsed = _parse_reference(cell) if not reference else None
+        if parsed:
+            reference, ref_low, ref_high, rest = parsed
+            cell = rest
+            if not cell:
+                continue
+        if unit or not _looks_like_unit(cell):
+            continue
+        if normalize_unit(cell) in lab_units():
+            unit = cell
+        elif not other_unit:
+            other_unit = cell
+
+    if analyte is None:
+        # An unknown name is only trusted on a result row: a printed range or
+        # flag, and no unit other than a lab unit ("Page | 2 | of 5", "Age | 45 | years")
+        if not (reference or flag) or other_unit and not unit:
+            return None
+    elif not unit:
+        unit = other_unit
+
+    return {
+        "analyte": analyte or _clean(raw_name).replace(" ", "_"),
+        "name": ANALYTE_SYNONYMS[analyte][0] if analyte else raw_name,
+        "raw_name": raw_name,
+        "value": _number(value_match.group("number")),
+        "value_text": f"{value_match.group('qualifier') or ''}{value_match.group('number')}",
+        "unit": unit,
+        "reference": reference,
+        "ref_low": ref_low,
+        "ref_high": ref_high,
+        "flag": flag,
+        "known": analyte is not None,
+    }
+
+
+# ============================================================
+# pdfplumber Pages
+# ============================================================
+def _inside(word, bboxes):
+    x = (word["x0"] + word["x1"]) / 2
+    y = (word["top"] + word["bottom"]) / 2
+    return any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+
+
+def _line_cells(words):
+    """Group words into lines by position, then split each line into cells at column gaps"""
+    lines = []
+    for word in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+        if lines and abs(word["top"] - lines[-1][0]["top"]) <= 2:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+
+    for line in lines:
+        line.sort(key=lambda w: w["x0"])
+        char_width = statistics.median((w["x1"] - w["x0"]) / max(len(w["text"]), 1) for w in line)
+        cells = [[line[0]["text"]]]
+        for previous, word in zip(line, line[1:]):
+            if word["x0"] - previous["x1"] > 1.5 * char_width:
+                cells.append([word["text"]])
+            else:
+                cells[-1].append(word["text"])
+        yield [" ".join(cell) for cell in cells]
+
+
+def page_lab_rows(page):
+    """Analyte rows on a pdfplumber page: ruled tables first, then column-aligned text"""
+    rows = []
+    bboxes = []
+    for table in page.find_tables():
+        bboxes.append(table.bbox)
+        for cells in table.extract():
+            row = parse_cells(cells or [])
+            if row:
+                rows.append(row)
+
+    words = [word for word in page.extract_words() if not _inside(word, bboxes)]
+    for cells in _line_cells(words):
+        row = parse_cells(cells)
+        if row:
+            rows.append(row)
+
+    for row in rows:
+        row["page"] = page.page_number
+    return rows
+
+
+# ============================================================
+# Report Dates
+# ============================================================
+# Most specific first: a collection date beats the date the report was issued
+DATE_LABELS = (
+    r"(?:sample|specimen)?\s*collect(?:ed|ion)(?:\s*(?:date|on|at))?|date\s*of\s*collection",
+    r"(?:sample|specimen)\s*(?:date|drawn|received)|drawn(?:\s*on)?|received(?:\s*on)?",
+    r"report(?:ed)?(?:\s*(?:date|on))?|date\s*of\s*report",
+)
+_MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_MONTH = r"[A-Za-z]{3,9}\.?"
+DATE_FORMS = (
+    # 2024-03-05, 2024/03/05
+    (re.compile(r"(?P<y>\d{4})[-/.](?P<m>\d{1,2})[-/.](?P<d>\d{1,2})\b"), "ymd"),
+    # 05-Mar-2024, 5 March 2024
+    (re.compile(rf"(?P<d>\d{{1,2}})[-\s/]*(?P<mon>{_MONTH})[-\s/,]*(?P<y>\d{{4}})\b"), "dmony"),
+    # March 5, 2024
+    (re.compile(rf"(?P<mon>{_MONTH})\s*(?P<d>\d{{1,2}}),?\s*(?P<y>\d{{4}})\b"), "mondy"),
+    # 05/03/2024: read only when one side cannot be a month
+    (re.compile(r"(?P<a>\d{1,2})[-/.](?P<b>\d{1,2})[-/.](?P<y>\d{4})\b"), "numeric"),
+)
+EARLIEST_REPORT_DATE = int(datetime(1990, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def _parse_date(text):
+    for pattern, form in DATE_FORMS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        year = int(match["y"])
+        if form == "ymd":
+            month, day = int(match["m"]), int(match["d"])
+        elif form == "numeric":
+            a, b = int(match["a"]), int(match["b"])
+            if a != b and a <= 12 and b <= 12:
+                return None  # day/month order is ambiguous
+            day, month = (a, b) if a > 12 or a == b else (b, a)
+        else:
+            month = _MONTHS.get(match["mon"].rstrip(".")[:3].lower())
+            day = int(match["d"])
+        try:
+            return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp()) if month else None
+        except ValueError:
+            return None
+    return None
+
+
+def report_date(text, not_after=None):
+    """
+    Epoch seconds (UTC midnight) of the sample's collection date, else the
+    report date, as printed in the report text; None when neither reads
+    unambiguously or the date is implausible (before 1990 or after not_after).
+    """
+    for label in DATE_LABELS:
+        for match in re.finditer(rf"\b(?:{label})(?:\s*/\s*time)?\s*[:\-]?\s*", text, re.I):
+            when = _parse_date(text[match.end():match.end() + 40])
+            if when is None or when < EARLIEST_REPORT_DATE:
+                continue
+            if not_after is not None and when > not_after:
+                continue
+            return when
+    return None
+
+
+# ============================================================
+# Prompt Table
+# ============================================================
+def dedupe_rows(rows):
+    """Drop repeats of the same result (e.g. a panel reprinted in a summary); keep serial values"""
+    seen = set()
+    unique = []
+    for row in rows:
+        key = (row["analyte"], row["value"], row["unit"].lower())
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    return unique
+
+
+def format_lab_table(rows, max_rows=None):
+    """Compact pipe-separated table; rows past max_rows are counted, not dropped silently"""
+    shown = rows if max_rows is None else rows[:max_rows]
+    lines = ["Analyte | Result | Unit | Reference | Flag"]
+    for row in shown:
+        # Flagged rows (reference_ranges) carry the value converted to the reference's unit
+        result = f"{row['value_text']} (= {row['converted']})" if row.get("converted") else row["value_text"]
+        lines.append(
+            f"{row['name']} | {result} | {row['unit']} | {row['reference']} | "
+            f"{FLAG_MARKS.get(row['flag'], '')}"
+        )
+    if len(shown) < len(rows):
+        lines.append(f"({len(rows) - len(shown)} further rows omitted)")
+    return "\n".join(lines)
@@ -0,0 +1,271 @@
+"""
+XYLA INSIGHTS — Lab Value Time Series
+Per-user history of every extracted lab value (see lab_results), so trends
+across reports are read from one table instead of re-parsing old PDFs.
+
+  medimind-lab-series-table
+    cognito_sub  (HASH)    the user
+    point_key    (RANGE)   <observed_at>#<analyte>#<report_id>#<n>
+                           content#<sha256>   first report_id with those PDF bytes
+
+The sort key leads with the observation time (epoch seconds, fixed width), so
+a year of history for any set of analytes is a single Query on a key range
+(content# markers sort after every timestamp and never fall inside one).
+Only analytes the knowledge base knows are stored, in its canonical unit
+(reference_ranges), so results from different labs line up. A re-upload of
+the same bytes by the same user records nothing, so it adds no points to the
+history it is compared against.
+
+    record_points(cognito_sub, report_id, observed_at, lab_rows)
+    points = load_points(cognito_sub, since, until, analytes={"hba1c"})
+    series = build_series(points, max_points=24)
+"""
+import os
+import time
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+from lab_results import ANALYTE_SYNONYMS
+from reference_ranges import to_canonical, normalize_unit
+
+LAB_SERIES_TABLE = os.environ.get("LAB_SERIES_TABLE", "")
+
+# Upper bound on Query pages read for one history request
+MAX_QUERY_PAGES = 10
+DAY_SECONDS = 86400
+CONTENT_MARKER = "content#"
+
+dynamodb = boto3.resource("dynamodb")
+
+
+def enabled():
+    return bool(LAB_SERIES_TABLE)
+
+
+def _timestamp(value):
+    return f"{int(value):010d}"
+
+
+def display_name(analyte):
+    return ANALYTE_SYNONYMS[analyte][0] if analyte in ANALYTE_SYNONYMS else analyte.replace("_", " ").title()
+
+
+# ============================================================
+# Writing
+# ============================================================
+def point_items(cognito_sub, report_id, observed_at, lab_rows):
+    """One item per known lab row; serial values of an analyte in a report are numbered"""
+    items = []
+    ordinals = {}
+    for row in lab_rows:
+        if not row.get("known"):
+            continue
+        analyte = row["analyte"]
+        ordinals[analyte] = ordinals.get(analyte, 0) + 1
+        converted = to_canonical(analyte, row["value"], row["unit"])
+        value, unit = converted if converted else (row["value"], row["unit"])
+        items.append({
+            "cognito_sub": cognito_sub,
+            "point_key": f"{_timestamp(observed_at)}#{analyte}#{report_id}#{ordinals[analyte]}",
+            "analyte": analyte,
+            "value": Decimal(str(round(value, 4))),
+            "unit": unit,
+            "flag": row.get("flag", ""),
+            "report_id": report_id,
+        })
+    return items
+
+
+def claim_content(cognito_sub, report_id, content_sha256):
+    """False when another of the user's reports already recorded these PDF bytes"""
+    try:
+        dynamodb.Table(LAB_SERIES_TABLE).put_item(
+            Item={
+                "cognito_sub": cognito_sub,
+                "point_key": f"{CONTENT_MARKER}{content_sha256}",
+                "report_id": report_id,
+            },
+            ConditionExpression="attribute_not_exists(point_key) OR report_id = :r",
+            ExpressionAttributeValues={":r": report_id},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def record_points(cognito_sub, report_id, observed_at, lab_rows, content_sha256=None):
+    """Store a report's values; re-diagnosing a report overwrites its points"""
+    if not enabled():
+        return 0
+    items = point_items(cognito_sub, report_id, observed_at, lab_rows)
+    if not items:
+        return 0
+    if content_sha256 and not claim_content(cognito_sub, report_id, content_sha256):
+        print(f"[LabSeries] Report {report_id} repeats an earlier upload; no points recorded")
+        return 0
+    with dynamodb.Table(LAB_SERIES_TABLE).batch_writer(overwrite_by_pkeys=["cognito_sub", "point_key"]) as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+
+# ============================================================
+# Reading
+# ============================================================
+def load_points(cognito_sub, since, until=None, analytes=None):
+    """Points observed in [since, until] (epoch seconds), oldest first, in one paginated Query"""
+    if not enabled():
+        return []
+    until = int(until if until is not None else time.time())
+    kwargs = {
+        "KeyConditionExpression": Key("cognito_sub").eq(cognito_sub)
+        & Key("point_key").between(f"{_timestamp(since)}#", f"{_timestamp(until)}#~"),
+        "ProjectionExpression": "point_key, analyte, #v, unit, flag, report_id",
+        "ExpressionAttributeNames": {"#v": "value"},
+    }
+    if analytes:
+        kwargs["FilterExpression"] = Attr("analyte").is_in(sorted(analytes))
+
+    table = dynamodb.Table(LAB_SERIES_TABLE)
+    points = []
+    for _ in range(MAX_QUERY_PAGES):
+        response = table.query(**kwargs)
+        for item in response.get("Items", []):
+            points.append({
+                "analyte": item["analyte"],
+                "observed_at": int(item["point_key"].split("#", 1)[0]),
+                "value": float(item["value"]),
+                "unit": item.get("unit", ""),
+                "flag": item.get("flag", ""),
+                "report_id": item.get("report_id", ""),
+            })
+        if not response.get("LastEvaluatedKey"):
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return points
+
+
+# ============================================================
+# Series and Trends
+# ============================================================
+def downsample(points, max_points):
+    """
+    At most max_points points: the span is cut into equal time buckets and each
+    non-empty bucket becomes its mean value at its latest time. The first and
+    last results are kept as they are, so deltas stay exact.
+    """
+    if len(points) <= max_points or max_points < 3:
+        return points
+    first, last = points[0], points[-1]
+    inner = points[1:-1]
+    buckets = max_points - 2
+    start, span = inner[0]["observed_at"], max(1, inner[-1]["observed_at"] - inner[0]["observed_at"])
+    grouped = {}
+    for point in inner:
+        index = min(buckets - 1, (point["observed_at"] - start) * buckets // span)
+        grouped.setdefault(index, []).append(point)
+    sampled = [
+        {
+            "observed_at": group[-1]["observed_at"],
+            "value": round(sum(p["value"] for p in group) / len(group), 4),
+            "count": len(group),
+        }
+        for _, group in sorted(grouped.items())
+    ]
+    return [first] + sampled + [last]
+
+
+def trend(points):
+    first, last = points[0], points[-1]
+    values = [point["value"] for point in points]
+    change = last["value"] - first["value"]
+    summary = {
+        "count": len(points),
+        "first": first["value"],
+        "first_at": first["observed_at"],
+        "latest": last["value"],
+        "latest_at": last["observed_at"],
+        "min": min(values),
+        "max": max(values),
+        "change": round(change, 4),
+        "change_pct": round(change / first["value"] * 100, 1) if first["value"] else None,
+        "days": (last["observed_at"] - first["observed_at"]) // DAY_SECONDS,
+    }
+    if len(points) > 1:
+        summary["previous"] = points[-2]["value"]
+        summary["recent_change"] = round(last["value"] - points[-2]["value"], 4)
+    return summary
+
+
+def _per_report(points):
+    """One point per report: serial values of an analyte in one report are averaged"""
+    grouped = {}
+    for point in points:
+        grouped.setdefault((point["observed_at"], point["report_id"]), []).append(point)
+    merged = []
+    for group in grouped.values():
+        point = dict(group[-1])
+        if len(group) > 1:
+            point["value"] = round(sum(p["value"] for p in group) / len(group), 4)
+            point["flag"] = next((p["flag"] for p in group if p["flag"]), "")
+        merged.append(point)
+    return merged
+
+
+def build_series(points, max_points=24):
+    """
+    analyte -> {name, unit, points, trend}, one point per report. Points in
+    another unit than the latest (an analyte the knowledge base cannot convert)
+    are left out.
+    """
+    by_analyte = {}
+    for point in sorted(points, key=lambda p: (p["observed_at"], p["report_id"])):
+        by_analyte.setdefault(point["analyte"], []).append(point)
+
+    series = {}
+    for analyte, analyte_points in by_analyte.items():
+        unit = normalize_unit(analyte_points[-1]["unit"])
+        comparable = _per_report([p for p in analyte_points if normalize_unit(p["unit"]) == unit])
+        series[analyte] = {
+            "name": display_name(analyte),
+            "unit": analyte_points[-1]["unit"],
+            "trend": trend(comparable),
+            "points": [
+                {key: p[key] for key in ("observed_at", "value", "count", "flag", "report_id") if key in p}
+                for p in downsample(comparable, max_points)
+            ],
+        }
+    return series
+
+
+def _day(timestamp):
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def _number(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def trend_summary(series, max_lines=30):
+    """Prompt lines for analytes with at least two results, largest relative change first"""
+    lines = []
+    ranked = sorted(
+        (entry for entry in series.values() if entry["trend"]["count"] > 1),
+        key=lambda entry: abs(entry["trend"]["change_pct"] or 0),
+        reverse=True,
+    )
+    for entry in ranked[:max_lines]:
+        t = entry["trend"]
+        history = " -> ".join(f"{_number(p['value'])} ({_day(p['observed_at'])})" for p in entry["points"][-4:])
+        sign = "+" if t["change"] >= 0 else "-"
+        pct = f", {t['change_pct']:+g}%" if t["change_pct"] is not None else ""
+        lines.append(
+            f"{entry['name']} ({entry['unit']}): {history}; {sign}{_number(abs(t['change']))}{pct} "
+            f"over {t['days']} days, "
+            f"{t['count']} results"
+        )
+    return "\n".join(lines)
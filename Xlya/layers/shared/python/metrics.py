@@ -0,0 +1,349 @@
+"""
+XYLA INSIGHTS — Pipeline Metrics
+Structured per-stage instrumentation for the pipeline Lambdas, emitted as
+CloudWatch Embedded Metric Format (EMF) log lines and summarised into the task
+record under stage_metrics.<stage>.
+
+    @instrumented("geo")
+    def lambda_handler(event, context):
+        ...
+        with timed_call("bedrock") as call:
+            response = bedrock_runtime.invoke_model(...)
+            call.record_usage(response)
+
+Per invocation this emits one record for the stage (duration, payload bytes,
+errors), one per external call kind (latency of every call, errors,
+throttles, rate-limiter wait, LLM tokens) and one per cache (hits, misses).
+task_id is a property on every record rather than a dimension, so records
+correlate in Logs Insights without a metric per task.
+
+The active recorder lives in a context variable, so handlers running side by
+side in one process (the local ASL runner) keep separate records. Worker
+threads do not inherit it: wrap the callables handed to a thread pool in
+bind(). Helpers called outside an instrumented handler record nothing.
+"""
+import os
+import json
+import time
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+import boto3
+from botocore.exceptions import ClientError
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Xlya/Pipeline")
+ANALYZER_TABLE = os.environ.get("SEOAEOGEOANALYZERTABLE", "seo-aeo-geo-analyzer-table")
+
+# EMF accepts at most 100 values per metric array
+MAX_EMF_VALUES = 100
+
+dynamodb = boto3.resource("dynamodb")
+
+
+def _payload_bytes(value):
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _CallStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = 0
+        self.throttles = 0
+        self.wait_ms = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+
+class StageRecorder:
+    def __init__(self, stage, task_id=None, cognito_sub=None):
+        self.stage = stage
+        self.task_id = task_id
+        self.cognito_sub = cognito_sub
+        self.started = time.monotonic()
+        self.duration_ms = 0.0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.error = None
+        self.calls = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def _call(self, kind):
+        stats = self.calls.get(kind)
+        if stats is None:
+            stats = self.calls[kind] = _CallStats()
+        return stats
+
+    def record_call(self, kind, latency_ms, error=False, input_tokens=0, output_tokens=0):
+        with self._lock:
+            stats = self._call(kind)
+            stats.latencies_ms.append(round(latency_ms, 1))
+            stats.errors += int(error)
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+
+    def record_throttle(self, kind):
+        with self._lock:
+            self._call(kind).throttles += 1
+
+    def record_wait(self, kind, seconds):
+        with self._lock:
+            self._call(kind).wait_ms += seconds * 1000
+
+    def record_cache(self, cache, hits=0, misses=0):
+        with self._lock:
+            counts = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            counts["hits"] += hits
+            counts["misses"] += misses
+
+    # ---------------------------
+    # Output
+    # ---------------------------
+    def summary(self):
+        """Integers only, so it can be stored in DynamoDB as is"""
+        return {
+            "duration_ms": int(self.duration_ms),
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "error": self.error or "",
+            "calls": {
+                kind: {
+                    "count": len(stats.latencies_ms),
+                    "total_ms": int(sum(stats.latencies_ms)),
+                    "max_ms": int(max(stats.latencies_ms, default=0)),
+                    "errors": stats.errors,
+                    "throttles": stats.throttles,
+                    "wait_ms": int(stats.wait_ms),
+                    "input_tokens": stats.input_tokens,
+                    "output_tokens": stats.output_tokens,
+                }
+                for kind, stats in self.calls.items()
+            },
+            "caches": dict(self.caches),
+        }
+
+    def emf_records(self):
+        timestamp = int(time.time() * 1000)
+        common = {"Stage": self.stage, "task_id": self.task_id or ""}
+
+        def record(dimensions, metrics, values):
+            return {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [dimensions],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit in metrics],
+                    }],
+                },
+                **common,
+                **values,
+            }
+
+        records = [record(
+            ["Stage"],
+            [("StageDuration", "Milliseconds"), ("InputBytes", "Bytes"), ("OutputBytes", "Bytes"), ("StageErrors", "Count")],
+            {
+                "StageDuration": round(self.duration_ms, 1),
+                "InputBytes": self.input_bytes,
+                "OutputBytes": self.output_bytes,
+                "StageErrors": int(bool(self.error)),
+            },
+        )]
+        for kind, stats in self.calls.items():
+            records.append(record(
+                ["Stage", "Call"],
+                [
+                    ("CallLatency", "Milliseconds"), ("CallErrors", "Count"), ("Throttles", "Count"),
+                    ("RateLimitWait", "Milliseconds"), ("InputTokens", "Count"), ("OutputTokens", "Count"),
+                ],
+                {
+                    "Call": kind,
+                    "CallLatency": stats.latencies_ms[:MAX_EMF_VALUES],
+                    "CallErrors": stats.errors,
+                    "Throttles": stats.throttles,
+                    "RateLimitWait": round(stats.wait_ms, 1),
+                    "InputTokens": stats.input_tokens,
+                    "OutputTokens": stats.output_tokens,
+                },
+            ))
+        for cache, counts in self.caches.items():
+            records.append(record(
+                ["Stage", "Cache"],
+                [("CacheHits", "Count"), ("CacheMisses", "Count")],
+                {"Cache": cache, "CacheHits": counts["hits"], "CacheMisses": counts["misses"]},
+            ))
+        return records
+
+
+class _NullRecorder(StageRecorder):
+    """Stands in outside instrumented handlers (e.g. quick-audit, local tools)"""
+
+    def __init__(self):
+        super().__init__("none")
+
+    def record_call(self, *args, **kwargs):
+        pass
+
+    def record_throttle(self, *args, **kwargs):
+        pass
+
+    def record_wait(self, *args, **kwargs):
+        pass
+
+    def record_cache(self, *args, **kwargs):
+        pass
+
+
+_NULL = _NullRecorder()
+_current = contextvars.ContextVar("metrics_recorder", default=None)
+
+
+def current():
+    return _current.get() or _NULL
+
+
+def bind(fn):
+    """Carry the caller's recorder into fn when it runs on another thread"""
+    recorder = _current.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(recorder)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def set_task(task_id, cognito_sub=None):
+    """For handlers that only learn the task after parsing their event (the crawler)"""
+    recorder = current()
+    recorder.task_id = task_id or recorder.task_id
+    recorder.cognito_sub = cognito_sub or recorder.cognito_sub
+
+
+# ============================================================
+# Call and Cache Helpers
+# ============================================================
+class _CallHandle:
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def record_usage(self, response, body=None):
+        """Token counts from Bedrock's response headers, else from the body's usage block"""
+        headers = (response.get("ResponseMetadata") or {}).get("HTTPHeaders") or {}
+        if "x-amzn-bedrock-input-token-count" in headers:
+            self.input_tokens = int(headers["x-amzn-bedrock-input-token-count"])
+            self.output_tokens = int(headers.get("x-amzn-bedrock-output-token-count", 0))
+            return
+        usage = (body or {}).get("usage") or {}
+        self.input_tokens = int(usage.get("input_tokens", usage.get("prompt_tokens", 0)))
+        self.output_tokens = int(usage.get("output_tokens", usage.get("completion_tokens", 0)))
+
+
+@contextmanager
+def timed_call(kind):
+    """Time one external call; an exception counts as a failed (and, if so named, throttled) call"""
+    handle = _CallHandle()
+    started = time.monotonic()
+    error = False
+    try:
+        yield handle
+    except Exception as e:
+        error = True
+        if "Throttling" in type(e).__name__ or "ThrottlingException" in str(e):
+            current().record_throttle(kind)
+        raise
+    finally:
+        current().record_call(
+            kind, (time.monotonic() - started) * 1000, error, handle.input_tokens, handle.output_tokens
+        )
+
+
+def record_cache(cache, hit, count=1):
+    if hit:
+        current().record_cache(cache, hits=count)
+    else:
+        current().record_cache(cache, misses=count)
+
+
+def record_wait(kind, seconds):
+    if seconds > 0:
+        current().record_wait(kind, seconds)
+
+
+# ============================================================
+# Task Record Summary
+# ============================================================
+def write_summary(recorder):
+    if not recorder.task_id or not recorder.cognito_sub:
+        return
+    key = {"task_id": recorder.task_id, "cognito_sub": recorder.cognito_sub}
+    names = {"#sm": "stage_metrics", "#stage": recorder.stage}
+    table = dynamodb.Table(ANALYZER_TABLE)
+    try:
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #sm.#stage = :m",
+                ConditionExpression="attribute_exists(#sm)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={":m": recorder.summary()},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # First stage to report creates the map; parallel stages may race here
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #sm = if_not_exists(#sm, :empty)",
+                ExpressionAttributeNames={"#sm": "stage_metrics"},
+                ExpressionAttributeValues={":empty": {}},
+            )
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET #sm.#stage = :m",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={":m": recorder.summary()},
+            )
+    except ClientError as e:
+        print(f"[Metrics] Could not write {recorder.stage} summary for task {recorder.task_id}: {e}")
+
+
+# ============================================================
+# Handler Decorator
+# ============================================================
+def instrumented(stage):
+    """Record the stage around a Lambda handler, then emit EMF and the task summary"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            recorder = StageRecorder(
+                stage,
+                task_id=event.get("task_id"),
+                cognito_sub=(event.get("metadata") or {}).get("cognito_sub"),
+            )
+            recorder.input_bytes = _payload_bytes(event)
+            token = _current.set(recorder)
+            try:
+                output = handler(event, context)
+                recorder.output_bytes = _payload_bytes(output)
+                return output
+            except Exception as e:
+                recorder.error = type(e).__name__
+                raise
+            finally:
+                _current.reset(token)
+                recorder.duration_ms = (time.monotonic() - recorder.started) * 1000
+                for line in recorder.emf_records():
+                    print(json.dumps(line, default=str))
+                write_summary(recorder)
+        return wrapper
+    return decorator
@@ -0,0 +1,196 @@
+"""
+XYLA INSIGHTS — Page Feature Extraction
+HTML feature extractor shared by the crawler (brand site) and the competitor
+analyzer (competitor sites), so both are scored from the same signals.
+Requires BeautifulSoup (firecrawl-layer).
+"""
+import json
+import urllib.request
+from urllib.parse import urlparse
+
+USER_AGENT = "Mozilla/5.0 (compatible; XylaInsightsBot/1.0)"
+MAX_HTML_BYTES = 2_000_000
+
+
+def crawl_page(url, timeout=15, include_text=False):
+    """
+    Fetch a page over plain HTTP and return crawl_data-shaped features.
+    include_text adds the visible page text as "markdown", the field the
+    LLM analyzers read content from.
+    """
+    from bs4 import BeautifulSoup
+
+    if not urlparse(url).scheme:
+        url = f"https://{url}"
+
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        status_code = response.status
+        charset = response.headers.get_content_charset() or "utf-8"
+        html = response.read(MAX_HTML_BYTES).decode(charset, errors="replace")
+
+    soup = BeautifulSoup(html, "html.parser")
+    description = soup.find("meta", attrs={"name": "description"})
+    text = soup.get_text(" ", strip=True)
+
+    crawl_data = {
+        "url": url,
+        "title": soup.title.get_text(strip=True) if soup.title else "",
+        "description": description.get("content", "") if description else "",
+        "statusCode": status_code,
+        **extract_page_features(soup, url),
+        "word_count": len(text.split()),
+    }
+    if include_text:
+        crawl_data["markdown"] = text[:15000]
+    return crawl_data
+
+
+def extract_page_features(soup, url):
+    """All soup-derived crawl_data fields"""
+    return {
+        "headings": extract_headings(soup),
+        "links": extract_links(soup, url),
+        "images": extract_images(soup),
+        "meta_tags": extract_meta_tags(soup),
+        "structured_data": extract_structured_data(soup),
+        "has_robots_meta": check_robots_meta(soup),
+        "has_canonical": check_canonical(soup),
+        "has_sitemap_link": check_sitemap(soup),
+    }
+
+
+# ============================================================
+# HTML Parsing Helpers
+# ============================================================
+
+def extract_headings(soup):
+    """Extract all headings (h1-h6) from the page"""
+    if not soup:
+        return {"h1": [], "h2": [], "h3": [], "h4": [], "h5": [], "h6": []}
+
+    headings = {}
+    for level in range(1, 7):
+        tag = f"h{level}"
+        headings[tag] = [h.get_text(strip=True) for h in soup.find_all(tag)][:20]
+
+    return headings
+
+
+def extract_links(soup, base_url):
+    """Extract and categorize links from the page"""
+    if not soup:
+        return {"internal": 0, "external": 0, "nofollow": 0, "total": 0}
+
+    from urllib.parse import urlparse
+
+    base_domain = urlparse(base_url).netloc
+    links = soup.find_all("a", href=True)
+
+    internal = external = nofollow = 0
+
+    for link in links:
+        href = link.get("href", "")
+        rel = link.get("rel", [])
+
+        if "nofollow" in rel:
+            nofollow += 1
+
+        parsed = urlparse(href)
+
+        if parsed.netloc == "" or parsed.netloc == base_domain:
+            internal += 1
+        else:
+            external += 1
+
+    return {
+        "internal": internal,
+        "external": external,
+        "nofollow": nofollow,
+        "total": len(links),
+    }
+
+
+def extract_images(soup):
+    """Extract image information including alt text"""
+    if not soup:
+        return {"total": 0, "with_alt": 0, "without_alt": 0, "alt_texts": []}
+
+    images = soup.find_all("img")
+
+    with_alt = sum(1 for img in images if img.get("alt", "").strip())
+    alt_texts = [img.get("alt", "") for img in images if img.get("alt", "").strip()]
+
+    return {
+        "total": len(images),
+        "with_alt": with_alt,
+        "without_alt": len(images) - with_alt,
+        "alt_texts": alt_texts[:20],
+    }
+
+
+def extract_meta_tags(soup):
+    """Extract all meta tags from the page"""
+    if not soup:
+        return []
+
+    metas = []
+    for meta in soup.find_all("meta"):
+        tag_data = {}
+        for attr in ["name", "property", "content", "charset", "http-equiv"]:
+            val = meta.get(attr)
+            if val:
+                tag_data[attr] = val
+        if tag_data:
+            metas.append(tag_data)
+
+    return metas[:30]
+
+
+def extract_structured_data(soup):
+    """Extract structured data (JSON-LD) from the page"""
+    if not soup:
+        return []
+
+    schemas = []
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            if script.string:
+                data = json.loads(script.string)
+                if isinstance(data, dict):
+                    schemas.append({
+                        "type": data.get("@type", "Unknown"),
+                        "found": True
+                    })
+                elif isinstance(data, list):
+                    for item in data:
+                        if isinstance(item, dict):
+                            schemas.append({
+                                "type": item.get("@type", "Unknown"),
+                                "found": True
+                            })
+        except Exception:
+            continue
+
+    return schemas
+
+
+def check_robots_meta(soup):
+    """Check if page has robots meta tag"""
+    if not soup:
+        return False
+    return soup.find("meta", attrs={"name": "robots"}) is not None
+
+
+def check_canonical(soup):
+    """Check if page has canonical link"""
+    if not soup:
+        return False
+    return soup.find("link", attrs={"rel": "canonical"}) is not None
+
+
+def check_sitemap(soup):
+    """Check if page contains sitemap reference"""
+    if not soup:
+        return False
+    return "sitemap" in str(soup).lower()
@@ -0,0 +1,206 @@
+"""
+XYLA INSIGHTS — Invocation Profiling
+Opt-in CPU and allocation profiling for a Lambda handler, switched on per
+invocation without redeploying an instrumented build.
+
+    @profiled("crawl")
+    def lambda_handler(event, context):
+        ...
+
+An invocation is profiled when the event carries "profile": true, or when the
+function's PROFILE_INVOCATIONS environment variable is "true" (every
+invocation) or a fraction such as "0.05" (that share of invocations, to catch
+hot spots on real production inputs). Profiled invocations run under cProfile
+(deterministic) and tracemalloc, so expect them to be noticeably slower.
+cProfile only sees the handler's own thread; work handed to a thread pool
+shows up as time spent waiting on it.
+
+Results go to the profile bucket under the task:
+
+  s3://<PROFILE_BUCKET>/profiles/<task_id>/<stage>/<request_id>.pstats
+  s3://<PROFILE_BUCKET>/profiles/<task_id>/<stage>/<request_id>.json
+
+The .pstats file loads with pstats / snakeviz; the .json summary holds the top
+functions by cumulative time, the allocation peak and the top allocation sites.
+"""
+import os
+import json
+import time
+import random
+import marshal
+import pstats
+import cProfile
+import functools
+import tracemalloc
+import boto3
+from botocore.exceptions import ClientError
+
+PROFILE_INVOCATIONS = os.environ.get("PROFILE_INVOCATIONS", "false")
+PROFILE_BUCKET = (
+    os.environ.get("PROFILE_BUCKET")
+    or os.environ.get("CHECKPOINT_BUCKET")
+    or os.environ.get("S3_BUCKET")
+    or os.environ.get("S3_BUCKET_NAME", "")
+)
+PROFILE_PREFIX = "profiles"
+
+# Rows kept in the JSON summary
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Frames kept per allocation trace; more frames cost more memory while tracing
+TRACEMALLOC_FRAMES = 5
+
+s3_client = boto3.client("s3")
+
+# Task of the invocation being profiled, for handlers that only learn it late
+_active = None
+
+
+def _truthy(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def requested(event):
+    """Whether the event itself asks for a profile"""
+    return isinstance(event, dict) and _truthy(event.get("profile", ""))
+
+
+def _sampled():
+    setting = PROFILE_INVOCATIONS.strip().lower()
+    if _truthy(setting):
+        return True
+    try:
+        rate = float(setting)
+    except ValueError:
+        return False
+    return rate > 0 and random.random() < rate
+
+
+def set_task(task_id):
+    """For handlers that only learn the task after parsing their event (the crawler, diagnose)"""
+    if _active is not None and task_id:
+        _active["task_id"] = task_id
+
+
+# ============================================================
+# Summary and Upload
+# ============================================================
+def _top_functions(profiler):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (calls, primitive, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive,
+            "own_ms": round(own * 1000, 2),
+            "cumulative_ms": round(cumulative * 1000, 2),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def _top_allocations(snapshot):
+    return [
+        {
+            "site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+def _upload(key, body, content_type):
+    s3_client.put_object(Bucket=PROFILE_BUCKET, Key=key, Body=body, ContentType=content_type)
+
+
+def _write_profile(stage, session, profiler, snapshot, peak_bytes, duration_ms, error):
+    task_id = session["task_id"] or "no-task"
+    base = f"{PROFILE_PREFIX}/{task_id}/{stage}/{session['request_id']}"
+
+    summary = {
+        "task_id": session["task_id"],
+        "stage": stage,
+        "request_id": session["request_id"],
+        "trigger": session["trigger"],
+        "profiled_at": str(int(time.time())),
+        "duration_ms": round(duration_ms, 1),
+        "error": error or "",
+        "allocation_peak_kb": round(peak_bytes / 1024, 1),
+        "top_functions": _top_functions(profiler),
+        "top_allocations": _top_allocations(snapshot),
+    }
+
+    if not PROFILE_BUCKET:
+        print(f"[Profiling] No profile bucket configured; summary: {json.dumps(summary)[:2000]}")
+        return
+
+    # Same format as Profile.dump_stats, without a round trip through /tmp
+    profiler.create_stats()
+    try:
+        _upload(f"{base}.pstats", marshal.dumps(profiler.stats), "application/octet-stream")
+        _upload(f"{base}.json", json.dumps(summary, default=str), "application/json")
+        print(f"[Profiling] Wrote {stage} profile to s3://{PROFILE_BUCKET}/{base}.pstats")
+    except ClientError as e:
+        print(f"[Profiling] Could not write {stage} profile for task {task_id}: {e}")
+
+
+# ============================================================
+# Handler Decorator
+# ============================================================
+def profiled(stage):
+    """Profile the wrapped Lambda handler when the invocation asks for it"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _active
+            if requested(event):
+                trigger = "event"
+            elif _sampled():
+                trigger = "environment"
+            else:
+                return handler(event, context)
+
+            session = _active = {
+                "task_id": event.get("task_id") if isinstance(event, dict) else None,
+                "request_id": getattr(context, "aws_request_id", None) or str(int(time.time() * 1000)),
+                "trigger": trigger,
+            }
+            print(f"[Profiling] Profiling {stage} invocation {session['request_id']} ({trigger})")
+
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Another profiler is already active in this process (e.g. a local run)
+                print(f"[Profiling] Could not start profiler, running unprofiled: {e}")
+                _active = None
+                return handler(event, context)
+
+            error = None
+            tracing_memory = not tracemalloc.is_tracing()
+            if tracing_memory:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+            started = time.monotonic()
+            try:
+                return handler(event, context)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                profiler.disable()
+                duration_ms = (time.monotonic() - started) * 1000
+                snapshot = tracemalloc.take_snapshot()
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                if tracing_memory:
+                    tracemalloc.stop()
+                _active = None
+                try:
+                    _write_profile(stage, session, profiler, snapshot, peak_bytes, duration_ms, error)
+                except Exception as e:
+                    # Never let profiling fail the invocation it was measuring
+                    print(f"[Profiling] Could not summarise {stage} profile: {e}")
+        return wrapper
+    return decorator
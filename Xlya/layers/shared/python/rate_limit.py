@@ -0,0 +1,65 @@
+"""
+XYLA INSIGHTS — Rate Limiting
+Thread-safe token buckets shared by every worker thread in a Lambda container.
+Limiters are looked up by name, so all steps that hit the same upstream
+(Bedrock, DuckDuckGo, ...) draw from one bucket however they are fanned out.
+"""
+import os
+import time
+import threading
+
+from metrics import record_wait
+
+
+class RateLimiter:
+    def __init__(self, rate_per_second, burst=None, name=None):
+        self.name = name
+        self.rate = float(rate_per_second)
+        self.capacity = float(burst if burst is not None else max(1.0, rate_per_second))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Block until a token is available; returns False if timeout elapses first"""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if self.name:
+                        record_wait(self.name, now - started)
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_for = min(wait_for, remaining)
+            time.sleep(wait_for)
+
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+# Defaults per upstream; override with e.g. RATE_LIMIT_BEDROCK=4
+DEFAULT_RATES = {
+    "bedrock": (5.0, 5),
+    "ddg": (1.0, 2),
+}
+
+
+def get_limiter(name):
+    with _registry_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate, burst = DEFAULT_RATES.get(name, (5.0, 5))
+            rate = float(os.environ.get(f"RATE_LIMIT_{name.upper()}", rate))
+            limiter = RateLimiter(rate, burst, name=name)
+            _limiters[name] = limiter
+        return limiter
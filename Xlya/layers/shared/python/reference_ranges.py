@@ -0,0 +1,209 @@
+"""
+XYLA INSIGHTS — Reference Range Flagging
+Deterministic abnormal-value flags for parsed lab rows (see lab_results),
+from the reference-range knowledge base in reference_ranges.json.
+
+The knowledge base is keyed by analyte, with a canonical unit and unit
+conversions, optional critical (panic) limits, and ranges by sex and age band.
+It is loaded once per container into an index of tuples; a lookup is a dict
+access plus a scan of a handful of bands.
+
+    flags = flag_results(lab_rows, sex="F", age=54)
+    abnormal = [row for row in flags if is_abnormal(row)]
+
+The lab's own flag, then the range printed on the report, decide a row's flag.
+The knowledge base is the fallback for rows that have neither; otherwise it
+only converts the value to its canonical unit and, where its band would flag
+the row differently, the disagreement is noted in range_source.
+"""
+import re
+import json
+import functools
+from pathlib import Path
+
+KNOWLEDGE_BASE = Path(__file__).with_name("reference_ranges.json")
+
+# Assumed when the patient's age is unknown
+DEFAULT_AGE = 30
+
+ABNORMAL_FLAGS = ("low", "high", "critical_low", "critical_high", "critical", "abnormal")
+
+_index = None
+
+
+def normalize_unit(unit):
+    unit = (unit or "").strip().lower()
+    unit = unit.replace("µ", "u").replace("μ", "u").replace("mcg", "ug").replace(" ", "")
+    unit = unit.replace("x10", "10").replace("×10", "10").replace("10³", "10^3").replace("10e3", "10^3")
+    unit = unit.replace("10*3", "10^3").replace("10*9", "10^9").replace("10*12", "10^12")
+    unit = re.sub(r"(cumm|cmm|mm3)$", "ul", unit)
+    unit = re.sub(r"^cells/", "/", unit)
+    return unit
+
+
+# ============================================================
+# Knowledge Base Index
+# ============================================================
+def _build_index(data):
+    """analyte -> (canonical unit, {unit: (factor, offset)}, critical (low, high), bands)"""
+    index = {}
+    for analyte, spec in data["analytes"].items():
+        canonical = normalize_unit(spec["unit"])
+        conversions = {canonical: (1.0, 0.0)}
+        for unit, (factor, offset) in (spec.get("convert") or {}).items():
+            conversions[normalize_unit(unit)] = (float(factor), float(offset))
+        critical = tuple(spec.get("critical") or (None, None))
+        # Sex-specific bands before "*" so the first match is the most specific
+        bands = tuple(sorted(
+            ((band["sex"], band["age"][0], band["age"][1], band["low"], band["high"]) for band in spec["ranges"]),
+            key=lambda band: band[0] == "*",
+        ))
+        index[analyte] = (spec["unit"], conversions, critical, bands)
+    return index
+
+
+def load_index():
+    global _index
+    if _index is None:
+        with open(KNOWLEDGE_BASE, encoding="utf-8") as f:
+            _index = _build_index(json.load(f))
+    return _index
+
+
+def normalize_sex(value):
+    value = str(value or "").strip().lower()
+    if value in ("m", "male", "man"):
+        return "M"
+    if value in ("f", "female", "woman"):
+        return "F"
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def reference_for(analyte, sex=None, age=None):
+    """(low, high) for the patient in the canonical unit, or None when the knowledge base has no band"""
+    entry = load_index().get(analyte)
+    if entry is None:
+        return None
+    age = DEFAULT_AGE if age is None else age
+    bands = [band for band in entry[3] if band[1] <= age < band[2]]
+    if not bands:
+        return None
+    for band_sex, _, _, low, high in bands:
+        if band_sex == sex or band_sex == "*":
+            return low, high
+    # Sex unknown and only sex-specific bands: flag only outside both
+    lows = [band[3] for band in bands]
+    highs = [band[4] for band in bands]
+    return (
+        None if None in lows else min(lows),
+        None if None in highs else max(highs),
+    )
+
+
+def to_canonical(analyte, value, unit):
+    """(value in the canonical unit, canonical unit), or None if the unit is not known for the analyte"""
+    entry = load_index().get(analyte)
+    if entry is None:
+        return None
+    canonical_unit, conversions, _, _ = entry
+    unit = normalize_unit(unit)
+    if not unit:
+        return value, canonical_unit
+    conversion = conversions.get(unit)
+    if conversion is None:
+        return None
+    factor, offset = conversion
+    return value * factor + offset, canonical_unit
+
+
+# ============================================================
+# Flagging
+# ============================================================
+def _status(value, low, high, critical=(None, None)):
+    critical_low, critical_high = critical
+    if critical_low is not None and value < critical_low:
+        return "critical_low"
+    if critical_high is not None and value > critical_high:
+        return "critical_high"
+    if low is not None and value < low:
+        return "low"
+    if high is not None and value > high:
+        return "high"
+    return ""
+
+
+def _number_text(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def _reference_text(low, high):
+    if low is not None and high is not None:
+        return f"{low:g} - {high:g}"
+    if high is not None:
+        return f"< {high:g}"
+    if low is not None:
+        return f"> {low:g}"
+    return ""
+
+
+def _disagrees(flag, kb_flag):
+    return (flag in ABNORMAL_FLAGS) != (kb_flag in ABNORMAL_FLAGS)
+
+
+def flag_row(row, sex=None, age=None):
+    """
+    Copy of a lab row with flag set, and range_source saying what decided it:
+    "report_flag", "report" (its printed range), "knowledge_base" or "".
+    """
+    flagged = dict(row)
+    entry = load_index().get(row["analyte"]) if row.get("known") else None
+    converted = to_canonical(row["analyte"], row["value"], row["unit"]) if entry else None
+    band = reference_for(row["analyte"], sex, age) if converted else None
+
+    kb_flag, kb_reference = None, ""
+    if converted:
+        value, unit = converted
+        if abs(value - row["value"]) > 1e-9:
+            flagged["converted"] = f"{_number_text(value)} {unit}".strip()
+        if band is not None:
+            kb_flag = _status(value, band[0], band[1], entry[2])
+            kb_reference = f"{_reference_text(*band)} {unit}".strip()
+
+    if row.get("flag"):
+        flagged["range_source"] = "report_flag"
+    elif row.get("ref_low") is not None or row.get("ref_high") is not None:
+        flagged.update({
+            "flag": _status(row["value"], row.get("ref_low"), row.get("ref_high")),
+            "range_source": "report",
+        })
+    elif band is not None:
+        flagged.update({
+            "flag": kb_flag,
+            "reference": kb_reference,
+            "ref_low": band[0],
+            "ref_high": band[1],
+            "range_source": "knowledge_base",
+        })
+        return flagged
+    else:
+        flagged["range_source"] = ""
+        return flagged
+
+    # The report decided; a differing knowledge-base verdict is recorded, not applied
+    if kb_flag is not None and _disagrees(flagged["flag"], kb_flag):
+        flagged["range_source"] += f" (knowledge_base: {kb_flag or 'normal'}, {kb_reference})"
+    return flagged
+
+
+def flag_results(rows, sex=None, age=None):
+    sex = normalize_sex(sex)
+    try:
+        age = int(age) if age not in (None, "") else None
+    except (TypeError, ValueError):
+        age = None
+    return [flag_row(row, sex, age) for row in rows]
+
+
+def is_abnormal(row):
+    return row.get("flag") in ABNORMAL_FLAGS
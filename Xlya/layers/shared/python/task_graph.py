@@ -0,0 +1,118 @@
+"""
+XYLA INSIGHTS — Task Graph Executor
+Small in-Lambda dependency-graph runner shared by the analyzer Lambdas.
+Each step declares the steps it depends on and is started on a thread pool as
+soon as those results are available. A global deadline bounds the whole graph,
+and a step that raises, misses the deadline or is never reached resolves to its
+fallback value instead of failing the invocation.
+"""
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metrics import bind
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def deadline_from_context(context, cap_seconds, reserve_seconds=5):
+    """Seconds the graph may run: the Lambda time left minus a reserve, capped"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return cap_seconds
+    remaining = context.get_remaining_time_in_millis() / 1000.0 - reserve_seconds
+    return max(1.0, min(cap_seconds, remaining))
+
+
+class TaskGraph:
+    """
+    Usage:
+
+        graph = TaskGraph(deadline_seconds=150, label="GEO")
+        graph.add("search", _search, fallback={"count": 0})
+        graph.add("index", lambda search: _index(search["count"]), depends_on=["search"])
+        results = graph.run()
+
+    A step function receives the results of its dependencies as keyword
+    arguments named after them. Dependencies that degraded to their fallback
+    still feed the dependent step, so downstream work runs on partial input
+    rather than being skipped.
+    """
+
+    def __init__(self, deadline_seconds, max_workers=DEFAULT_MAX_WORKERS, label="TaskGraph"):
+        self.deadline_seconds = deadline_seconds
+        self.max_workers = max_workers
+        self.label = label
+        self._steps = {}
+        self.errors = {}
+        self.timings = {}
+
+    def add(self, name, fn, depends_on=(), fallback=None):
+        if name in self._steps:
+            raise ValueError(f"Duplicate step: {name}")
+        for dep in depends_on:
+            if dep not in self._steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+        self._steps[name] = {"fn": fn, "depends_on": list(depends_on), "fallback": fallback}
+        return self
+
+    def run(self):
+        results = {}
+        started_at = time.monotonic()
+        deadline = started_at + self.deadline_seconds
+        pending = dict(self._steps)
+        running = {}
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(pending))))
+        try:
+            while pending or running:
+                # Start every step whose dependencies have all resolved
+                for name in list(pending):
+                    step = pending[name]
+                    if all(dep in results for dep in step["depends_on"]):
+                        kwargs = {dep: results[dep] for dep in step["depends_on"]}
+                        future = executor.submit(bind(self._timed), name, step["fn"], kwargs)
+                        running[future] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                done, _ = wait(list(running), timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"[{self.label}] Step '{name}' failed: {type(e).__name__}: {e}")
+                        print(traceback.format_exc())
+                        self.errors[name] = str(e)
+                        results[name] = self._steps[name]["fallback"]
+        finally:
+            # Threads already running cannot be interrupted; abandon them and move on
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for future, name in running.items():
+            print(f"[{self.label}] Step '{name}' missed the {self.deadline_seconds:g}s deadline")
+            self.errors[name] = "deadline exceeded"
+            results[name] = self._steps[name]["fallback"]
+
+        for name in pending:
+            print(f"[{self.label}] Step '{name}' not started before the deadline")
+            self.errors[name] = "not started"
+            results[name] = self._steps[name]["fallback"]
+
+        elapsed = time.monotonic() - started_at
+        print(f"[{self.label}] Graph finished in {elapsed:.2f}s ({len(self.errors)} degraded step(s))")
+        return results
+
+    def _timed(self, name, fn, kwargs):
+        step_start = time.monotonic()
+        try:
+            return fn(**kwargs)
+        finally:
+            self.timings[name] = round(time.monotonic() - step_start, 3)
@@ -0,0 +1,281 @@
+"""
+XYLA INSIGHTS — WebSocket Progress Helper
+Coalescing progress-event bus shared by the pipeline Lambdas.
+
+Every progress tick is merged into a pending event per task_id. At most one
+event per PROGRESS_FLUSH_INTERVAL is flushed, and a flush costs one DynamoDB
+write to the analyzer table plus one concurrent push to every WebSocket
+connection registered for the task. Connections that API Gateway reports as
+gone are pruned from the registry. Terminal statuses flush immediately.
+
+Handlers must drain the bus before returning; wrap them with
+@flush_progress_on_exit (or call flush()) so trailing updates are not lost
+when the Lambda container freezes.
+"""
+import os
+import json
+import time
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+ANALYZER_TABLE = os.environ.get("SEOAEOGEOANALYZERTABLE", "seo-aeo-geo-analyzer-table")
+WS_CONNECTIONS_TABLE = os.environ.get("WS_CONNECTIONS_TABLE", "ws-connections-table")
+WEBSOCKET_ENDPOINT = os.environ.get("WEBSOCKET_ENDPOINT", "")
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", "2"))
+PUSH_MAX_WORKERS = 10
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+dynamodb = boto3.resource("dynamodb")
+_apigw_client = None
+
+
+def _management_client():
+    global _apigw_client
+    if _apigw_client is None and WEBSOCKET_ENDPOINT:
+        _apigw_client = boto3.client("apigatewaymanagementapi", endpoint_url=WEBSOCKET_ENDPOINT)
+    return _apigw_client
+
+
+# ============================================================
+# Connection Registry
+# ============================================================
+def register_connection(task_id, connection_id, cognito_sub="", ttl_seconds=86400):
+    dynamodb.Table(WS_CONNECTIONS_TABLE).put_item(
+        Item={
+            "task_id": task_id,
+            "connection_id": connection_id,
+            "cognito_sub": cognito_sub,
+            "connected_at": str(int(time.time())),
+            "expires_at": int(time.time()) + ttl_seconds,
+        }
+    )
+
+
+def unregister_connection(task_id, connection_id):
+    dynamodb.Table(WS_CONNECTIONS_TABLE).delete_item(
+        Key={"task_id": task_id, "connection_id": connection_id}
+    )
+
+
+def drop_connection(connection_id):
+    """Remove a connection from every task it subscribed to ($disconnect only knows the id)"""
+    table = dynamodb.Table(WS_CONNECTIONS_TABLE)
+    response = table.query(
+        IndexName="connection_id-index",
+        KeyConditionExpression=Key("connection_id").eq(connection_id),
+        ProjectionExpression="task_id",
+    )
+    for item in response.get("Items", []):
+        table.delete_item(Key={"task_id": item["task_id"], "connection_id": connection_id})
+
+
+def get_connections(task_id):
+    response = dynamodb.Table(WS_CONNECTIONS_TABLE).query(
+        KeyConditionExpression=Key("task_id").eq(task_id),
+        ProjectionExpression="connection_id",
+    )
+    return [item["connection_id"] for item in response.get("Items", [])]
+
+
+# ============================================================
+# Progress Bus
+# ============================================================
+class ProgressBus:
+    def __init__(self, interval=PROGRESS_FLUSH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = {}
+        self._timers = {}
+        self._owners = {}
+        # Held from taking a task's pending event until it is written and pushed,
+        # so a trailing-edge Timer cannot land an older event after a newer one
+        self._flush_locks = {}
+
+    def publish(self, task_id, status=None, progress=None, message=None, cognito_sub=None, push=True, persist=True):
+        if not task_id:
+            return
+
+        with self._lock:
+            event = self._pending.setdefault(task_id, {"push": False, "persist": False})
+            if status is not None:
+                event["status"] = status
+            if progress is not None:
+                event["progress"] = progress
+            if message is not None:
+                event["message"] = message
+            if cognito_sub:
+                self._owners[task_id] = cognito_sub
+            event["push"] = event["push"] or push
+            event["persist"] = event["persist"] or persist
+
+            last_flush = self._last_flush.get(task_id)
+            elapsed = self.interval if last_flush is None else time.monotonic() - last_flush
+            flush_now = elapsed >= self.interval or event.get("status") in TERMINAL_STATUSES
+            if not flush_now and task_id not in self._timers:
+                # Trailing edge: whatever is pending when the interval closes goes out then
+                timer = threading.Timer(self.interval - elapsed, self._flush_task, args=(task_id,))
+                timer.daemon = True
+                self._timers[task_id] = timer
+                timer.start()
+
+        if flush_now:
+            self._flush_task(task_id)
+
+    def flush(self, task_id=None):
+        with self._lock:
+            task_ids = [task_id] if task_id else list(self._pending)
+        for tid in task_ids:
+            self._flush_task(tid)
+
+    def _flush_task(self, task_id):
+        with self._lock:
+            flush_lock = self._flush_locks.setdefault(task_id, threading.Lock())
+
+        with flush_lock:
+            with self._lock:
+                timer = self._timers.pop(task_id, None)
+                if timer:
+                    timer.cancel()
+                event = self._pending.pop(task_id, None)
+                if not event:
+                    return
+                self._last_flush[task_id] = time.monotonic()
+                cognito_sub = self._owners.get(task_id)
+
+            if event["persist"] and ("status" in event or "progress" in event):
+                cognito_sub = cognito_sub or self._resolve_owner(task_id)
+                _write_status(task_id, cognito_sub, event)
+            if event["push"]:
+                _push_to_connections(task_id, event)
+
+    def _resolve_owner(self, task_id):
+        # The analyzer table is keyed on (task_id, cognito_sub); look the owner up once
+        try:
+            response = dynamodb.Table(ANALYZER_TABLE).query(
+                KeyConditionExpression=Key("task_id").eq(task_id),
+                ProjectionExpression="cognito_sub",
+                Limit=1,
+            )
+            items = response.get("Items", [])
+        except ClientError as e:
+            print(f"[WS] Could not resolve owner for task {task_id}: {e}")
+            return None
+        if not items:
+            return None
+        with self._lock:
+            self._owners[task_id] = items[0]["cognito_sub"]
+        return items[0]["cognito_sub"]
+
+
+def _write_status(task_id, cognito_sub, event):
+    if not cognito_sub:
+        print(f"[WS] Skipping status write for task {task_id}: owner unknown")
+        return
+
+    updates = ["updated_at = :u"]
+    names = {}
+    values = {":u": str(int(time.time()))}
+    if "status" in event:
+        updates.append("#st = :s")
+        names["#st"] = "status"
+        values[":s"] = event["status"]
+    if "progress" in event:
+        updates.append("progress = :p")
+        values[":p"] = str(event["progress"])
+    if "message" in event:
+        updates.append("status_message = :m")
+        values[":m"] = event["message"]
+
+    try:
+        kwargs = {
+            "Key": {"task_id": task_id, "cognito_sub": cognito_sub},
+            "UpdateExpression": "SET " + ", ".join(updates),
+            "ExpressionAttributeValues": values,
+        }
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
+        dynamodb.Table(ANALYZER_TABLE).update_item(**kwargs)
+    except ClientError as e:
+        print(f"[WS] Status write failed for task {task_id}: {e}")
+
+
+def _push_to_connections(task_id, event):
+    client = _management_client()
+    if client is None:
+        return
+
+    try:
+        connection_ids = get_connections(task_id)
+    except ClientError as e:
+        print(f"[WS] Connection lookup failed for task {task_id}: {e}")
+        return
+    if not connection_ids:
+        return
+
+    payload = json.dumps({
+        "type": "progress",
+        "task_id": task_id,
+        "status": event.get("status"),
+        "progress": event.get("progress"),
+        "message": event.get("message"),
+        "timestamp": int(time.time()),
+    }).encode("utf-8")
+
+    def _post(connection_id):
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=payload)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in ("GoneException", "410"):
+                print(f"[WS] Pruning stale connection {connection_id}")
+                try:
+                    unregister_connection(task_id, connection_id)
+                except ClientError as delete_error:
+                    print(f"[WS] Failed to prune {connection_id}: {delete_error}")
+            else:
+                print(f"[WS] Push to {connection_id} failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=min(PUSH_MAX_WORKERS, len(connection_ids))) as pool:
+        list(pool.map(_post, connection_ids))
+
+
+_bus = ProgressBus()
+
+
+# ============================================================
+# Public API used by the pipeline Lambdas
+# ============================================================
+def send_progress_update(task_id, status, progress, message, cognito_sub=None):
+    """Push a progress event to the task's WebSocket clients (coalesced)"""
+    _bus.publish(task_id, status=status, progress=progress, message=message, cognito_sub=cognito_sub, push=True, persist=False)
+
+
+def update_analysis_status(task_id, status, progress, cognito_sub=None):
+    """Persist status/progress on the task record (coalesced)"""
+    _bus.publish(task_id, status=status, progress=progress, cognito_sub=cognito_sub, push=False, persist=True)
+
+
+def report_progress(task_id, status, progress, message=None, cognito_sub=None):
+    """Persist and push in one call"""
+    _bus.publish(task_id, status=status, progress=progress, message=message, cognito_sub=cognito_sub)
+
+
+def flush(task_id=None):
+    """Synchronously send everything still pending"""
+    _bus.flush(task_id)
+
+
+def flush_progress_on_exit(handler):
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        try:
+            return handler(event, context)
+        finally:
+            flush()
+    return wrapper
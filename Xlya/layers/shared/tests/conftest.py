@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Shared layer modules are imported the way Lambda sees them: from the layer's python/ directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "python"))
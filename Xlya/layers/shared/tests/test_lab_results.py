@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from lab_results import parse_cells, report_date
+
+
+# ============================================================
+# Rows that are not lab results
+# ============================================================
+@pytest.mark.parametrize("cells", [
+    ["Page", "2", "of 5"],
+    ["Patient Age", "45", "years"],
+    ["Dose", "5", "mg", "taken"],
+    ["Lipase", "40", "U/L"],
+    ["Weird Test", "4", "zorks", "1-5"],
+])
+def test_rejects_non_result_rows(cells):
+    assert parse_cells(cells) is None
+
+
+# ============================================================
+# Known analytes
+# ============================================================
+def test_single_letter_synonym():
+    row = parse_cells(["K", "4.5", "mmol/L", "3.5-5.1"])
+    assert row["analyte"] == "potassium"
+    assert row["known"] is True
+    assert (row["unit"], row["ref_low"], row["ref_high"]) == ("mmol/L", 3.5, 5.1)
+
+
+def test_bare_glucose_is_known():
+    row = parse_cells(["Glucose", "95", "mg/dL", "70-100"])
+    assert row["analyte"] == "glucose"
+    assert row["known"] is True
+
+
+def test_qualified_glucose_keeps_its_timing():
+    assert parse_cells(["Glucose (Fasting)", "95", "mg/dL"])["analyte"] == "glucose_fasting"
+
+
+def test_report_flag_and_range():
+    row = parse_cells(["Hemoglobin", "11.2", "g/dL", "13.0 - 17.0", "L"])
+    assert (row["value"], row["unit"], row["reference"], row["flag"]) == (11.2, "g/dL", "13.0 - 17.0", "low")
+
+
+def test_known_analyte_keeps_unlisted_unit():
+    row = parse_cells(["Platelet count", "2.5", "lakhs/cumm", "1.5-4.1"])
+    assert (row["analyte"], row["unit"]) == ("platelets", "lakhs/cumm")
+
+
+# ============================================================
+# Unknown analytes
+# ============================================================
+def test_unknown_name_with_range_and_lab_unit():
+    row = parse_cells(["Lipase", "40", "U/L", "13-60"])
+    assert (row["analyte"], row["known"], row["unit"]) == ("lipase", False, "U/L")
+
+
+def test_unknown_name_with_range_and_no_unit():
+    row = parse_cells(["Urine pH", "6.0", "5-8"])
+    assert (row["analyte"], row["unit"], row["reference"]) == ("urine_ph", "", "5 - 8")
+
+
+# ============================================================
+# Report dates
+# ============================================================
+def _day(year, month, day):
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.mark.parametrize("text", [
+    "Sample Collected: 05-Mar-2024 08:12",
+    "Collection Date/Time : 2024-03-05 08:12",
+    "Date of Collection 5 March 2024",
+    "Collected on March 5, 2024",
+    "Specimen Drawn: 2024/03/05",
+])
+def test_collection_date_forms(text):
+    assert report_date(text) == _day(2024, 3, 5)
+
+
+def test_collection_date_beats_report_date():
+    text = "Reported: 12-Mar-2024\nPatient: A\nCollected: 05-Mar-2024"
+    assert report_date(text) == _day(2024, 3, 5)
+
+
+def test_falls_back_to_report_date():
+    assert report_date("Report Date: 2024-03-12") == _day(2024, 3, 12)
+
+
+@pytest.mark.parametrize("text", [
+    "Collected: 05/03/2024",       # day/month order unknown
+    "Collected: 2024-02-31",       # no such day
+    "Collected: 1899-01-01",       # implausibly old
+    "Hemoglobin 11.2 g/dL 13-17",  # no date at all
+])
+def test_unreadable_dates(text):
+    assert report_date(text) is None
+
+
+def test_unambiguous_numeric_date():
+    assert report_date("Collected: 25/03/2024") == _day(2024, 3, 25)
+
+
+def test_date_after_upload_is_ignored():
+    text = "Collected: 2030-01-01\nReported: 2024-03-12"
+    assert report_date(text, not_after=_day(2024, 4, 1)) == _day(2024, 3, 12)
@@ -0,0 +1,55 @@
+from lab_results import parse_cells
+from reference_ranges import flag_row, is_abnormal
+
+
+def flagged(cells, sex=None, age=None):
+    return flag_row(parse_cells(cells), sex, age)
+
+
+# ============================================================
+# The report decides
+# ============================================================
+def test_report_range_wins_over_knowledge_base():
+    row = flagged(["Sodium", "135", "mmol/L", "135-145"])
+    assert row["flag"] == ""
+    assert row["reference"] == "135 - 145"
+    assert row["range_source"] == "report (knowledge_base: low, 136 - 145 mmol/L)"
+
+
+def test_report_flag_wins_over_its_range():
+    row = flagged(["Hemoglobin", "11.2", "g/dL", "13.0 - 17.0", "L"], sex="M")
+    assert row["flag"] == "low"
+    assert row["range_source"] == "report_flag"
+
+
+def test_report_range_flags_out_of_range_value():
+    row = flagged(["K", "5.6", "mmol/L", "3.5-5.1"])
+    assert row["flag"] == "high"
+    assert row["range_source"] == "report"
+    assert is_abnormal(row)
+
+
+def test_agreement_is_not_noted():
+    assert flagged(["Glucose", "95", "mg/dL", "70-100"])["range_source"] == "report"
+
+
+# ============================================================
+# Knowledge base as fallback and converter
+# ============================================================
+def test_knowledge_base_without_report_range():
+    row = flagged(["Glucose (Fasting)", "130", "mg/dL"])
+    assert row["flag"] == "high"
+    assert row["range_source"] == "knowledge_base"
+    assert (row["ref_low"], row["ref_high"]) == (70, 100)
+
+
+def test_knowledge_base_converts_units():
+    row = flagged(["Glucose", "5.5", "mmol/L", "3.9-7.8"])
+    assert row["converted"] == "99.09 mg/dL"
+    assert row["flag"] == ""
+    assert row["range_source"] == "report"
+
+
+def test_unknown_analyte_uses_report_range():
+    row = flagged(["Lipase", "70", "U/L", "13-60"])
+    assert (row["flag"], row["range_source"]) == ("high", "report")
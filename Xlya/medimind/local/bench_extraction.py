@@ -0,0 +1,189 @@
+"""
+XYLA INSIGHTS — MediMind PDF Extraction Benchmark
+Times diagnose's full-document extraction (extract_all_pages, text and lab
+rows) serially and with the worker counts Lambda would give at each memory
+size, on a corpus of multi-page lab reports.
+
+  python bench_extraction.py                       # generated corpus (10, 50, 200 pages)
+  python bench_extraction.py --pages 400 --runs 3
+  python bench_extraction.py --corpus ./reports    # real PDFs from a directory
+
+Lambda allocates one vCPU per 1769 MB, so each memory size maps to a worker
+count. Locally the worker count is capped at this machine's cores; a row whose
+vCPUs exceed them is marked. Needs pdfplumber (the PDF layer's contents)
+installed locally.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+LOCAL_DIR = Path(__file__).resolve().parent
+DIAGNOSE_DIR = LOCAL_DIR.parent / "src" / "diagnose"
+SHARED_LAYER = LOCAL_DIR.parents[1] / "layers" / "shared" / "python"
+
+# Lambda memory sizes (MB) -> vCPUs
+LAMBDA_MEMORY_VCPUS = {
+    512: 1,
+    1769: 1,
+    3538: 2,
+    5307: 3,
+    7076: 4,
+    8845: 5,
+    10240: 6,
+}
+
+LAB_PANELS = [
+    ("Hemoglobin", "g/dL", "13.0 - 17.0"),
+    ("Hematocrit", "%", "40 - 50"),
+    ("RBC Count", "million/uL", "4.5 - 5.5"),
+    ("WBC Count", "cells/uL", "4000 - 11000"),
+    ("Platelet Count", "lakh/uL", "1.5 - 4.1"),
+    ("MCV", "fL", "83 - 101"),
+    ("Fasting Glucose", "mg/dL", "70 - 100"),
+    ("HbA1c", "%", "4.0 - 5.6"),
+    ("Serum Creatinine", "mg/dL", "0.7 - 1.3"),
+    ("Blood Urea Nitrogen", "mg/dL", "7 - 20"),
+    ("eGFR", "mL/min/1.73m2", "> 90"),
+    ("Sodium", "mmol/L", "136 - 145"),
+    ("Potassium", "mmol/L", "3.5 - 5.1"),
+    ("ALT (SGPT)", "U/L", "7 - 56"),
+    ("AST (SGOT)", "U/L", "10 - 40"),
+    ("Total Bilirubin", "mg/dL", "0.3 - 1.2"),
+    ("TSH", "uIU/mL", "0.4 - 4.0"),
+    ("Free T4", "ng/dL", "0.8 - 1.8"),
+    ("Total Cholesterol", "mg/dL", "< 200"),
+    ("LDL Cholesterol", "mg/dL", "< 100"),
+    ("HDL Cholesterol", "mg/dL", "> 40"),
+    ("Triglycerides", "mg/dL", "< 150"),
+    ("Vitamin D (25-OH)", "ng/mL", "30 - 100"),
+    ("Vitamin B12", "pg/mL", "200 - 900"),
+]
+
+
+# ============================================================
+# Fixture Corpus
+# ============================================================
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _lab_page_lines(page_number):
+    lines = [
+        "XYLA DIAGNOSTICS - LABORATORY REPORT",
+        f"Patient: Test Patient   Age/Sex: 54/M   Page {page_number}",
+        "Collected: 2026-03-14 08:10   Reported: 2026-03-14 14:32",
+        "",
+        "Test                         Result      Unit            Reference Range",
+    ]
+    for i in range(3):
+        for j, (name, unit, reference) in enumerate(LAB_PANELS):
+            value = round(5 + ((page_number * 31 + i * 7 + j * 13) % 97) * 1.37, 1)
+            lines.append(f"{name:<28} {value:<11} {unit:<15} {reference}")
+    lines.append("Comments: values outside the reference range are flagged for clinical correlation.")
+    return lines
+
+
+def write_lab_report(path, pages):
+    """A text-only lab report PDF, written directly so no PDF library is needed"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>",
+    ]
+    page_ids = []
+    for page_number in range(1, pages + 1):
+        commands = ["BT", "/F1 8 Tf", "10 TL", "36 800 Td"]
+        commands += [f"({_escape(line)}) Tj T*" for line in _lab_page_lines(page_number)]
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def build_corpus(directory, page_counts):
+    paths = []
+    for pages in page_counts:
+        path = Path(directory) / f"lab_report_{pages:04d}p.pdf"
+        write_lab_report(path, pages)
+        paths.append(path)
+    return paths
+
+
+# ============================================================
+# Benchmark
+# ============================================================
+def load_diagnose():
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("MEDIMIND_TABLE", "local")
+    os.environ.setdefault("S3_BUCKET_NAME", "local")
+    sys.path[:0] = [str(DIAGNOSE_DIR), str(SHARED_LAYER)]
+    import app
+    return app
+
+
+def time_extraction(diagnose, path, workers, runs):
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        _, _, stats = diagnose.extract_all_pages(str(path), workers)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MediMind PDF extraction across Lambda memory sizes")
+    parser.add_argument("--corpus", help="directory of PDFs (defaults to a generated lab report corpus)")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200], help="page counts to generate")
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    diagnose = load_diagnose()
+    local_cpus = diagnose.available_cpus()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sorted(Path(args.corpus).glob("*.pdf")) if args.corpus else build_corpus(tmp, args.pages)
+        print(f"Local CPUs: {local_cpus}; parallel from {diagnose.PDF_PARALLEL_MIN_PAGES} pages\n")
+        print(f"{'report':<24} {'memory':>7} {'vCPU':>5} {'workers':>8} {'seconds':>8} {'pages/s':>8} {'speedup':>8}")
+
+        for path in paths:
+            baseline = None
+            for memory, vcpus in LAMBDA_MEMORY_VCPUS.items():
+                workers = min(vcpus, local_cpus)
+                seconds, stats = time_extraction(diagnose, path, workers, args.runs)
+                baseline = baseline or seconds
+                capped = "*" if vcpus > local_cpus else ""
+                print(
+                    f"{path.name:<24} {memory:>7} {vcpus:>5} {stats['workers']:>7}{capped:1} "
+                    f"{seconds:>8.2f} {stats['pages_total'] / seconds:>8.1f} {baseline / seconds:>7.2f}x"
+                )
+            print()
+
+    if any(vcpus > local_cpus for vcpus in LAMBDA_MEMORY_VCPUS.values()):
+        print("* capped at the local CPU count")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
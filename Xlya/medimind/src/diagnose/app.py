@@ -1,14 +1,26 @@
 import os
 import re
-import io
 import json
 import time
+import base64
+import hashlib
+import tempfile
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 import boto3
 import pdfplumber
 from botocore.exceptions import ClientError
 
+from profiling import profiled, set_task as set_profile_task
+from lab_results import page_lab_rows, dedupe_rows, format_lab_table, report_date
+from reference_ranges import flag_results, is_abnormal
+import lab_series
+
 # AWS Clients
 s3_client = boto3.client("s3")
+sqs_client = boto3.client("sqs")
 dynamodb = boto3.resource("dynamodb")
 bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-east-1")
 
@@ -19,6 +31,71 @@ S3_BUCKET = os.environ["S3_BUCKET_NAME"]
 # Bedrock Model — gpt-oss-120b v1 (on-demand, us-east-1, 128K context)
 MODEL_ID = "openai.gpt-oss-120b-1:0"
 
+# Characters of report text sent to the model in one prompt. Without lab tables
+# or chunked diagnosis, extraction stops once it has this many; 0 means every page.
+REPORT_CHAR_BUDGET = int(os.environ.get("REPORT_CHAR_BUDGET", "6000"))
+
+# Reports longer than the budget are diagnosed map-reduce: findings are pulled
+# from page-aligned chunks concurrently, then merged by one smaller prompt
+CHUNKED_DIAGNOSIS = os.environ.get("CHUNKED_DIAGNOSIS", "true").lower() == "true"
+REPORT_CHUNK_CHARS = int(os.environ.get("REPORT_CHUNK_CHARS", "4000"))
+# Past this many chunks, chunks grow instead, so latency stays sublinear in length
+DIAGNOSIS_MAX_CHUNKS = int(os.environ.get("DIAGNOSIS_MAX_CHUNKS", "24"))
+DIAGNOSIS_MAP_CONCURRENCY = int(os.environ.get("DIAGNOSIS_MAP_CONCURRENCY", "6"))
+MAP_MAX_TOKENS = 800
+REDUCE_MAX_FINDINGS = 150
+
+# Separates pages in extracted text, as pdftotext does
+PAGE_BREAK = "\f"
+
+# Parse analyte rows from every page and send the model a table of them
+LAB_TABLE_EXTRACTION = os.environ.get("LAB_TABLE_EXTRACTION", "true").lower() == "true"
+LAB_TABLE_MAX_ROWS = int(os.environ.get("LAB_TABLE_MAX_ROWS", "200"))
+# Report text sent alongside a lab table (patient details, notes, impressions)
+REPORT_CONTEXT_CHARS = int(os.environ.get("REPORT_CONTEXT_CHARS", "1500"))
+
+
+# Extractions and diagnoses are stored under the SHA-256 of the PDF bytes, so a
+# re-uploaded report is neither extracted nor sent to Bedrock again
+CONTENT_STORE = os.environ.get("CONTENT_STORE", "true").lower() == "true"
+CONTENT_PREFIX = "medimind/content"
+# Bump when extraction or the prompts change what a stored entry would hold
+CONTENT_VERSION = 1
+
+
+# Uploads are buffered in this queue; its event source caps how many batches run
+# at once, so bursts wait in the queue instead of throttling Bedrock. Unset,
+# each upload event is diagnosed directly.
+DIAGNOSIS_QUEUE_URL = os.environ.get("DIAGNOSIS_QUEUE_URL", "")
+DIAGNOSIS_DEAD_LETTER_QUEUE_URL = os.environ.get("DIAGNOSIS_DEAD_LETTER_QUEUE_URL", "")
+# The queue's maxReceiveCount: a message returned on this receive is dead-lettered
+DIAGNOSIS_MAX_RECEIVES = int(os.environ.get("DIAGNOSIS_MAX_RECEIVES", "3"))
+# Diagnosis attempts before a report is marked failed and dead-lettered. Retries
+# and skips are sent as new messages carrying the count, so only attempts
+# count against it, never receives spent waiting in a batch
+DIAGNOSIS_MAX_ATTEMPTS = int(os.environ.get("DIAGNOSIS_MAX_ATTEMPTS", "3"))
+# A failed report is sent back with this delay, doubled per attempt (SQS caps it at 900s)
+DIAGNOSIS_RETRY_DELAY = int(os.environ.get("DIAGNOSIS_RETRY_DELAY", "60"))
+DIAGNOSIS_MAX_RETRY_DELAY = 900
+# A report is not started with less time left; it goes back to the queue instead
+DIAGNOSIS_MIN_REMAINING_MS = int(os.environ.get("DIAGNOSIS_MIN_REMAINING_MS", "180000"))
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Lambda allocates vCPUs with memory (one per 1769 MB, up to 6 at 10240 MB)
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0")) or available_cpus()
+# Shorter documents are extracted serially; starting a worker costs more than a few pages
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "8"))
+
+# Earlier results of the report's analytes shown to the model (single query on the lab series table)
+TREND_WINDOW_DAYS = int(os.environ.get("TREND_WINDOW_DAYS", "365"))
+
 # Detectable conditions list for prompt context
 DETECTABLE_CONDITIONS = """
 - Diabetes (Type 1, Type 2) & Prediabetes
@@ -55,38 +132,270 @@ def cors_response(status_code, body):
     }
 
 
+def to_dynamo(value):
+    """DynamoDB takes numbers as Decimal, not float"""
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+# ============================================================
+# Content-Addressed Store
+# s3://<S3_BUCKET>/medimind/content/<sha256>/<kind>-<settings hash>.json
+# ============================================================
+def settings_hash(settings):
+    canonical = json.dumps(settings, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def content_key(content_sha256, kind, settings):
+    return f"{CONTENT_PREFIX}/{content_sha256}/{kind}-{settings_hash(settings)}.json"
+
+
+def load_content(content_sha256, kind, settings):
+    """Stored entry for the PDF bytes, or None"""
+    if not CONTENT_STORE or not content_sha256:
+        return None
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=content_key(content_sha256, kind, settings))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            print(f"[DIAGNOSE] Could not read stored {kind} for {content_sha256[:12]}: {e}")
+        return None
+    print(f"[DIAGNOSE] Reusing stored {kind} for {content_sha256[:12]}")
+    return json.loads(response["Body"].read())
+
+
+def save_content(content_sha256, kind, settings, entry):
+    """Best effort: a failed write only costs a repeat of the work next time"""
+    if not CONTENT_STORE or not content_sha256:
+        return
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=content_key(content_sha256, kind, settings),
+            Body=json.dumps(entry, default=str),
+            ContentType="application/json",
+        )
+    except ClientError as e:
+        print(f"[DIAGNOSE] Could not store {kind} for {content_sha256[:12]}: {e}")
+
+
+def stored_sha256(bucket, key):
+    """Hex SHA-256 of the object from the checksum S3 kept at upload, or None"""
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode="ENABLED")
+    except ClientError as e:
+        print(f"[DIAGNOSE] Could not read checksum of s3://{bucket}/{key}: {e}")
+        return None
+    checksum = response.get("ChecksumSHA256") or ""
+    # A multipart upload's checksum ("<base64>-<parts>") covers its part checksums, not the bytes
+    if not checksum or "-" in checksum:
+        return None
+    return base64.b64decode(checksum).hex()
+
+
+def file_sha256(fileobj):
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
 # ============================================================
 # Extract text from PDF using pdfplumber
 # ============================================================
-def extract_text_from_pdf(bucket, key):
-    print(f"[DIAGNOSE] Downloading PDF from s3://{bucket}/{key}")
+def extraction_settings(char_budget, all_pages, with_labs):
+    """What an extraction depends on besides the PDF bytes"""
+    return {
+        "version": CONTENT_VERSION,
+        "all_pages": bool(all_pages or not char_budget),
+        "char_budget": 0 if all_pages else char_budget,
+        "with_labs": with_labs,
+    }
+
+
+def extract_text_from_pdf(bucket, key, char_budget=REPORT_CHAR_BUDGET,
+                          all_pages=LAB_TABLE_EXTRACTION or CHUNKED_DIAGNOSIS,
+                          with_labs=LAB_TABLE_EXTRACTION, workers=PDF_EXTRACT_WORKERS):
+    """
+    Extract the report, returning (text, lab_rows, stats, content_sha256) with
+    the page counts processed and skipped. Pages in the text are separated by
+    PAGE_BREAK.
 
-    response = s3_client.get_object(Bucket=bucket, Key=key)
-    pdf_bytes = response["Body"].read()
-    print(f"[DIAGNOSE] PDF downloaded ({len(pdf_bytes)} bytes)")
+    The extraction of the same bytes is reused from the content store. When
+    the upload carried a SHA-256 checksum that lookup needs no download;
+    otherwise the object is hashed once downloaded.
 
+    The object is streamed to a temporary file rather than held in memory next
+    to the parsed document. With all_pages, every page is read (across a pool
+    of worker processes) so nothing at the end of a long report is lost.
+    Otherwise pages are laid out one at a time until char_budget is met, so a
+    long discharge bundle costs no more than its first few pages.
+    """
+    settings = extraction_settings(char_budget, all_pages, with_labs)
+    content_sha256 = stored_sha256(bucket, key) if CONTENT_STORE else None
+    stored = load_content(content_sha256, "extraction", settings)
+
+    if stored is None:
+        print(f"[DIAGNOSE] Downloading PDF from s3://{bucket}/{key}")
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            s3_client.download_fileobj(bucket, key, pdf_file)
+            pdf_file.flush()
+            print(f"[DIAGNOSE] PDF downloaded ({pdf_file.tell()} bytes)")
+
+            if CONTENT_STORE and not content_sha256:
+                content_sha256 = file_sha256(pdf_file)
+                stored = load_content(content_sha256, "extraction", settings)
+
+            if stored is None:
+                if all_pages or not char_budget:
+                    extracted_text, lab_rows, stats = extract_all_pages(pdf_file.name, workers, with_labs)
+                else:
+                    extracted_text, lab_rows, stats = extract_until_budget(pdf_file.name, char_budget)
+                save_content(content_sha256, "extraction", settings,
+                             {"text": extracted_text, "lab_rows": lab_rows, "stats": stats})
+
+    if stored is not None:
+        extracted_text, lab_rows = stored["text"], stored["lab_rows"]
+        stats = dict(stored["stats"], reused=True)
+
+    print(
+        f"[DIAGNOSE] Total extracted: {len(extracted_text)} chars and {len(lab_rows)} lab rows from "
+        f"{stats['pages_processed']}/{stats['pages_total']} pages ({stats['pages_skipped']} skipped)"
+    )
+    return extracted_text, lab_rows, stats, content_sha256
+
+
+def read_page(page, with_labs):
+    """(text, lab rows) of one pdfplumber page; the rows reuse the layout extract_text computed"""
+    page_text = page.extract_text() or ""
+    lab_rows = page_lab_rows(page) if with_labs else []
+    # Release the page's parsed layout before moving on
+    page.close()
+    return page_text, lab_rows
+
+
+def extract_until_budget(path, char_budget):
     text_lines = []
+    collected = 0
+    pages_processed = 0
 
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            page_text = page.extract_text()
+    with pdfplumber.open(path) as pdf:
+        # Page objects are cheap; layout analysis only happens in extract_text
+        pages_total = len(pdf.pages)
+        for page in pdf.pages:
+            if collected >= char_budget:
+                break
+            page_text, _ = read_page(page, with_labs=False)
+            pages_processed += 1
             if page_text:
                 text_lines.append(page_text)
-                print(f"[DIAGNOSE] Page {page_num + 1}: extracted {len(page_text)} chars")
+                collected += len(page_text) + 1
+                print(f"[DIAGNOSE] Page {page.page_number}: extracted {len(page_text)} chars")
+
+    stats = {
+        "pages_total": pages_total,
+        "pages_processed": pages_processed,
+        "pages_skipped": pages_total - pages_processed,
+        "workers": 1,
+        "lab_rows": 0,
+    }
+    return PAGE_BREAK.join(text_lines)[:char_budget], [], stats
+
 
-    extracted_text = "\n".join(text_lines)
-    print(f"[DIAGNOSE] Total extracted: {len(extracted_text)} chars")
-    return extracted_text
+def extract_all_pages(path, workers=PDF_EXTRACT_WORKERS, with_labs=True):
+    """Every page, with page ranges split across worker processes and reassembled in order"""
+    with pdfplumber.open(path) as pdf:
+        pages_total = len(pdf.pages)
+
+    workers = max(1, min(workers, pages_total))
+    if workers == 1 or pages_total < PDF_PARALLEL_MIN_PAGES:
+        workers = 1
+        pages = extract_page_range(path, 1, pages_total, with_labs)
+    else:
+        pages = _extract_in_processes(path, pages_total, workers, with_labs)
+
+    extracted_text = PAGE_BREAK.join(text for text, _ in pages)
+    lab_rows = dedupe_rows([row for _, rows in pages for row in rows])
+
+    print(f"[DIAGNOSE] Extracted {pages_total} pages with {workers} worker(s)")
+    stats = {
+        "pages_total": pages_total,
+        "pages_processed": pages_total,
+        "pages_skipped": 0,
+        "workers": workers,
+        "lab_rows": len(lab_rows),
+    }
+    return extracted_text, lab_rows, stats
+
+
+def extract_page_range(path, first, last, with_labs=True):
+    """(text, lab rows) of pages first..last (1-based, inclusive), one entry per page"""
+    with pdfplumber.open(path, pages=range(first, last + 1)) as pdf:
+        return [read_page(page, with_labs) for page in pdf.pages]
+
+
+def _page_ranges(pages_total, workers):
+    """Contiguous (first, last) ranges of near-equal size"""
+    size, extra = divmod(pages_total, workers)
+    ranges = []
+    first = 1
+    for i in range(workers):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def _page_range_worker(path, first, last, with_labs, conn):
+    try:
+        conn.send(("ok", extract_page_range(path, first, last, with_labs)))
+    except Exception as e:
+        conn.send(("error", f"pages {first}-{last}: {type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _extract_in_processes(path, pages_total, workers, with_labs):
+    # Lambda has no /dev/shm, so multiprocessing.Pool and its queues are out;
+    # plain processes with one pipe each work.
+    ctx = multiprocessing.get_context("fork")
+    jobs = []
+    for first, last in _page_ranges(pages_total, workers):
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_page_range_worker, args=(path, first, last, with_labs, child_conn))
+        process.start()
+        child_conn.close()
+        jobs.append((process, parent_conn))
+
+    pages = []
+    errors = []
+    for process, conn in jobs:
+        # Receive before join so a large result cannot block the worker on a full pipe
+        try:
+            status, payload = conn.recv()
+        except EOFError:
+            status, payload = "error", "worker exited without a result"
+        conn.close()
+        process.join()
+        if status == "ok":
+            pages.extend(payload)
+        else:
+            errors.append(payload)
+
+    if errors:
+        raise RuntimeError(f"PDF extraction failed: {'; '.join(errors)}")
+    return pages
 
 
 # ============================================================
 # Call Bedrock with retry + fallback
 # ============================================================
-def call_bedrock(prompt, max_retries=3):
+def call_bedrock(prompt, max_retries=3, max_tokens=2000):
     # GPT-style request format (no anthropic_version)
     request_body = {
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 2000,
+        "max_tokens": max_tokens,
         "temperature": 0.2,
     }
 
@@ -141,43 +450,29 @@ def parse_json(text):
 # ============================================================
 # Analyze medical report with Bedrock
 # ============================================================
-def analyze_medical_report(report_text):
-    prompt = f"""You are an expert medical AI specialized in analyzing laboratory test reports and medical documents.
-
-You can detect the following conditions from blood work, urine tests, imaging reports, and general medical documents:
-{DETECTABLE_CONDITIONS}
-
-Below is the extracted text from a patient's medical report:
-
---- REPORT START ---
-{report_text[:6000]}
---- REPORT END ---
-
-Analyze this report and return your findings in the following strict JSON format. Do not include any text outside the JSON.
-
-{{
-  "primary_disease": {{
+DIAGNOSIS_SCHEMA = """{
+  "primary_disease": {
     "name": "Disease name here",
     "confidence": 87,
     "confidence_label": "87% confident"
-  }},
-  "secondary_disease": {{
+  },
+  "secondary_disease": {
     "name": "Second most likely disease here",
     "confidence": 63,
     "confidence_label": "63% confident"
-  }},
+  },
   "reasons": [
     "Specific marker or finding from the report that supports this diagnosis",
     "Another specific marker or value that indicates this condition",
     "Any abnormal range or pattern detected"
   ],
-  "details": {{
+  "details": {
     "description": "A clear explanation of what this disease is and how it affects the body",
     "affected_organs": ["organ1", "organ2"],
     "severity": "mild | moderate | severe",
     "common_symptoms": ["symptom1", "symptom2", "symptom3"],
     "risk_factors": ["risk1", "risk2"]
-  }},
+  },
   "safety_measures": [
     "Immediate action the patient should take",
     "Dietary or lifestyle recommendation",
@@ -186,7 +481,69 @@ Analyze this report and return your findings in the following strict JSON format
     "Warning signs to watch for"
   ],
   "disclaimer": "This analysis is AI-generated and for informational purposes only. Always consult a licensed healthcare professional for diagnosis and treatment."
-}}
+}"""
+
+
+def abnormal_lab_section(lab_rows):
+    abnormal = [row for row in lab_rows if is_abnormal(row)]
+    normal_names = sorted({row["name"] for row in lab_rows if not is_abnormal(row)})
+    abnormal_table = format_lab_table(abnormal, LAB_TABLE_MAX_ROWS) if abnormal else "(none)"
+    return f"""--- ABNORMAL LAB RESULTS START ---
+{abnormal_table}
+--- ABNORMAL LAB RESULTS END ---
+
+Within reference range: {", ".join(normal_names) or "(none)"}"""
+
+
+def trend_section(trends):
+    if not trends:
+        return ""
+    return f"""
+
+Trends of these analytes across the patient's reports from the past {TREND_WINDOW_DAYS} days (oldest to newest, in the reference unit):
+
+--- LAB TRENDS START ---
+{trends}
+--- LAB TRENDS END ---"""
+
+
+def report_section(report_text, lab_rows):
+    """
+    The report as the model sees it. With flagged lab rows, only the abnormal
+    ones are tabulated; the rest are named so the model knows they were checked.
+    Without lab rows it gets the raw text.
+    """
+    report_text = report_text.replace(PAGE_BREAK, "\n")
+    if not lab_rows:
+        return f"""Below is the extracted text from a patient's medical report:
+
+--- REPORT START ---
+{report_text[:REPORT_CHAR_BUDGET or None]}
+--- REPORT END ---"""
+
+    return f"""Below are the out-of-range lab results from every page of a patient's medical report, flagged as the lab flagged them or by the reference range printed on the report, or where the report gives neither, by reference ranges for the patient's sex and age (H high, L low, HH/LL critical, * abnormal as printed), followed by the start of the report text for context:
+
+{abnormal_lab_section(lab_rows)}
+
+--- REPORT EXCERPT START ---
+{report_text[:REPORT_CONTEXT_CHARS]}
+--- REPORT EXCERPT END ---"""
+
+
+def analyze_medical_report(report_text, lab_rows=None, trends=""):
+    if CHUNKED_DIAGNOSIS and len(report_text) > REPORT_CHAR_BUDGET > 0:
+        return analyze_in_chunks(report_text, lab_rows or [], trends)
+
+    prompt = f"""You are an expert medical AI specialized in analyzing laboratory test reports and medical documents.
+
+You can detect the following conditions from blood work, urine tests, imaging reports, and general medical documents:
+{DETECTABLE_CONDITIONS}
+
+{report_section(report_text, lab_rows)}{trend_section(trends)}
+
+Analyze this report and return your findings in the following strict JSON format. Do not include any text outside the JSON.
+
+{DIAGNOSIS_SCHEMA}
 
 Only return the JSON. Be accurate, specific, and reference actual values from the report where possible."""
 
@@ -197,59 +554,420 @@ Only return the JSON. Be accurate, specific, and reference actual values from th
 
 
 # ============================================================
-# Lambda Handler — triggered by S3 PUT event
+# Chunked (map-reduce) diagnosis for long reports
+# ============================================================
+def split_into_chunks(report_text, chunk_chars=REPORT_CHUNK_CHARS, max_chunks=DIAGNOSIS_MAX_CHUNKS):
+    """
+    Page-aligned (first_page, last_page, text) chunks: whole pages are added
+    until a chunk reaches chunk_chars, so chunks hold chunk_chars to twice that.
+    chunk_chars grows rather than exceed max_chunks; a page longer than a
+    chunk is split on its own.
+    """
+    chunk_chars = max(chunk_chars, -(-len(report_text) // max_chunks))
+    chunks = []
+    parts = []
+    size = 0
+    first = last = 1
+
+    for page_number, page_text in enumerate(report_text.split(PAGE_BREAK), start=1):
+        for start in range(0, len(page_text), chunk_chars):
+            piece = page_text[start:start + chunk_chars]
+            if not piece.strip():
+                continue
+            if not parts:
+                first = page_number
+            parts.append(piece)
+            size += len(piece) + 1
+            last = page_number
+            if size >= chunk_chars:
+                chunks.append((first, last, "\n".join(parts)))
+                parts, size = [], 0
+
+    if parts:
+        chunks.append((first, last, "\n".join(parts)))
+    return chunks
+
+
+def extract_chunk_findings(chunk):
+    """Map step: clinically relevant findings in one chunk"""
+    first, last, text = chunk
+    pages = f"{first}-{last}" if first != last else str(first)
+    prompt = f"""You are an expert medical AI reviewing one part (pages {pages}) of a long patient medical report.
+
+List every clinically relevant finding in this part: abnormal lab values, diagnoses or impressions, imaging results, medications and procedures. Quote actual values. Ignore administrative text.
+
+--- REPORT PART START ---
+{text}
+--- REPORT PART END ---
+
+Return only JSON in this format:
+
+{{
+  "findings": [
+    {{"finding": "Hemoglobin 9.8 g/dL (low)", "significance": "suggests anemia"}}
+  ],
+  "suspected_conditions": ["Condition name"]
+}}"""
+
+    parsed = parse_json(call_bedrock(prompt, max_tokens=MAP_MAX_TOKENS))
+    return {
+        "pages": pages,
+        "findings": [f for f in parsed.get("findings", []) if isinstance(f, dict) and f.get("finding")],
+        "suspected_conditions": [c for c in parsed.get("suspected_conditions", []) if isinstance(c, str)],
+    }
+
+
+def reduce_findings(chunk_results, lab_rows, chunks_failed=0, trends=""):
+    """Reduce step: merge per-chunk findings into the diagnosis schema"""
+    finding_lines = []
+    seen = set()
+    for result in chunk_results:
+        for finding in result["findings"]:
+            text = finding["finding"].strip()
+            if text.lower() in seen:
+                continue
+            seen.add(text.lower())
+            significance = f" — {finding['significance']}" if finding.get("significance") else ""
+            finding_lines.append(f"- [p{result['pages']}] {text}{significance}")
+    if len(finding_lines) > REDUCE_MAX_FINDINGS:
+        omitted = len(finding_lines) - REDUCE_MAX_FINDINGS
+        finding_lines = finding_lines[:REDUCE_MAX_FINDINGS] + [f"({omitted} further findings omitted)"]
+
+    suspected = Counter(
+        condition.strip() for result in chunk_results for condition in set(result["suspected_conditions"])
+    )
+    suspected_text = ", ".join(f"{name} ({count} parts)" for name, count in suspected.most_common(10)) or "(none)"
+    coverage = f"all {len(chunk_results)} parts" if not chunks_failed else \
+        f"{len(chunk_results)} of {len(chunk_results) + chunks_failed} parts (the rest could not be analyzed)"
+    labs = f"\n\n{abnormal_lab_section(lab_rows)}" if lab_rows else ""
+
+    prompt = f"""You are an expert medical AI specialized in analyzing laboratory test reports and medical documents.
+
+You can detect the following conditions from blood work, urine tests, imaging reports, and general medical documents:
+{DETECTABLE_CONDITIONS}
+
+A long medical report was reviewed in parts. Below are the findings from {coverage}, with the pages they came from:
+
+--- FINDINGS START ---
+{chr(10).join(finding_lines) or "(no findings)"}
+--- FINDINGS END ---
+
+Conditions suspected while reviewing the parts: {suspected_text}{labs}{trend_section(trends)}
+
+Merge these into a single diagnosis for the whole report and return it in the following strict JSON format. Do not include any text outside the JSON.
+
+{DIAGNOSIS_SCHEMA}
+
+Only return the JSON. Be accurate, specific, and reference actual values and pages from the findings where possible."""
+
+    print(f"[DIAGNOSE] Reducing {len(finding_lines)} findings from {len(chunk_results)} chunks...")
+    return parse_json(call_bedrock(prompt))
+
+
+def analyze_in_chunks(report_text, lab_rows, trends=""):
+    chunks = split_into_chunks(report_text)
+    print(f"[DIAGNOSE] Long report ({len(report_text)} chars): {len(chunks)} chunks, "
+          f"{min(DIAGNOSIS_MAP_CONCURRENCY, len(chunks))} at a time")
+
+    results = []
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(DIAGNOSIS_MAP_CONCURRENCY, len(chunks)))) as pool:
+        futures = [pool.submit(extract_chunk_findings, chunk) for chunk in chunks]
+        # Collected in submission order so findings stay in page order
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed += 1
+                print(f"[DIAGNOSE] Chunk pages {chunk[0]}-{chunk[1]} failed: {e}")
+
+    if not results:
+        raise Exception("Every report chunk failed analysis")
+    return reduce_findings(results, lab_rows, failed, trends)
+
+
+# ============================================================
+# Intake Queue
+# ============================================================
+def s3_object(event):
+    """(bucket, key) of an EventBridge "Object Created" event or an S3 notification"""
+    if event.get("detail-type") == "Object Created":
+        return event["detail"]["bucket"]["name"], event["detail"]["object"]["key"]
+    record = event["Records"][0]
+    return record["s3"]["bucket"]["name"], record["s3"]["object"]["key"]
+
+
+def parse_report_key(key):
+    """
+    (cognito_sub, report_id) of an uploaded report.
+    Key format: medimind/reports/<cognito_sub>/<report_id>_<uploaded_at>.pdf
+    """
+    parts = key.split("/")
+    return parts[2], parts[3].split("_")[0]
+
+
+def set_status(report_id, cognito_sub, status, error_message=None, condition=None, values=None):
+    names = {"#st": "status"}
+    update = "SET #st = :s, status_updated_at = :t"
+    attribute_values = {":s": status, ":t": str(int(time.time()))}
+    if error_message is not None:
+        update += ", error_message = :e"
+        attribute_values[":e"] = error_message
+    kwargs = {}
+    if condition:
+        kwargs["ConditionExpression"] = condition
+        attribute_values.update(values or {})
+    dynamodb.Table(MEDIMIND_TABLE).update_item(
+        Key={"report_id": report_id, "cognito_sub": cognito_sub},
+        UpdateExpression=update,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=attribute_values,
+        **kwargs,
+    )
+
+
+def enqueue_report(bucket, key):
+    cognito_sub, report_id = parse_report_key(key)
+    # Marked before sending, so a fast worker's "processing" is never overwritten
+    try:
+        set_status(report_id, cognito_sub, "queued",
+                   condition="attribute_not_exists(#st) OR #st = :pending", values={":pending": "pending"})
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        print(f"[DIAGNOSE] Report {report_id} is past pending; queueing without a status change")
+
+    sqs_client.send_message(
+        QueueUrl=DIAGNOSIS_QUEUE_URL,
+        MessageBody=json.dumps({"bucket": bucket, "key": key}),
+    )
+    print(f"[DIAGNOSE] Queued report {report_id} for diagnosis")
+    return cors_response(202, {"report_id": report_id, "cognito_sub": cognito_sub, "status": "queued"})
+
+
+def retry_delay(attempt):
+    return min(DIAGNOSIS_RETRY_DELAY * 2 ** (attempt - 1), DIAGNOSIS_MAX_RETRY_DELAY)
+
+
+def requeue(body, attempts, delay=0):
+    """
+    Send a report back as a new message carrying its attempt count. Unlike
+    returning the message this spends none of its receives, so a report that
+    only waited behind others never drifts toward the dead-letter queue.
+    """
+    try:
+        sqs_client.send_message(
+            QueueUrl=DIAGNOSIS_QUEUE_URL,
+            MessageBody=json.dumps({**body, "attempts": attempts}),
+            DelaySeconds=delay,
+        )
+        return True
+    except ClientError as e:
+        print(f"[DIAGNOSE] Could not requeue {body.get('key')}: {e}")
+        return False
+
+
+def mark_failed(body, reason):
+    try:
+        cognito_sub, report_id = parse_report_key(body["key"])
+        set_status(report_id, cognito_sub, "failed", reason)
+    except (KeyError, IndexError) as e:
+        print(f"[DIAGNOSE] Message has no report key: {e}")
+    except ClientError as e:
+        print(f"[DIAGNOSE] Could not mark {body.get('key')} failed: {e}")
+
+
+def give_up(message, body, reason):
+    """Mark the report failed and park it in the dead-letter queue; False if it must be returned instead"""
+    print(f"[DIAGNOSE] Giving up on {body.get('key')}: {reason}")
+    mark_failed(body, reason)
+    if not DIAGNOSIS_DEAD_LETTER_QUEUE_URL:
+        return True
+    try:
+        sqs_client.send_message(QueueUrl=DIAGNOSIS_DEAD_LETTER_QUEUE_URL, MessageBody=message["body"])
+        return True
+    except ClientError as e:
+        print(f"[DIAGNOSE] Could not dead-letter {body.get('key')}: {e}")
+        return False
+
+
+def read_message(message):
+    """(body, receives, attempts) of a queue message; body is None when it is malformed"""
+    receives = int(message.get("attributes", {}).get("ApproximateReceiveCount", "1"))
+    try:
+        body = json.loads(message["body"])
+        return body, receives, int(body.get("attempts", 0)) + receives - 1
+    except (AttributeError, TypeError, ValueError) as e:
+        print(f"[DIAGNOSE] Message {message['messageId']} is malformed: {e}")
+        return None, receives, 0
+
+
+def process_queue_batch(records, context):
+    """
+    Diagnose a batch of queued reports one after another, returning the
+    partial batch response.
+
+    Reports are never returned to the queue on purpose: one that fails or is
+    skipped for lack of time is sent again as a new message. Only a message
+    that could not be re-sent goes back, and if that spends its last receive
+    the report is marked failed first, so nothing reaches the dead-letter
+    queue still "queued". Receives beyond the first mean an earlier delivery
+    never reported back (the function timed out or crashed); they count as
+    attempts too.
+    """
+    failures = []
+
+    def send_back(message, body, receives):
+        failures.append({"itemIdentifier": message["messageId"]})
+        if receives >= DIAGNOSIS_MAX_RECEIVES:
+            mark_failed(body, f"Diagnosis could not be requeued after {receives} deliveries")
+
+    for position, message in enumerate(records):
+        remaining_ms = context.get_remaining_time_in_millis() if context else DIAGNOSIS_MIN_REMAINING_MS
+        if remaining_ms < DIAGNOSIS_MIN_REMAINING_MS:
+            print(f"[DIAGNOSE] {remaining_ms}ms left; requeueing {len(records) - position} reports")
+            for skipped in records[position:]:
+                skipped_body, skipped_receives, skipped_attempts = read_message(skipped)
+                if skipped_body is None:
+                    failures.append({"itemIdentifier": skipped["messageId"]})
+                elif not requeue(skipped_body, skipped_attempts):
+                    send_back(skipped, skipped_body, skipped_receives)
+            break
+
+        body, receives, attempts = read_message(message)
+        if body is None:
+            # Nothing to mark; the redrive policy dead-letters it
+            failures.append({"itemIdentifier": message["messageId"]})
+            continue
+
+        if attempts >= DIAGNOSIS_MAX_ATTEMPTS:
+            if not give_up(message, body, f"Diagnosis did not finish in {attempts} attempts"):
+                failures.append({"itemIdentifier": message["messageId"]})
+            continue
+        if receives >= DIAGNOSIS_MAX_RECEIVES:
+            # One more timeout would dead-letter this copy mid-run; carry on in a fresh one
+            if not requeue(body, attempts):
+                send_back(message, body, receives)
+            continue
+
+        try:
+            response = diagnose_report(body["bucket"], body["key"])
+            status_code = response["statusCode"]
+            error = json.loads(response["body"]).get("message", "")
+        except Exception as e:
+            print(f"[DIAGNOSE] Message {message['messageId']} failed: {e}")
+            status_code, error = 500, str(e)
+
+        if status_code < 500:
+            continue
+
+        attempts += 1
+        if attempts >= DIAGNOSIS_MAX_ATTEMPTS:
+            if not give_up(message, body, f"Diagnosis failed after {attempts} attempts: {error}"):
+                failures.append({"itemIdentifier": message["messageId"]})
+            continue
+
+        delay = retry_delay(attempts)
+        if not requeue(body, attempts, delay):
+            send_back(message, body, receives)
+            continue
+        print(f"[DIAGNOSE] {body.get('key')} failed attempt {attempts}; retrying in {delay}s")
+        try:
+            cognito_sub, report_id = parse_report_key(body["key"])
+            set_status(report_id, cognito_sub, "queued", error)
+        except (KeyError, IndexError):
+            pass
+        except ClientError as e:
+            print(f"[DIAGNOSE] Could not update status of {body.get('key')}: {e}")
+
+    print(f"[DIAGNOSE] Batch of {len(records)}: {len(failures)} returned to the queue")
+    return {"batchItemFailures": failures}
+
+
+# ============================================================
+# Lambda Handler — upload events, then batches from the intake queue
 # ============================================================
+@profiled("diagnose")
 def lambda_handler(event, context):
     print(f"[DIAGNOSE] Event received: {json.dumps(event)}")
 
+    records = event.get("Records") or []
+    if records and records[0].get("eventSource") == "aws:sqs":
+        return process_queue_batch(records, context)
+
     # ---------------------------
-    # Parse S3 Event
+    # Parse Upload Event
     # ---------------------------
     try:
-        record = event["Records"][0]
-        bucket = record["s3"]["bucket"]["name"]
-        key = record["s3"]["object"]["key"]
+        bucket, key = s3_object(event)
     except (KeyError, IndexError) as e:
         print(f"[DIAGNOSE] Invalid S3 event: {e}")
         return cors_response(400, {"message": "Invalid S3 event structure"})
 
+    if not DIAGNOSIS_QUEUE_URL:
+        return diagnose_report(bucket, key)
+
+    try:
+        return enqueue_report(bucket, key)
+    except (IndexError, ValueError) as e:
+        print(f"[DIAGNOSE] Could not parse S3 key {key}: {e}")
+        return cors_response(400, {"message": f"Unexpected S3 key format: {key}"})
+    except ClientError as e:
+        # Raised so the asynchronous invocation is retried
+        print(f"[DIAGNOSE] Could not queue s3://{bucket}/{key}: {e}")
+        raise
+
+
+# ============================================================
+# Diagnose One Report
+# ============================================================
+def diagnose_report(bucket, key):
     print(f"[DIAGNOSE] Processing file: s3://{bucket}/{key}")
 
     # ---------------------------
     # Parse cognito_sub and report_id from S3 key
-    # Key format: medimind/reports/<cognito_sub>/<report_id>_<uploaded_at>.pdf
     # ---------------------------
     try:
-        parts = key.split("/")
-        cognito_sub = parts[2]
-        filename = parts[3]
-        report_id = filename.split("_")[0]
+        cognito_sub, report_id = parse_report_key(key)
     except (IndexError, ValueError) as e:
         print(f"[DIAGNOSE] Could not parse S3 key {key}: {e}")
         return cors_response(400, {"message": f"Unexpected S3 key format: {key}"})
 
     print(f"[DIAGNOSE] cognito_sub={cognito_sub}, report_id={report_id}")
+    set_profile_task(report_id)
 
     # ---------------------------
     # Update DynamoDB status → processing
     # ---------------------------
     table = dynamodb.Table(MEDIMIND_TABLE)
+    # Sex and age recorded at upload select the reference ranges
+    patient = {}
+    observed_at = int(time.time())
 
     try:
-        table.update_item(
+        response = table.update_item(
             Key={"report_id": report_id, "cognito_sub": cognito_sub},
-            UpdateExpression="SET #st = :s",
+            UpdateExpression="SET #st = :s, status_updated_at = :t",
+            # Queue delivery is at-least-once; a repeat of a finished report is skipped
+            ConditionExpression="attribute_not_exists(#st) OR #st <> :done",
             ExpressionAttributeNames={"#st": "status"},
-            ExpressionAttributeValues={":s": "processing"},
+            ExpressionAttributeValues={":s": "processing", ":t": str(int(time.time())), ":done": "completed"},
+            ReturnValues="ALL_NEW",
         )
+        report = response.get("Attributes", {})
+        patient = {"sex": report.get("patient_sex"), "age": report.get("patient_age")}
+        observed_at = int(report.get("uploaded_at") or observed_at)
     except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            print(f"[DIAGNOSE] Report {report_id} is already diagnosed; skipping")
+            return cors_response(200, {"report_id": report_id, "cognito_sub": cognito_sub, "status": "completed"})
         print(f"[DIAGNOSE] DynamoDB status update failed: {e}")
 
     # ---------------------------
     # Extract Text from PDF via Textract
     # ---------------------------
     try:
-        report_text = extract_text_from_pdf(bucket, key)
+        report_text, lab_rows, extraction, content_sha256 = extract_text_from_pdf(bucket, key)
     except Exception as e:
         print(f"[DIAGNOSE] Textract failed: {e}")
         table.update_item(
@@ -260,7 +978,7 @@ def lambda_handler(event, context):
         )
         return cors_response(500, {"message": f"Text extraction failed: {str(e)}"})
 
-    if not report_text.strip():
+    if not report_text.strip() and not lab_rows:
         table.update_item(
             Key={"report_id": report_id, "cognito_sub": cognito_sub},
             UpdateExpression="SET #st = :s, error_message = :e",
@@ -270,10 +988,74 @@ def lambda_handler(event, context):
         return cors_response(400, {"message": "No readable text found in the uploaded PDF"})
 
     # ---------------------------
-    # Analyze with Bedrock
+    # Preliminary Flags (rules, before the LLM)
     # ---------------------------
+    lab_rows = flag_results(lab_rows, **patient)
+    preliminary_flags = [row for row in lab_rows if is_abnormal(row)]
+    print(f"[DIAGNOSE] {len(preliminary_flags)} of {len(lab_rows)} lab results flagged")
+
+    if lab_rows:
+        try:
+            table.update_item(
+                Key={"report_id": report_id, "cognito_sub": cognito_sub},
+                UpdateExpression="SET lab_results = :lr, preliminary_flags = :pf",
+                ExpressionAttributeValues={
+                    ":lr": to_dynamo(lab_rows),
+                    ":pf": to_dynamo(preliminary_flags),
+                },
+            )
+        except ClientError as e:
+            print(f"[DIAGNOSE] Could not save preliminary flags: {e}")
+
+    # ---------------------------
+    # Lab Series and Trends
+    # ---------------------------
+    lab_trends = ""
+    known_analytes = {row["analyte"] for row in lab_rows if row.get("known")}
+    # Points are dated by when the sample was taken: the report's collection
+    # (or report) date, else the upload. An old report uploaded today must not
+    # read as the newest result
+    sampled_at = report_date(report_text, not_after=observed_at + lab_series.DAY_SECONDS)
+    if sampled_at:
+        observed_at = sampled_at
+    if known_analytes and lab_series.enabled():
+        try:
+            # A same-user re-upload records nothing, so its trends (and with them
+            # the diagnosis settings below) match the first upload's
+            stored = lab_series.record_points(cognito_sub, report_id, observed_at, lab_rows, content_sha256)
+            points = lab_series.load_points(
+                cognito_sub,
+                since=observed_at - TREND_WINDOW_DAYS * lab_series.DAY_SECONDS,
+                until=observed_at,
+                analytes=known_analytes,
+            )
+            lab_trends = lab_series.trend_summary(lab_series.build_series(points, max_points=12))
+            print(f"[DIAGNOSE] Stored {stored} lab values; {len(lab_trends.splitlines())} analytes have earlier results")
+        except ClientError as e:
+            print(f"[DIAGNOSE] Lab series unavailable: {e}")
+
+    # ---------------------------
+    # Analyze with Bedrock (or reuse the diagnosis of the same bytes)
+    # ---------------------------
+    # The flagged rows carry the patient's reference ranges, so a stored
+    # diagnosis is only reused for a patient the report flags the same way
+    diagnosis_settings = {
+        "version": CONTENT_VERSION,
+        "model": MODEL_ID,
+        "chunked": CHUNKED_DIAGNOSIS,
+        "extraction": extraction_settings(REPORT_CHAR_BUDGET, LAB_TABLE_EXTRACTION or CHUNKED_DIAGNOSIS,
+                                          LAB_TABLE_EXTRACTION),
+        "lab_results": lab_rows,
+        "lab_trends": lab_trends,
+    }
+    diagnosis = load_content(content_sha256, "diagnosis", diagnosis_settings)
+    diagnosis_reused = diagnosis is not None
+
     try:
-        diagnosis = analyze_medical_report(report_text)
+        if not diagnosis_reused:
+            diagnosis = analyze_medical_report(report_text, lab_rows, lab_trends)
+            if diagnosis:
+                save_content(content_sha256, "diagnosis", diagnosis_settings, diagnosis)
     except Exception as e:
         print(f"[DIAGNOSE] Bedrock analysis failed: {e}")
         table.update_item(
@@ -300,7 +1082,11 @@ def lambda_handler(event, context):
                     reasons = :r,
                     details = :det,
                     safety_measures = :sm,
-                    disclaimer = :disc
+                    disclaimer = :disc,
+                    extraction = :ex,
+                    content_sha256 = :ch,
+                    diagnosis_reused = :dr,
+                    lab_trends = :lt
             """,
             ExpressionAttributeNames={"#st": "status"},
             ExpressionAttributeValues={
@@ -312,6 +1098,10 @@ def lambda_handler(event, context):
                 ":det": diagnosis.get("details", {}),
                 ":sm": diagnosis.get("safety_measures", []),
                 ":disc": diagnosis.get("disclaimer", ""),
+                ":ex": extraction,
+                ":ch": content_sha256 or "",
+                ":dr": diagnosis_reused,
+                ":lt": lab_trends,
             },
         )
         print(f"[DIAGNOSE] Diagnosis saved to DynamoDB for report_id={report_id}")
@@ -329,6 +1119,12 @@ def lambda_handler(event, context):
             "cognito_sub": cognito_sub,
             "diagnosed_at": diagnosed_at,
             "status": "completed",
+            "extraction": extraction,
+            "content_sha256": content_sha256 or "",
+            "diagnosis_reused": diagnosis_reused,
+            "lab_results": lab_rows,
+            "preliminary_flags": preliminary_flags,
+            "lab_trends": lab_trends,
             "diagnosis": {
                 "primary_disease": diagnosis.get("primary_disease", {}),
                 "secondary_disease": diagnosis.get("secondary_disease", {}),
@@ -1,5 +1,470 @@
-def lambda_handler(event, context):
+"""
+XYLA INSIGHTS — MediMind Report Download Lambda
+Renders a diagnosed MediMind report for download and hands back a short-lived
+presigned GET URL.
+
+  GET ?report_id=<id>&format=pdf|json
+
+Rendered files are cached in S3 by report and diagnosis time:
+
+  s3://<S3_BUCKET>/medimind/exports/<cognito_sub>/<report_id>/<diagnosed_at>.<format>
+
+The record remembers which diagnosis each format was last rendered from
+(export_pdf / export_json), so a repeat download costs one projected
+get_item and a locally signed URL. A new diagnosis changes diagnosed_at and
+the next download renders again. Rendering streams into a multipart upload,
+so the file is never held in memory whole.
+"""
+import os
+import json
+import textwrap
+from decimal import Decimal
+from datetime import datetime, timezone
+import boto3
+from botocore.exceptions import ClientError
+
+from auth_middleware import authenticate
+from lab_results import FLAG_MARKS
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+s3_client = boto3.client("s3")
+
+# Environment Variables
+MEDIMIND_TABLE = os.environ["MEDIMIND_TABLE"]
+S3_BUCKET = os.environ["S3_BUCKET_NAME"]
+EXPORT_PREFIX = "medimind/exports"
+DOWNLOAD_URL_TTL = int(os.environ.get("DOWNLOAD_URL_TTL", "300"))
+
+# S3 parts must be at least 5 MiB, except the last
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "json": "application/json",
+}
+
+# Fields copied into the JSON export
+EXPORT_FIELDS = [
+    "report_id", "uploaded_at", "diagnosed_at", "patient_sex", "patient_age",
+    "primary_disease", "secondary_disease", "reasons", "details", "safety_measures",
+    "disclaimer", "lab_results", "preliminary_flags", "extraction", "content_sha256",
+]
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body):
     return {
-        "statusCode": 200,
-        "body": "Hello from download_report Lambda!"
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Methods": "GET,OPTIONS",
+        },
+        "body": json.dumps(body, default=_json_default),
     }
+
+
+def _json_default(value):
+    # DynamoDB numbers come back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+# ============================================================
+# Streaming Multipart Upload
+# ============================================================
+class MultipartUpload:
+    """
+    Write-only file object backed by an S3 multipart upload. Only the part
+    being filled is buffered; the upload is completed on a clean exit from the
+    with block and aborted otherwise, so no orphaned parts are left behind.
+    """
+
+    def __init__(self, bucket, key, content_type, filename, part_size=UPLOAD_PART_SIZE):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.parts = []
+        self.buffer = bytearray()
+        self.position = 0
+        self.upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            ContentType=content_type,
+            ContentDisposition=f'attachment; filename="{filename}"',
+        )["UploadId"]
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def tell(self):
+        return self.position
+
+    def _upload_part(self, body):
+        part_number = len(self.parts) + 1
+        response = s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        try:
+            s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except ClientError as e:
+            print(f"[DOWNLOAD] Could not abort upload of {self.key}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.complete()
+        else:
+            self.abort()
+        return False
+
+
+# ============================================================
+# PDF Writer
+# ============================================================
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+FOOTER_Y = 30
+
+# Built-in fonts, so nothing has to be embedded: (resource, base font, average glyph width in em)
+FONTS = {
+    "body": ("F1", "Helvetica", 0.52),
+    "bold": ("F2", "Helvetica-Bold", 0.56),
+    "mono": ("F3", "Courier", 0.6),
+}
+
+
+def _pdf_string(text):
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PdfWriter:
+    """
+    Text-only PDF written object by object to a stream. Pages are emitted as
+    soon as they fill, so only the current page's lines and the object offsets
+    are kept in memory; the page tree and xref table are written at the end.
+    """
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self, out, footer=""):
+        self.out = out
+        self.footer = footer
+        self.offsets = {}
+        self.page_ids = []
+        self.font_ids = {}
+        self.next_id = 3
+        self.lines = []
+        self.y = PAGE_HEIGHT - MARGIN
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        for resource, base_font, _ in FONTS.values():
+            self.font_ids[resource] = self._write_object(
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % base_font.encode()
+            )
+
+    def _write_object(self, body, number=None):
+        if number is None:
+            number = self.next_id
+            self.next_id += 1
+        self.offsets[number] = self.out.tell()
+        self.out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        return number
+
+    # ---------------------------
+    # Layout
+    # ---------------------------
+    def text(self, text, style="body", size=10, indent=0, space_before=0):
+        """Wrapped text; blank lines in text are kept as paragraph breaks"""
+        _, _, glyph_width = FONTS[style]
+        columns = max(10, int((PAGE_WIDTH - 2 * MARGIN - indent) / (size * glyph_width)))
+        self.y -= space_before
+        for paragraph in str(text).split("\n"):
+            for line in textwrap.wrap(paragraph, columns, replace_whitespace=False) or [""]:
+                self.line(line, style, size, indent)
+
+    def bullets(self, items, size=10):
+        _, _, glyph_width = FONTS["body"]
+        columns = max(10, int((PAGE_WIDTH - 2 * MARGIN - 10) / (size * glyph_width)))
+        for item in items:
+            for i, line in enumerate(textwrap.wrap(str(item), columns) or [""]):
+                self.line(f"• {line}" if i == 0 else line, "body", size, 0 if i == 0 else 10)
+
+    def line(self, text, style="body", size=10, indent=0):
+        leading = size * 1.35
+        if self.y - leading < MARGIN:
+            self.new_page()
+        self.y -= leading
+        self.lines.append((FONTS[style][0], size, MARGIN + indent, self.y, text))
+
+    def new_page(self):
+        if not self.lines:
+            return
+        page_number = len(self.page_ids) + 1
+        footer = f"{self.footer}    Page {page_number}".strip()
+        self.lines.append(("F1", 8, MARGIN, FOOTER_Y, footer))
+
+        commands = [
+            b"BT /%s %g Tf 1 0 0 1 %g %g Tm %s Tj ET" % (font.encode(), size, x, y, _pdf_string(text))
+            for font, size, x, y, text in self.lines
+        ]
+        stream = b"\n".join(commands)
+        content_id = self._write_object(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        fonts = b" ".join(b"/%s %d 0 R" % (name.encode(), number) for name, number in self.font_ids.items())
+        self.page_ids.append(self._write_object(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> /Contents %d 0 R >>"
+            % (self.PAGES, PAGE_WIDTH, PAGE_HEIGHT, fonts, content_id)
+        ))
+        self.lines = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def close(self):
+        self.new_page()
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._write_object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_ids)), self.PAGES)
+        self._write_object(b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES, self.CATALOG)
+
+        xref = self.out.tell()
+        self.out.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for number in range(1, self.next_id):
+            self.out.write(b"%010d 00000 n \n" % self.offsets[number])
+        self.out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, self.CATALOG, xref))
+
+
+# ============================================================
+# Report Rendering
+# ============================================================
+def _date(timestamp):
+    try:
+        return datetime.fromtimestamp(int(timestamp), timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    except (TypeError, ValueError):
+        return ""
+
+
+def _disease_line(disease):
+    if not isinstance(disease, dict) or not disease.get("name"):
+        return ""
+    label = disease.get("confidence_label") or (f"{disease['confidence']}% confident" if disease.get("confidence") else "")
+    return f"{disease['name']} ({label})" if label else disease["name"]
+
+
+def _lab_table_lines(rows):
+    """Fixed-width lines for the monospaced lab results table"""
+    header = f"{'Analyte':<30} {'Result':<18} {'Unit':<12} {'Reference':<20} Flag"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        result = row.get("value_text", "")
+        if row.get("converted"):
+            result = f"{result} (= {row['converted']})"
+        lines.append(
+            f"{str(row.get('name', ''))[:30]:<30} {result[:18]:<18} {str(row.get('unit', ''))[:12]:<12} "
+            f"{str(row.get('reference', ''))[:20]:<20} {FLAG_MARKS.get(row.get('flag'), '')}"
+        )
+    return lines
+
+
+def render_pdf(record, out):
+    details = record.get("details") or {}
+    pdf = PdfWriter(out, footer=f"MediMind report {record['report_id']}")
+
+    pdf.text("MediMind Diagnosis Report", "bold", 18)
+    pdf.text(
+        f"Report {record['report_id']}    Uploaded {_date(record.get('uploaded_at'))}    "
+        f"Diagnosed {_date(record.get('diagnosed_at'))}",
+        size=9, space_before=4,
+    )
+
+    pdf.text("Diagnosis", "bold", 13, space_before=14)
+    pdf.text(f"Primary: {_disease_line(record.get('primary_disease')) or 'None identified'}", space_before=2)
+    secondary = _disease_line(record.get("secondary_disease"))
+    if secondary:
+        pdf.text(f"Secondary: {secondary}")
+    if details.get("severity"):
+        pdf.text(f"Severity: {details['severity']}")
+
+    if record.get("reasons"):
+        pdf.text("Supporting Findings", "bold", 13, space_before=14)
+        pdf.bullets(record["reasons"])
+
+    if details.get("description"):
+        pdf.text("About the Condition", "bold", 13, space_before=14)
+        pdf.text(details["description"], space_before=2)
+        for label, field in (("Affected organs", "affected_organs"), ("Common symptoms", "common_symptoms"),
+                             ("Risk factors", "risk_factors")):
+            if details.get(field):
+                pdf.text(f"{label}: {', '.join(map(str, details[field]))}", space_before=4)
+
+    lab_rows = record.get("lab_results") or []
+    if lab_rows:
+        flagged = sum(1 for row in lab_rows if row.get("flag"))
+        pdf.text("Lab Results", "bold", 13, space_before=14)
+        pdf.text(f"{flagged} of {len(lab_rows)} results outside the reference range "
+                 "(H high, L low, HH/LL critical, * abnormal as printed)", size=9, space_before=2)
+        for line in _lab_table_lines(lab_rows):
+            pdf.line(line, "mono", 7.5)
+
+    if record.get("safety_measures"):
+        pdf.text("Recommended Next Steps", "bold", 13, space_before=14)
+        pdf.bullets(record["safety_measures"])
+
+    if record.get("disclaimer"):
+        pdf.text(record["disclaimer"], size=8, space_before=18)
+    pdf.close()
+
+
+def render_json(record, out):
+    document = {field: record.get(field) for field in EXPORT_FIELDS if field in record}
+    for chunk in json.JSONEncoder(indent=2, default=_json_default).iterencode(document):
+        out.write(chunk)
+
+
+RENDERERS = {
+    "pdf": render_pdf,
+    "json": render_json,
+}
+
+
+# ============================================================
+# Export Cache
+# ============================================================
+def export_key(cognito_sub, report_id, diagnosed_at, fmt):
+    return f"{EXPORT_PREFIX}/{cognito_sub}/{report_id}/{diagnosed_at}.{fmt}"
+
+
+def get_report_status(table, report_id, cognito_sub):
+    """The small read every download makes: status, diagnosis time and what was last rendered"""
+    response = table.get_item(
+        Key={"report_id": report_id, "cognito_sub": cognito_sub},
+        ProjectionExpression="report_id, #st, diagnosed_at, export_pdf, export_json",
+        ExpressionAttributeNames={"#st": "status"},
+    )
+    return response.get("Item")
+
+
+def render_export(table, report_id, cognito_sub, diagnosed_at, fmt, key):
+    record = table.get_item(Key={"report_id": report_id, "cognito_sub": cognito_sub}).get("Item") or {}
+    if record.get("diagnosed_at") != diagnosed_at:
+        # Re-diagnosed between the two reads; render what is stored now
+        diagnosed_at = record.get("diagnosed_at", diagnosed_at)
+        key = export_key(cognito_sub, report_id, diagnosed_at, fmt)
+
+    with MultipartUpload(S3_BUCKET, key, CONTENT_TYPES[fmt], f"medimind-{report_id}.{fmt}") as upload:
+        RENDERERS[fmt](record, upload)
+    print(f"[DOWNLOAD] Rendered {fmt} for report {report_id} ({upload.tell()} bytes) to s3://{S3_BUCKET}/{key}")
+
+    table.update_item(
+        Key={"report_id": report_id, "cognito_sub": cognito_sub},
+        UpdateExpression="SET #ex = :da",
+        ExpressionAttributeNames={"#ex": f"export_{fmt}"},
+        ExpressionAttributeValues={":da": diagnosed_at},
+    )
+    return key
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Handle CORS Preflight
+    # ---------------------------
+    if event.get("httpMethod") == "OPTIONS":
+        return cors_response(200, {"message": "CORS preflight success"})
+
+    # ---------------------------
+    # Authenticate User
+    # ---------------------------
+    cognito_sub, _user, auth_error = authenticate(event)
+    if auth_error:
+        return cors_response(*auth_error)
+
+    params = event.get("queryStringParameters") or {}
+    report_id = (params.get("report_id") or "").strip()
+    fmt = (params.get("format") or "pdf").strip().lower()
+    if not report_id:
+        return cors_response(400, {"message": "Missing required parameter: report_id"})
+    if fmt not in RENDERERS:
+        return cors_response(400, {"message": f"format must be one of: {', '.join(RENDERERS)}"})
+
+    # ---------------------------
+    # Report Status
+    # ---------------------------
+    table = dynamodb.Table(MEDIMIND_TABLE)
+
+    try:
+        report = get_report_status(table, report_id, cognito_sub)
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
+    if not report:
+        return cors_response(404, {"message": "Report not found"})
+    if report.get("status") != "completed":
+        return cors_response(409, {"message": "Report has not been diagnosed yet", "status": report.get("status")})
+
+    diagnosed_at = report["diagnosed_at"]
+    key = export_key(cognito_sub, report_id, diagnosed_at, fmt)
+    cached = report.get(f"export_{fmt}") == diagnosed_at
+
+    # ---------------------------
+    # Render on First Download
+    # ---------------------------
+    if not cached:
+        try:
+            key = render_export(table, report_id, cognito_sub, diagnosed_at, fmt, key)
+        except ClientError as e:
+            print(f"[DOWNLOAD] Rendering {fmt} for report {report_id} failed: {e}")
+            return cors_response(500, {"message": f"Failed to render report: {str(e)}"})
+
+    # ---------------------------
+    # Presigned Download URL
+    # ---------------------------
+    try:
+        download_url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=DOWNLOAD_URL_TTL,
+        )
+    except ClientError as e:
+        return cors_response(500, {"message": f"Failed to generate download URL: {str(e)}"})
+
+    return cors_response(
+        200,
+        {
+            "report_id": report_id,
+            "format": fmt,
+            "download_url": download_url,
+            "expires_in": DOWNLOAD_URL_TTL,
+            "cached": cached,
+        },
+    )
@@ -1,5 +1,295 @@
-def lambda_handler(event, context):
+"""
+XYLA INSIGHTS — MediMind Record Lambda
+Read API over medimind-db-table for the calling user.
+
+  GET ?report_id=<id>                          full record and diagnosis of one report
+  GET ?limit=&cursor=&status=a,b&from=&to=     the user's reports, newest first
+  GET ?analytes=hba1c,ldl&from=&to=&points=    lab value series and trends across reports
+
+Listing queries the cognito_sub-index GSI (range key uploaded_at) with a
+projection of summary fields, so a history page is one small query rather
+than a read of every full record. from/to (epoch seconds or YYYY-MM-DD)
+bound uploaded_at in the key condition; status is a filter. The cursor is
+an opaque encoding of LastEvaluatedKey. Trends come from the lab series
+table (lab_series): one query for the window (the past year by default),
+downsampled to at most `points` per analyte. Every response carries an
+ETag; a request whose If-None-Match matches gets an empty 304.
+"""
+import os
+import json
+import time
+import base64
+import hashlib
+from decimal import Decimal
+from datetime import datetime, timezone, timedelta
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+from auth_middleware import authenticate
+from lab_results import analyte_key
+import lab_series
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+
+# Environment Variables
+MEDIMIND_TABLE = os.environ["MEDIMIND_TABLE"]
+HISTORY_INDEX = "cognito_sub-index"
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("HISTORY_DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "100"))
+# Upper bound on GSI pages read to fill one filtered page
+MAX_QUERY_PAGES = 5
+
+SUMMARY_FIELDS = [
+    "report_id", "#st", "uploaded_at", "diagnosed_at",
+    "primary_disease.#nm", "primary_disease.confidence",
+]
+FIELD_NAMES = {"#st": "status", "#nm": "name"}
+
+DEFAULT_TREND_DAYS = 365
+DEFAULT_TREND_POINTS = 24
+MAX_TREND_POINTS = 200
+MAX_TREND_ANALYTES = 20
+
+# Internal bookkeeping left out of the full record
+HIDDEN_FIELDS = {"s3_key", "export_pdf", "export_json"}
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body, extra_headers=None):
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "Content-Type,Authorization,If-None-Match",
+        "Access-Control-Allow-Methods": "GET,OPTIONS",
+        "Access-Control-Expose-Headers": "ETag",
+    }
+    headers.update(extra_headers or {})
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": json.dumps(body, default=_json_default) if body is not None else "",
+    }
+
+
+def _json_default(value):
+    # DynamoDB numbers come back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def conditional_response(headers, body):
+    """200 with an ETag, or an empty 304 when the client already has this body"""
+    payload = json.dumps(body, default=_json_default, sort_keys=True)
+    etag = '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = headers.get("If-None-Match") or headers.get("if-none-match") or ""
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return cors_response(304, None, cache_headers)
+    return cors_response(200, body, cache_headers)
+
+
+# ============================================================
+# Parameter Helpers
+# ============================================================
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor, cognito_sub):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    # A cursor is only valid for the user it was issued to
+    if not isinstance(key, dict) or key.get("cognito_sub") != cognito_sub:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def parse_timestamp(value, end_of_day=False):
+    """uploaded_at bound (epoch seconds, as stored) from epoch seconds or YYYY-MM-DD"""
+    value = value.strip()
+    if value.isdigit():
+        return value
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value} (use epoch seconds or YYYY-MM-DD)")
+    if end_of_day:
+        day += timedelta(days=1, seconds=-1)
+    return str(int(day.timestamp()))
+
+
+def uploaded_condition(cognito_sub, uploaded_from, uploaded_to):
+    condition = Key("cognito_sub").eq(cognito_sub)
+    # uploaded_at is a string of epoch seconds; same width, so string order is time order
+    if uploaded_from and uploaded_to:
+        return condition & Key("uploaded_at").between(uploaded_from, uploaded_to)
+    if uploaded_from:
+        return condition & Key("uploaded_at").gte(uploaded_from)
+    if uploaded_to:
+        return condition & Key("uploaded_at").lte(uploaded_to)
+    return condition
+
+
+# ============================================================
+# Queries
+# ============================================================
+def list_reports(cognito_sub, limit, cursor=None, statuses=None, uploaded_from=None, uploaded_to=None):
+    table = dynamodb.Table(MEDIMIND_TABLE)
+    kwargs = {
+        "IndexName": HISTORY_INDEX,
+        "KeyConditionExpression": uploaded_condition(cognito_sub, uploaded_from, uploaded_to),
+        "ScanIndexForward": False,
+        "ProjectionExpression": ", ".join(SUMMARY_FIELDS),
+        "ExpressionAttributeNames": dict(FIELD_NAMES),
+    }
+    if statuses:
+        kwargs["FilterExpression"] = Attr("status").is_in(statuses)
+    if cursor:
+        kwargs["ExclusiveStartKey"] = cursor
+
+    items = []
+    last_key = None
+    for _ in range(MAX_QUERY_PAGES):
+        kwargs["Limit"] = limit - len(items)
+        response = table.query(**kwargs)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key or len(items) >= limit:
+            break
+        kwargs["ExclusiveStartKey"] = last_key
+
+    return [summarize(item) for item in items], last_key
+
+
+def summarize(item):
+    disease = item.get("primary_disease") or {}
     return {
-        "statusCode": 200,
-        "body": "Hello from medimind_record Lambda!"
+        "report_id": item.get("report_id"),
+        "status": item.get("status"),
+        "uploaded_at": item.get("uploaded_at"),
+        "diagnosed_at": item.get("diagnosed_at"),
+        "primary_disease": disease.get("name"),
+        "confidence": disease.get("confidence"),
     }
+
+
+def get_report(cognito_sub, report_id):
+    response = dynamodb.Table(MEDIMIND_TABLE).get_item(Key={"report_id": report_id, "cognito_sub": cognito_sub})
+    item = response.get("Item")
+    if item is None:
+        return None
+    return {field: value for field, value in item.items() if field not in HIDDEN_FIELDS}
+
+
+def get_trends(cognito_sub, analytes, since, until, max_points):
+    points = lab_series.load_points(cognito_sub, since, until, analytes)
+    series = lab_series.build_series(points, max_points)
+    # Requested analytes without results are listed empty rather than left out
+    for analyte in analytes:
+        series.setdefault(analyte, {"name": lab_series.display_name(analyte), "unit": "", "trend": None, "points": []})
+    return series
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Handle CORS Preflight
+    # ---------------------------
+    if event.get("httpMethod") == "OPTIONS":
+        return cors_response(200, {"message": "CORS preflight success"})
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    headers = event.get("headers") or {}
+    cognito_sub, _user, auth_error = authenticate(event)
+    if auth_error:
+        return cors_response(*auth_error)
+
+    params = event.get("queryStringParameters") or {}
+
+    # ---------------------------
+    # Single Report
+    # ---------------------------
+    report_id = (params.get("report_id") or "").strip()
+    if report_id:
+        try:
+            report = get_report(cognito_sub, report_id)
+        except ClientError as e:
+            return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+        if not report:
+            return cors_response(404, {"message": "Report not found"})
+        return conditional_response(headers, {"report": report})
+
+    # ---------------------------
+    # Lab Value Trends
+    # ---------------------------
+    if params.get("analytes"):
+        analytes = sorted({analyte_key(name) for name in params["analytes"].split(",") if name.strip()})
+        if len(analytes) > MAX_TREND_ANALYTES:
+            return cors_response(400, {"message": f"At most {MAX_TREND_ANALYTES} analytes per request"})
+        try:
+            max_points = max(3, min(int(params.get("points") or DEFAULT_TREND_POINTS), MAX_TREND_POINTS))
+            until = int(parse_timestamp(params["to"], end_of_day=True)) if params.get("to") else int(time.time())
+            since = int(parse_timestamp(params["from"])) if params.get("from") else until - DEFAULT_TREND_DAYS * 86400
+        except ValueError as e:
+            return cors_response(400, {"message": str(e)})
+
+        try:
+            series = get_trends(cognito_sub, analytes, since, until, max_points)
+        except ClientError as e:
+            return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+        return conditional_response(headers, {"from": str(since), "to": str(until), "series": series})
+
+    # ---------------------------
+    # Report History
+    # ---------------------------
+    try:
+        limit = int(params.get("limit") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        return cors_response(400, {"message": "limit must be an integer"})
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    statuses = [s.strip() for s in (params.get("status") or "").split(",") if s.strip()]
+
+    try:
+        uploaded_from = parse_timestamp(params["from"]) if params.get("from") else None
+        uploaded_to = parse_timestamp(params["to"], end_of_day=True) if params.get("to") else None
+    except ValueError as e:
+        return cors_response(400, {"message": str(e)})
+
+    cursor = None
+    if params.get("cursor"):
+        try:
+            cursor = decode_cursor(params["cursor"], cognito_sub)
+        except ValueError as e:
+            return cors_response(400, {"message": str(e)})
+
+    try:
+        items, last_key = list_reports(cognito_sub, limit, cursor, statuses, uploaded_from, uploaded_to)
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
+    return conditional_response(
+        headers,
+        {
+            "reports": items,
+            "count": len(items),
+            "next_cursor": encode_cursor(last_key),
+        },
+    )
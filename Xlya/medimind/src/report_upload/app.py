@@ -1,10 +1,16 @@
 import os
+import re
 import json
 import uuid
 import time
+import base64
+from datetime import date
 import boto3
+from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
 
+from auth_middleware import authenticate
+
 # AWS Clients
 dynamodb = boto3.resource("dynamodb")
 s3_client = boto3.client("s3")
@@ -13,6 +19,11 @@ s3_client = boto3.client("s3")
 MEDIMIND_TABLE = os.environ["MEDIMIND_TABLE"]
 S3_BUCKET = os.environ["S3_BUCKET_NAME"]
 S3_PREFIX = "medimind/reports"
+USER_INDEX = "cognito_sub-index"
+
+# Optional client-computed SHA-256 of the PDF (hex)
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+MAX_QUERY_PAGES = 10
 
 
 # ============================================================
@@ -31,6 +42,50 @@ def cors_response(status_code, body):
     }
 
 
+# ============================================================
+# Patient Details (select the diagnosis reference ranges)
+# ============================================================
+def patient_age(user):
+    if user.get("age") not in (None, ""):
+        try:
+            return int(user["age"])
+        except (TypeError, ValueError):
+            pass
+    try:
+        born = date.fromisoformat(str(user.get("dateofbirth", ""))[:10])
+    except ValueError:
+        return None
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+# ============================================================
+# Duplicate Uploads
+# ============================================================
+def find_duplicate(cognito_sub, content_sha256, patient_sex, patient_age):
+    """
+    The user's latest completed report of the same PDF bytes, diagnosed for the
+    same sex and age (which select the reference ranges), or None. Only the
+    user's own reports are searched, since the hash comes from the client.
+    """
+    table = dynamodb.Table(MEDIMIND_TABLE)
+    kwargs = {
+        "IndexName": USER_INDEX,
+        "KeyConditionExpression": Key("cognito_sub").eq(cognito_sub),
+        "FilterExpression": Attr("content_sha256").eq(content_sha256) & Attr("status").eq("completed"),
+        "ScanIndexForward": False,
+    }
+    for _ in range(MAX_QUERY_PAGES):
+        response = table.query(**kwargs)
+        for item in response.get("Items", []):
+            if item.get("patient_sex", "") == patient_sex and item.get("patient_age") == patient_age:
+                return item
+        if not response.get("LastEvaluatedKey"):
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return None
+
+
 # ============================================================
 # Lambda Handler
 # ============================================================
@@ -43,30 +98,48 @@ def lambda_handler(event, context):
         return cors_response(200, {"message": "CORS preflight success"})
 
     # ---------------------------
-    # Get Cognito Sub from Authorization Header
+    # Authenticate User
     # ---------------------------
-    headers = event.get("headers") or {}
-    auth_header = headers.get("Authorization") or headers.get("authorization")
-    if not auth_header:
-        return cors_response(401, {"message": "Unauthorized: Missing Authorization header"})
+    cognito_sub, user, auth_error = authenticate(event, attributes=["age", "dateofbirth", "gender"])
+    if auth_error:
+        return cors_response(*auth_error)
+
+    try:
+        body = json.loads(event.get("body") or "{}")
+    except (json.JSONDecodeError, TypeError):
+        return cors_response(400, {"message": "Invalid JSON body"})
+
+    content_sha256 = str(body.get("content_sha256", "")).strip().lower()
+    if content_sha256 and not SHA256_PATTERN.match(content_sha256):
+        return cors_response(400, {"message": "content_sha256 must be a hex SHA-256 digest"})
 
-    if auth_header.lower().startswith("bearer "):
-        cognito_sub = auth_header.split(" ", 1)[1]
-    else:
-        cognito_sub = auth_header
+    patient_sex = str(user.get("gender") or "")
+    age = patient_age(user)
 
     # ---------------------------
-    # Fetch user from DynamoDB
+    # Short-circuit a Re-upload
     # ---------------------------
-    users_table = dynamodb.Table("users-table")
-
-    try:
-        response = users_table.get_item(Key={"cognito_sub": cognito_sub})
-        user = response.get("Item")
-        if not user:
-            return cors_response(404, {"message": "User not found"})
-    except ClientError as e:
-        return cors_response(500, {"message": "Failed to fetch user", "error": str(e)})
+    if content_sha256:
+        try:
+            duplicate = find_duplicate(cognito_sub, content_sha256, patient_sex, age)
+        except ClientError as e:
+            print(f"[UPLOAD] Duplicate lookup failed, uploading: {e}")
+            duplicate = None
+
+        if duplicate:
+            print(f"[UPLOAD] {content_sha256[:12]} already diagnosed as report {duplicate['report_id']}")
+            return cors_response(
+                200,
+                {
+                    "report_id": duplicate["report_id"],
+                    "uploaded_at": duplicate.get("uploaded_at", ""),
+                    "presigned_url": None,
+                    "s3_key": duplicate.get("s3_key", ""),
+                    "status": "completed",
+                    "duplicate": True,
+                    "message": "This report has already been diagnosed; no upload is needed.",
+                },
+            )
 
     # ---------------------------
     # Generate Report ID & Timestamp
@@ -78,17 +151,21 @@ def lambda_handler(event, context):
     # Generate Pre-Signed URL for PDF Upload
     # ---------------------------
     s3_key = f"{S3_PREFIX}/{cognito_sub}/{report_id}_{uploaded_at}.pdf"
+    params = {
+        "Bucket": S3_BUCKET,
+        "Key": s3_key,
+        "ContentType": "application/pdf",
+    }
+    upload_headers = {"Content-Type": "application/pdf"}
+    if content_sha256:
+        # S3 rejects bytes that do not match the hash, and keeps it as the
+        # object's checksum so diagnose can look the report up without downloading it
+        checksum = base64.b64encode(bytes.fromhex(content_sha256)).decode("ascii")
+        params["ChecksumSHA256"] = checksum
+        upload_headers["x-amz-checksum-sha256"] = checksum
 
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            "put_object",
-            Params={
-                "Bucket": S3_BUCKET,
-                "Key": s3_key,
-                "ContentType": "application/pdf",
-            },
-            ExpiresIn=300,
-        )
+        presigned_url = s3_client.generate_presigned_url("put_object", Params=params, ExpiresIn=300)
     except ClientError as e:
         return cors_response(500, {"message": f"Failed to generate pre-signed URL: {str(e)}"})
 
@@ -105,6 +182,9 @@ def lambda_handler(event, context):
                 "uploaded_at": uploaded_at,
                 "s3_key": s3_key,
                 "status": "pending",
+                "patient_sex": patient_sex,
+                "patient_age": age,
+                "content_sha256": content_sha256,
             }
         )
     except ClientError as e:
@@ -119,8 +199,10 @@ def lambda_handler(event, context):
             "report_id": report_id,
             "uploaded_at": uploaded_at,
             "presigned_url": presigned_url,
+            "upload_headers": upload_headers,
             "s3_key": s3_key,
             "status": "pending",
+            "duplicate": False,
             "message": "Pre-signed URL generated. Upload your PDF to the provided URL.",
         },
     )
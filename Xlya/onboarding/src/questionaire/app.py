@@ -2,6 +2,8 @@ import boto3
 import os
 import json
 
+from auth_middleware import authenticate, invalidate_user
+
 dynamodb = boto3.resource('dynamodb')
 users_table = dynamodb.Table(os.environ['USERS_TABLE'])
 onboarding_table = dynamodb.Table(os.environ['ONBOARDING_TABLE'])
@@ -21,20 +23,14 @@ QUESTIONS = {
 
 ONBOARDING_QUESTION = "How will you use Xlya?"
 
-def lambda_handler(event, context):
-    cognito_sub = event.get("headers", {}).get("Authorization")
-    if not cognito_sub:
-        return response(401, {"message": "Missing Authorization header"})
+USER_FIELDS = ["onboarding_status", "user_type"]
 
-    # Get user from database
-    try:
-        user_response = users_table.get_item(Key={"cognito_sub": cognito_sub})
-        if "Item" not in user_response:
-            return response(404, {"message": "User not found"})
-        
-        user = user_response["Item"]
-    except Exception as e:
-        return response(500, {"message": f"Error fetching user: {str(e)}"})
+def lambda_handler(event, context):
+    # fresh: onboarding_status gates the flow and is written by this handler,
+    # so a cached copy from another container could replay q1
+    cognito_sub, user, auth_error = authenticate(event, attributes=USER_FIELDS, fresh=True)
+    if auth_error:
+        return response(*auth_error)
 
     # Parse body
     body = {}
@@ -76,6 +72,8 @@ def lambda_handler(event, context):
             )
         except Exception as e:
             return response(500, {"message": f"Error updating user: {str(e)}"})
+        finally:
+            invalidate_user(cognito_sub)
         
         # Save Q1 to onboarding table
         try:
@@ -4,6 +4,9 @@ import base64
 from datetime import datetime
 from decimal import Decimal
 import os
+from botocore.exceptions import ClientError
+
+from auth_middleware import get_cognito_sub, invalidate_user
 
 # ---------------------------
 # DynamoDB Setup
@@ -22,17 +25,10 @@ def lambda_handler(event, context):
     # ---------------------------
     # Get Cognito Sub from Authorization Header (like onboarding Lambda)
     # ---------------------------
-    headers = event.get("headers") or {}
-    auth_header = headers.get("Authorization") or headers.get("authorization")
-    if not auth_header:
+    cognito_sub = get_cognito_sub(event)
+    if not cognito_sub:
         return cors_response(401, {"message": "Unauthorized: Missing Authorization header"})
 
-    # Use the raw value from header directly (no strict Bearer check)
-    if auth_header.lower().startswith("bearer "):
-        cognito_sub = auth_header.split(" ", 1)[1]
-    else:
-        cognito_sub = auth_header
-
     # ---------------------------
     # Parse Body robustly
     # ---------------------------
@@ -98,16 +94,26 @@ def lambda_handler(event, context):
     # ---------------------------
     # DynamoDB Update
     # ---------------------------
+    # The condition replaces a separate existence lookup and keeps unknown
+    # subs from creating stray user items
     try:
         result = table.update_item(
             Key={"cognito_sub": cognito_sub},
             UpdateExpression="SET " + ", ".join(update_expression),
+            ConditionExpression="attribute_exists(cognito_sub)",
             ExpressionAttributeNames=expression_names,
             ExpressionAttributeValues=expression_values,
             ReturnValues="UPDATED_NEW"
         )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return cors_response(404, {"message": "User not found"})
+        return cors_response(500, {"message": "Failed to update user profile", "error": str(e)})
     except Exception as e:
         return cors_response(500, {"message": "Failed to update user profile", "error": str(e)})
+    finally:
+        # Cached lookups in this container must not outlive the write
+        invalidate_user(cognito_sub)
 
     # ---------------------------
     # Success Response
@@ -1,14 +1,8 @@
 import json
-import boto3
 import base64
 from decimal import Decimal
-import os
 
-# ---------------------------
-# DynamoDB Setup
-# ---------------------------
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['USERS_TABLE'])  # Set this env variable in Lambda
+from auth_middleware import authenticate
 
 # ---------------------------
 # Editable/Return Fields
@@ -27,29 +21,13 @@ def lambda_handler(event, context):
         return cors_response(200, {"message": "CORS preflight success"})
 
     # ---------------------------
-    # Get Cognito Sub from Authorization Header
+    # Authenticate and Fetch Profile Fields
     # ---------------------------
-    headers = event.get("headers") or {}
-    auth_header = headers.get("Authorization") or headers.get("authorization")
-    if not auth_header:
-        return cors_response(401, {"message": "Unauthorized: Missing Authorization header"})
-
-    # Use the raw value from header directly (no strict Bearer check)
-    if auth_header.lower().startswith("bearer "):
-        cognito_sub = auth_header.split(" ", 1)[1]
-    else:
-        cognito_sub = auth_header
-
-    # ---------------------------
-    # Fetch user from DynamoDB
-    # ---------------------------
-    try:
-        response = table.get_item(Key={"cognito_sub": cognito_sub})
-        user = response.get("Item")
-        if not user:
-            return cors_response(404, {"message": "User not found"})
-    except Exception as e:
-        return cors_response(500, {"message": "Failed to fetch user", "error": str(e)})
+    # fresh: the profile page must show what personal-info just wrote,
+    # possibly from another container
+    cognito_sub, user, auth_error = authenticate(event, attributes=profile_fields, fresh=True)
+    if auth_error:
+        return cors_response(*auth_error)
 
     # ---------------------------
     # Prepare response body
@@ -0,0 +1,136 @@
+"""
+XYLA INSIGHTS — Admission Controller Lambda
+Frees pipeline slots and dispatches queued tasks in weighted fair order.
+
+Invoked by:
+  - EventBridge, when a seo-aeo-geo-SM execution finishes: release its slot
+  - a one-minute schedule: reap expired leases
+  - the batch state machine (waitForTaskToken): {"action": "acquire", ...}
+  - the batch state machine on failure paths: {"action": "release", ...}
+
+Every invocation ends with a dispatch pass, so a freed slot is handed to the
+next queued task straight away. A queued task that cannot be started is
+marked failed (and a waiting batch item gets a task failure) rather than lost.
+"""
+import json
+import boto3
+from botocore.exceptions import ClientError
+
+from admission import try_admit, enqueue, release, reap_expired_leases, dispatch, ADMITTED, ALREADY_CLAIMED
+from auth_middleware import get_user
+from ws_helper import report_progress, flush_progress_on_exit
+
+# AWS Clients
+s3_client = boto3.client("s3")
+stepfunctions_client = boto3.client("stepfunctions")
+
+EXECUTION_STATUS_CHANGE = "Step Functions Execution Status Change"
+SCHEDULED_EVENT = "Scheduled Event"
+
+
+# ============================================================
+# Dispatch Actions
+# ============================================================
+def run_action(queued, action):
+    """Start a task that has just been admitted from the queue"""
+    if action["type"] == "start_file":
+        # Same TXT file the orchestrator writes; its upload triggers the crawler
+        s3_client.put_object(
+            Bucket=action["bucket"],
+            Key=action["key"],
+            Body=action["body"].encode("utf-8"),
+            ContentType="text/plain",
+        )
+    elif action["type"] == "start_execution":
+        # Resumed task: its crawl is checkpointed, so the pipeline starts directly
+        stepfunctions_client.start_execution(
+            stateMachineArn=action["state_machine_arn"],
+            name=action["name"],
+            input=action["input"],
+        )
+    elif action["type"] == "task_token":
+        stepfunctions_client.send_task_success(
+            taskToken=action["token"],
+            output=json.dumps({"admitted": True, "task_id": queued["task_id"]}),
+        )
+    else:
+        raise ValueError(f"Unknown dispatch action: {action['type']}")
+    print(f"[AdmissionController] Dispatched task {queued['task_id']} ({action['type']})")
+
+
+def fail_action(queued, action, error):
+    """A dequeued task that could not be started: nothing else will start it"""
+    if action.get("type") == "task_token":
+        # The batch item's Catch releases the slot and records the failure
+        stepfunctions_client.send_task_failure(
+            taskToken=action["token"],
+            error="Admission.DispatchFailed",
+            cause=str(error)[:256],
+        )
+        return
+    report_progress(
+        queued["task_id"], "failed", None,
+        f"Could not start queued analysis: {error}",
+        cognito_sub=queued["cognito_sub"],
+    )
+
+
+# ============================================================
+# Event Handlers
+# ============================================================
+def _acquire(event):
+    task_id = event["task_id"]
+    cognito_sub = event["cognito_sub"]
+    token = event["task_token"]
+
+    outcome = try_admit(cognito_sub, task_id)
+    if outcome in (ADMITTED, ALREADY_CLAIMED):
+        stepfunctions_client.send_task_success(
+            taskToken=token,
+            output=json.dumps({"admitted": True, "task_id": task_id}),
+        )
+        return
+
+    try:
+        user = get_user(cognito_sub, attributes=["coins"]) or {}
+    except ClientError as e:
+        print(f"[AdmissionController] Coins lookup failed for {cognito_sub}: {e}")
+        user = {}
+    enqueue(cognito_sub, task_id, {"type": "task_token", "token": token}, coins=user.get("coins", 0))
+
+
+def _release_finished_execution(event):
+    detail = event.get("detail") or {}
+    try:
+        execution_input = json.loads(detail.get("input") or "{}")
+    except json.JSONDecodeError:
+        execution_input = {}
+
+    task_id = execution_input.get("task_id")
+    cognito_sub = (execution_input.get("metadata") or {}).get("cognito_sub")
+    if not task_id or not cognito_sub:
+        print(f"[AdmissionController] Execution {detail.get('executionArn')} has no task to release")
+        return
+    print(f"[AdmissionController] Execution for task {task_id} ended: {detail.get('status')}")
+    release(cognito_sub, task_id)
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+@flush_progress_on_exit
+def lambda_handler(event, context):
+    action = event.get("action")
+    detail_type = event.get("detail-type")
+
+    if action == "acquire":
+        _acquire(event)
+    elif action == "release":
+        release(event["cognito_sub"], event["task_id"])
+    elif detail_type == EXECUTION_STATUS_CHANGE:
+        _release_finished_execution(event)
+    elif detail_type == SCHEDULED_EVENT:
+        reap_expired_leases()
+
+    dispatched = dispatch(run_action, on_failure=fail_action)
+    return {"dispatched": dispatched}
@@ -6,6 +6,12 @@ import time
 import random
 import traceback
 
+from checkpoint import checkpointed
+from metrics import instrumented, timed_call
+
+
+@instrumented("aeo")
+@checkpointed("aeo")
 def lambda_handler(event, context):
     """
     Input from Step Functions (output of Crawl Lambda):
@@ -39,6 +45,7 @@ def lambda_handler(event, context):
         "task_id": task_id,
         "message": "Running AEO analysis with AI...",
         "aeo_data": aeo_result,
+        "degraded": bool(aeo_result.get("degraded")),
         "crawl_data": crawl_data,  # Pass through for next Lambdas
         "metadata": metadata        # Pass through for next Lambdas
     }
@@ -49,12 +56,14 @@ def call_bedrock_with_retry(bedrock_runtime, model_id, request_body, max_retries
     
     for attempt in range(max_retries):
         try:
-            response = bedrock_runtime.invoke_model(
-                modelId=model_id,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps(request_body)
-            )
+            with timed_call("bedrock") as call:
+                response = bedrock_runtime.invoke_model(
+                    modelId=model_id,
+                    contentType='application/json',
+                    accept='application/json',
+                    body=json.dumps(request_body)
+                )
+                call.record_usage(response)
             return response
             
         except Exception as e:
@@ -100,6 +109,7 @@ def _analyze_aeo(crawl_data, brand_name, keywords, industry):
 
     factors = {}
     recommendations = []
+    degraded = []
 
     # REDUCE TOKEN USAGE - truncate content to avoid throttling
     content_summary = crawl_data.get("markdown", "")[:2500]  # Reduced from 5000
@@ -210,6 +220,7 @@ Only return the JSON, no other text."""
     except Exception as e:
         print(f"[AEO] AI visibility check failed: {type(e).__name__}: {e}")
         print(traceback.format_exc())
+        degraded.append("ai_visibility")
 
         factors["ai_visibility"] = {
             "score": 50,
@@ -306,6 +317,7 @@ Only return the JSON, no other text."""
     except Exception as e:
         print(f"[AEO] FAQ check failed: {type(e).__name__}: {e}")
         print(traceback.format_exc())
+        degraded.append("faq_coverage")
 
         factors["faq_coverage"] = {
             "score": 40,
@@ -379,7 +391,8 @@ Only return the JSON, no other text."""
         "overall_score": round(overall_score, 1),
         "factors": factors,
         "recommendations": recommendations,
-        "summary": summary
+        "summary": summary,
+        "degraded": degraded,
     }
 
 
@@ -413,7 +426,8 @@ def _get_fallback_result(brand_name, crawl_data):
             "structured_answers": {"score": struct_score, "findings": [f"{len(question_headings)} question headings found"], "label": "Structured Answers"}
         },
         "recommendations": [],
-        "summary": f"{brand_name} AEO analysis incomplete - AI service unavailable"
+        "summary": f"{brand_name} AEO analysis incomplete - AI service unavailable",
+        "degraded": ["ai_visibility", "faq_coverage"],
     }
 
 
@@ -0,0 +1,221 @@
+"""
+XYLA INSIGHTS — Batch Orchestrator Lambda
+Accepts a list of site specs in one request, writes every task record with
+batched DynamoDB writes, and starts a single seo-aeo-geo-batch-SM execution
+that fans the sites out through a Map state (crawl, then the regular pipeline).
+
+A batch record (task_id "batch#<batch_id>") tracks aggregate progress; the
+state machine increments its completed/failed counters as each site finishes.
+"""
+import os
+import json
+import uuid
+import time
+import boto3
+from botocore.exceptions import ClientError
+
+from auth_middleware import authenticate
+from profiling import requested as profile_requested
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+stepfunctions_client = boto3.client("stepfunctions")
+
+# Tables
+ANALYZER_TABLE = "seo-aeo-geo-analyzer-table"
+
+BATCH_STATE_MACHINE_ARN = os.environ.get("BATCH_STATE_MACHINE_ARN", "")
+BATCH_MAX_SITES = int(os.environ.get("BATCH_MAX_SITES", "500"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "10"))
+
+BATCH_KEY_PREFIX = "batch#"
+REQUIRED_FIELDS = ("url", "brand_name", "keywords", "industry")
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Methods": "POST,OPTIONS",
+        },
+        "body": json.dumps(body),
+    }
+
+
+# ============================================================
+# Helpers
+# ============================================================
+def batch_key(batch_id):
+    return f"{BATCH_KEY_PREFIX}{batch_id}"
+
+
+def validate_sites(sites):
+    """Returns (clean_sites, errors); errors are per-index messages"""
+    clean, errors = [], []
+    for index, site in enumerate(sites):
+        if not isinstance(site, dict):
+            errors.append({"index": index, "message": "Site spec must be an object"})
+            continue
+        spec = {field: str(site.get(field, "")).strip() for field in REQUIRED_FIELDS}
+        missing = [field for field in REQUIRED_FIELDS if not spec[field]]
+        if missing:
+            errors.append({"index": index, "message": f"Missing required fields: {', '.join(missing)}"})
+            continue
+        clean.append(spec)
+    return clean, errors
+
+
+def write_task_records(analyzer_table, batch_id, cognito_sub, tasks, created_at):
+    # batch_writer groups puts into BatchWriteItem calls of 25 and retries unprocessed items
+    with analyzer_table.batch_writer() as writer:
+        writer.put_item(
+            Item={
+                "task_id": batch_key(batch_id),
+                "cognito_sub": cognito_sub,
+                "submitted_at": created_at,
+                "status": "queued",
+                "total": len(tasks),
+                "completed": 0,
+                "failed": 0,
+                "task_ids": [task["task_id"] for task in tasks],
+            }
+        )
+        for task in tasks:
+            writer.put_item(
+                Item={
+                    "task_id": task["task_id"],
+                    "cognito_sub": cognito_sub,
+                    "created_at": created_at,
+                    "url": task["url"],
+                    "brand_name": task["brand_name"],
+                    "keywords": task["keywords"],
+                    "industry": task["industry"],
+                    "profile": task["profile"],
+                    "batch_id": batch_id,
+                    "status": "queued",
+                    "progress": "0",
+                }
+            )
+
+
+def mark_batch_failed(analyzer_table, batch_id, cognito_sub, reason):
+    try:
+        analyzer_table.update_item(
+            Key={"task_id": batch_key(batch_id), "cognito_sub": cognito_sub},
+            UpdateExpression="SET #st = :s, status_message = :m",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={":s": "failed", ":m": reason},
+        )
+    except ClientError as e:
+        print(f"[BatchOrchestrator] Could not mark batch {batch_id} failed: {e}")
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    cognito_sub, _user, auth_error = authenticate(event)
+    if auth_error:
+        return cors_response(*auth_error)
+
+    # ---------------------------
+    # Parse Body
+    # ---------------------------
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except (json.JSONDecodeError, TypeError):
+        return cors_response(400, {"message": "Invalid JSON body"})
+
+    sites = body.get("sites")
+    if not isinstance(sites, list) or not sites:
+        return cors_response(400, {"message": "sites must be a non-empty list"})
+    if len(sites) > BATCH_MAX_SITES:
+        return cors_response(
+            400, {"message": f"A batch may contain at most {BATCH_MAX_SITES} sites"}
+        )
+
+    sites, errors = validate_sites(sites)
+    if errors:
+        return cors_response(400, {"message": "Invalid site specs", "errors": errors})
+
+    try:
+        max_concurrency = int(body.get("max_concurrency") or BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        return cors_response(400, {"message": "max_concurrency must be an integer"})
+    max_concurrency = max(1, min(max_concurrency, BATCH_MAX_CONCURRENCY))
+
+    # ---------------------------
+    # Generate IDs
+    # ---------------------------
+    batch_id = str(uuid.uuid4())[:8]
+    created_at = str(int(time.time()))
+    # "profile": true on the batch profiles every stage of every site
+    profile = profile_requested(body)
+    tasks = [{"task_id": str(uuid.uuid4())[:8], **site, "profile": profile} for site in sites]
+
+    # ---------------------------
+    # Store Records in DynamoDB
+    # ---------------------------
+    analyzer_table = dynamodb.Table(ANALYZER_TABLE)
+
+    try:
+        write_task_records(analyzer_table, batch_id, cognito_sub, tasks, created_at)
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
+    print(f"[BatchOrchestrator] Batch {batch_id}: {len(tasks)} task record(s) written")
+
+    # ---------------------------
+    # Start One Batch Execution
+    # ---------------------------
+    if not BATCH_STATE_MACHINE_ARN:
+        mark_batch_failed(analyzer_table, batch_id, cognito_sub, "Batch state machine not configured")
+        return cors_response(500, {"message": "BATCH_STATE_MACHINE_ARN not configured"})
+
+    execution_input = {
+        "batch_id": batch_id,
+        "batch_key": batch_key(batch_id),
+        "cognito_sub": cognito_sub,
+        "max_concurrency": max_concurrency,
+        "sites": [
+            {**task, "cognito_sub": cognito_sub, "batch_id": batch_id, "source": "batch"}
+            for task in tasks
+        ],
+    }
+
+    try:
+        response = stepfunctions_client.start_execution(
+            stateMachineArn=BATCH_STATE_MACHINE_ARN,
+            name=f"batch-{batch_id}",
+            input=json.dumps(execution_input),
+        )
+    except ClientError as e:
+        mark_batch_failed(analyzer_table, batch_id, cognito_sub, f"Failed to start: {e}")
+        return cors_response(500, {"message": f"Failed to start batch: {str(e)}"})
+
+    print(f"[BatchOrchestrator] Started batch execution: {response['executionArn']}")
+
+    # ---------------------------
+    # Success Response
+    # ---------------------------
+    return cors_response(
+        202,
+        {
+            "batch_id": batch_id,
+            "status": "queued",
+            "total": len(tasks),
+            "task_ids": [task["task_id"] for task in tasks],
+            "max_concurrency": max_concurrency,
+            "message": "Batch analysis started successfully.",
+        },
+    )
@@ -1,20 +1,45 @@
 """
 XYLA INSIGHTS — Competitor Analyzer Lambda
 Step Functions: Competitor discovery and comparison using DuckDuckGo + Claude 3 Haiku (Amazon Bedrock).
-Runs inside the Parallel state. Returns running status message.
+Runs inside the Parallel state. Competitor pages are crawled and scored with the
+same feature extractor and SEO rules as the brand; the LLM only adds the
+qualitative comparison.
 """
 import os
 import json
 import re
 import boto3
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 from duckduckgo_search import DDGS
 
+from rate_limit import get_limiter
+from ws_helper import report_progress, flush_progress_on_exit
+from page_features import crawl_page
+from seo_scoring import analyze_seo
+from competitor_store import CompetitorStore
+from checkpoint import checkpointed
+from metrics import instrumented, timed_call, record_cache, bind
+
 # Initialize Bedrock client
 bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
 MODEL_ID = "openai.gpt-oss-120b-1:0"
 
+# Competitor discovery searches every keyword (up to the cap) concurrently
+COMPETITOR_MAX_KEYWORDS = int(os.environ.get("COMPETITOR_MAX_KEYWORDS", "12"))
+COMPETITOR_MAX_CONCURRENCY = int(os.environ.get("COMPETITOR_MAX_CONCURRENCY", "4"))
+
+# Top competitors that get crawled and scored
+COMPETITOR_CRAWL_LIMIT = int(os.environ.get("COMPETITOR_CRAWL_LIMIT", "5"))
+COMPETITOR_CRAWL_TIMEOUT = float(os.environ.get("COMPETITOR_CRAWL_TIMEOUT", "15"))
+
+# Cross-tenant store of discovered competitors, keyed by (keyword, industry)
+_store = CompetitorStore()
+
 
+@flush_progress_on_exit
+@instrumented("competitor")
+@checkpointed("competitor")
 def lambda_handler(event, context):
     task_id = event["task_id"]
     
@@ -26,65 +51,288 @@ def lambda_handler(event, context):
     keywords_str = metadata.get("keywords", "")
     keywords = [kw.strip() for kw in keywords_str.split(",") if kw.strip()]
     industry = metadata.get("industry", "")
+    cognito_sub = metadata.get("cognito_sub")
+
+    # SeoAnalysis ran before the Parallel state; reuse its score for the brand
+    brand_seo = (event.get("seo_result") or {}).get("seo_data")
 
     print(f"[Competitor] Starting competitor analysis for task {task_id}")
+    report_progress(task_id, "analyzing_competitors", 70, "Analyzing competitors...", cognito_sub=cognito_sub)
+
+    competitor_result = _analyze_competitors(crawl_data, brand_name, keywords, industry, brand_seo)
+
+    report_progress(task_id, "analyzing_competitors", 80, f"Competitor analysis complete — {competitor_result['competitors_found']} competitors ✓", cognito_sub=cognito_sub)
 
-    # Return running status message as per requirement
     return {
-        "status": "running",
-        "message": "Running GEO analysis & AI presence scan...",
         "task_id": task_id,
-        "competitor_data": None  # Will be populated in subsequent execution
+        "message": "Running competitor analysis...",
+        "competitor_data": competitor_result,
     }
 
 
-def _analyze_competitors(crawl_data, brand_name, keywords, industry):
-    competitors = []
+def _analyze_competitors(crawl_data, brand_name, keywords, industry, brand_seo=None):
+    competitors = _discover_competitors(crawl_data, keywords, industry)
 
-    # --- Find competitors via DuckDuckGo ---
-    try:
-        ddgs = DDGS()
-        search_query = f"best {keywords[0]} {industry}" if keywords else f"best {industry}"
-        results = list(ddgs.text(search_query, max_results=10))
+    if not competitors:
+        return {
+            "competitors_found": 0,
+            "competitors": [],
+            "comparison": {},
+            "summary": f"No direct competitors found for {brand_name}.",
+            "recommendations": [{"priority": "low", "category": "Competitor Analysis", "action": "Unable to identify competitors — refine keywords"}],
+        }
+
+    # --- Competitor features from the store; crawl only stale or missing domains ---
+    records = _store.get_domains([c["domain"] for c in competitors])
+    fresh = sum(1 for c in competitors if (records.get(c["domain"]) or {}).get("fresh"))
+    record_cache("competitor_store", hit=True, count=fresh)
+    record_cache("competitor_store", hit=False, count=len(competitors) - fresh)
+    with ThreadPoolExecutor(max_workers=len(competitors)) as pool:
+        list(pool.map(bind(lambda comp: _measure_competitor(comp, keywords, records.get(comp["domain"]))), competitors))
+
+    if not brand_seo:
+        brand_seo = analyze_seo(crawl_data, keywords)
+    brand_seo_score = brand_seo.get("overall_score", 0)
+
+    measured = [c for c in competitors if c.get("seo_score") is not None]
+    ahead = sum(1 for c in measured if c["seo_score"] > brand_seo_score)
+    if not measured:
+        brand_position = "unknown"
+    elif ahead == 0:
+        brand_position = "top"
+    elif ahead >= len(measured):
+        brand_position = "bottom"
+    else:
+        brand_position = "middle"
+
+    # --- Qualitative notes per competitor: cached, or from a brand-neutral prompt ---
+    # Notes are shared across tenants, so they never come from a prompt that names the brand
+    cached_notes = {d: r for d, r in records.items() if r.get("strengths") is not None}
+    unprofiled = [c for c in measured if c["domain"] not in cached_notes or c.get("refreshed")]
+    new_notes = _profile_competitors(unprofiled) if unprofiled else {}
+    for domain, note in new_notes.items():
+        _store.put_notes(domain, note["strengths"], note["weaknesses"])
+    for comp in competitors:
+        note = new_notes.get(comp["domain"]) or cached_notes.get(comp["domain"]) or {}
+        comp["strengths"] = note.get("strengths") or []
+        comp["weaknesses"] = note.get("weaknesses") or []
 
-        brand_domain = urlparse(crawl_data.get("url", "")).netloc.lower()
-        seen = set()
+    # --- Brand comparison: from metrics when every note was cached, else the LLM ---
+    if measured and not unprofiled:
+        print("[Competitor] All competitor notes served from the store; skipping LLM comparison")
+        comparison, recommendations = _compare_from_metrics(brand_seo, measured)
+    else:
+        comparison, recommendations = _compare_competitors(crawl_data, brand_name, brand_seo_score, keywords, industry, competitors)
 
-        skip_domains = [
-            "wikipedia.org", "youtube.com", "reddit.com", "quora.com",
-            "facebook.com", "twitter.com", "linkedin.com", "instagram.com",
-            "amazon.com", brand_domain
-        ]
+    comparison["brand_position"] = brand_position
+    comparison["brand_seo_score"] = brand_seo_score
+    if measured:
+        comparison["competitor_avg_seo_score"] = round(sum(c["seo_score"] for c in measured) / len(measured), 1)
 
-        for r in results:
+    for comp in competitors:
+        comp.pop("refreshed", None)
+
+    return {
+        "competitors_found": len(competitors),
+        "competitors": competitors,
+        "comparison": comparison,
+        "recommendations": recommendations,
+        "summary": f"Found {len(competitors)} competitors for {brand_name}. Position: {brand_position} (SEO {brand_seo_score:.0f} vs {len(measured)} crawled competitors).",
+    }
+
+
+def _discover_competitors(crawl_data, keywords, industry):
+    # --- Find competitors: stored results per (keyword, industry), DuckDuckGo for stale ones ---
+    brand_domain = urlparse(crawl_data.get("url", "")).netloc.lower()
+    skip_domains = [
+        "wikipedia.org", "youtube.com", "reddit.com", "quora.com",
+        "facebook.com", "twitter.com", "linkedin.com", "instagram.com",
+        "amazon.com",
+    ] + ([brand_domain] if brand_domain else [])
+
+    search_terms = keywords[:COMPETITOR_MAX_KEYWORDS] or [""]
+    segments = _store.get_segments(search_terms, industry)
+    stale_terms = [kw for kw in search_terms if not segments.get(kw, {}).get("fresh")]
+    record_cache("competitor_segments", hit=True, count=len(search_terms) - len(stale_terms))
+    record_cache("competitor_segments", hit=False, count=len(stale_terms))
+    print(f"[Competitor] {len(search_terms) - len(stale_terms)}/{len(search_terms)} keyword segment(s) served from the store")
+
+    if stale_terms:
+        queries = [" ".join(f"best {kw} {industry}".split()) for kw in stale_terms]
+        with ThreadPoolExecutor(max_workers=min(COMPETITOR_MAX_CONCURRENCY, len(queries))) as pool:
+            searched = list(pool.map(bind(_search_competitors), queries))
+        for kw, results in zip(stale_terms, searched):
+            if results:
+                results = [{"href": r.get("href", ""), "title": r.get("title", ""), "body": r.get("body", "")[:200]} for r in results]
+                _store.put_segment(kw, industry, results)
+                segments[kw] = {"results": results, "fresh": True}
+            # A failed search falls back to whatever (stale) results the store had
+
+    result_sets = [segments.get(kw, {}).get("results", []) for kw in search_terms]
+
+    # Rank domains by how many keyword searches they appear in, then by best position
+    candidates = {}
+    for kw_index, results in enumerate(result_sets):
+        for position, r in enumerate(results):
             href = r.get("href", "")
             domain = urlparse(href).netloc.lower()
-            if domain and domain not in seen and not any(s in domain for s in skip_domains):
-                seen.add(domain)
-                competitors.append({
+            if not domain or any(s in domain for s in skip_domains):
+                continue
+            entry = candidates.get(domain)
+            if entry is None:
+                entry = candidates[domain] = {
                     "domain": domain,
                     "url": href,
                     "title": r.get("title", ""),
                     "description": r.get("body", "")[:200],
-                })
-            if len(competitors) >= 5:
-                break
+                    "matched_keywords": [],
+                    "_best_position": position,
+                }
+            entry["_best_position"] = min(entry["_best_position"], position)
+            if keywords and search_terms[kw_index] not in entry["matched_keywords"]:
+                entry["matched_keywords"].append(search_terms[kw_index])
+
+    ranked = sorted(candidates.values(), key=lambda c: (-len(c["matched_keywords"]), c["_best_position"]))
+    competitors = []
+    for comp in ranked[:COMPETITOR_CRAWL_LIMIT]:
+        comp.pop("_best_position")
+        competitors.append(comp)
+    return competitors
+
+
+def _measure_competitor(comp, keywords, record=None):
+    """Attach real SEO metrics (in place) from the store, or from a fresh crawl"""
+    if record and record["fresh"]:
+        features = record["features"]
+    else:
+        try:
+            with timed_call("http"):
+                features = crawl_page(comp["url"], timeout=COMPETITOR_CRAWL_TIMEOUT)
+            features, new_fingerprint = _store.put_domain(comp["domain"], features, previous=record)
+            comp["refreshed"] = not record or record.get("fingerprint") != new_fingerprint
+        except Exception as e:
+            print(f"[Competitor] Crawl failed for {comp['domain']}: {e}")
+            if not record:
+                comp.update({"seo_score": None, "crawl_error": str(e)[:200]})
+                return
+            features = record["features"]
+
+    # Scoring is pure CPU, so stored features are re-scored against this user's keywords
+    seo = analyze_seo(features, keywords)
+    comp.update({
+        "seo_score": seo["overall_score"],
+        "seo_factors": {k: v["score"] for k, v in seo["factors"].items()},
+        "metrics": {
+            "word_count": features["word_count"],
+            "h1_count": len(features["headings"]["h1"]),
+            "h2_count": len(features["headings"]["h2"]),
+            "internal_links": features["links"].get("internal", 0),
+            "images": features["images"]["total"],
+            "images_with_alt": features["images"]["with_alt"],
+            "schemas": [sd["type"] for sd in features["structured_data"]],
+            "has_canonical": features["has_canonical"],
+        },
+    })
+
+
+def _compare_from_metrics(brand_seo, measured):
+    """Comparison built from measured factor scores, used when no LLM call is needed"""
+    brand_factors = brand_seo.get("factors", {})
+    advantages = []
+    disadvantages = []
+    recommendations = []
+    for name, factor in brand_factors.items():
+        competitor_scores = [c["seo_factors"][name] for c in measured if name in c.get("seo_factors", {})]
+        if not competitor_scores:
+            continue
+        avg = sum(competitor_scores) / len(competitor_scores)
+        diff = factor["score"] - avg
+        label = factor.get("label", name)
+        if diff >= 10:
+            advantages.append(f"{label}: {factor['score']:.0f} vs competitor average {avg:.0f}")
+        elif diff <= -10:
+            disadvantages.append(f"{label}: {factor['score']:.0f} vs competitor average {avg:.0f}")
+            recommendations.append({"priority": "medium", "category": "Competitor Strategy", "action": f"Close the {label.lower()} gap with competitors (average {avg:.0f}/100)"})
+
+    comparison = {
+        "brand_advantages": advantages,
+        "brand_disadvantages": disadvantages,
+        "key_insights": [f"Compared against {len(measured)} crawled competitors on {len(brand_factors)} SEO factors"],
+    }
+    return comparison, recommendations
+
+
+def _profile_competitors(competitors):
+    """
+    {domain: {"strengths", "weaknesses"}} from each competitor's own page data.
+    The prompt carries no tenant input (brand, URL, keywords), so the notes can
+    be cached and served to every user of the store.
+    """
+    comp_lines = []
+    for c in competitors:
+        m = c["metrics"]
+        comp_lines.append(
+            f"- {c['domain']}: {c['title']} | {c.get('description', '')} | SEO {c['seo_score']}/100, "
+            f"{m['word_count']} words, {m['h2_count']} H2s, {m['images_with_alt']}/{m['images']} images with alt, "
+            f"{len(m['schemas'])} schemas ({', '.join(m['schemas']) or 'none'})"
+        )
+    comp_list = "\n".join(comp_lines)
+
+    prompt = f"""You are an SEO analyst. Describe the search-visibility strengths and weaknesses of each website below on its own terms, from its page data.
+Do not compare the sites with each other or with any other brand. The SEO scores were measured by crawling each site; do not re-estimate them.
+
+Websites:
+{comp_list}
+
+Return ONLY valid JSON, no other text:
+{{
+  "competitors": [
+    {{
+      "name": "domain",
+      "strengths": ["s1", "s2"],
+      "weaknesses": ["w1"]
+    }}
+  ]
+}}"""
+
+    try:
+        data = _parse_json(_invoke_model(prompt, max_tokens=1500))
     except Exception as e:
-        print(f"[Competitor] DuckDuckGo error: {e}")
+        print(f"[Competitor] Competitor profiling error: {e}")
+        return {}
+
+    domains = {c["domain"] for c in competitors}
+    notes = {}
+    for entry in data.get("competitors", []):
+        domain = str(entry.get("name", "")).lower()
+        if domain in domains:
+            notes[domain] = {
+                "strengths": [str(s) for s in entry.get("strengths") or []],
+                "weaknesses": [str(w) for w in entry.get("weaknesses") or []],
+            }
+    return notes
 
-    if not competitors:
-        return {
-            "competitors_found": 0,
-            "competitors": [],
-            "comparison": {},
-            "summary": f"No direct competitors found for {brand_name}.",
-            "recommendations": [{"priority": "low", "category": "Competitor Analysis", "action": "Unable to identify competitors — refine keywords"}],
-        }
 
-    # --- AI Competitive Analysis using Claude 3 Haiku ---
-    comp_list = "\n".join([f"- {c['domain']}: {c['title']}" for c in competitors[:5]])
+def _compare_competitors(crawl_data, brand_name, brand_seo_score, keywords, industry, competitors):
+    comp_lines = []
+    for c in competitors:
+        if c.get("seo_score") is None:
+            comp_lines.append(f"- {c['domain']}: {c['title']} (not crawlable)")
+        else:
+            m = c["metrics"]
+            comp_lines.append(
+                f"- {c['domain']}: {c['title']} | SEO {c['seo_score']}/100, {m['word_count']} words, "
+                f"{m['h2_count']} H2s, {len(m['schemas'])} schemas ({', '.join(m['schemas']) or 'none'})"
+            )
+            if c.get("strengths") or c.get("weaknesses"):
+                comp_lines.append(
+                    f"  strengths: {'; '.join(c.get('strengths') or []) or 'none noted'} | "
+                    f"weaknesses: {'; '.join(c.get('weaknesses') or []) or 'none noted'}"
+                )
+    comp_list = "\n".join(comp_lines)
 
-    prompt = f"""You are a competitive analysis expert. Compare "{brand_name}" ({crawl_data.get('url', '')}) against these competitors for "{keywords[0] if keywords else ''}" in "{industry}":
+    prompt = f"""You are a competitive analysis expert. Compare "{brand_name}" ({crawl_data.get('url', '')}) against these competitors for "{', '.join(keywords)}" in "{industry}".
+The SEO scores below were measured by crawling each site; do not re-estimate them.
 
 Competitors:
 {comp_list}
@@ -92,22 +340,12 @@ Competitors:
 Brand info:
 Title: {crawl_data.get('title', '')}
 Description: {crawl_data.get('description', '')}
+SEO score: {brand_seo_score}/100
 Content length: {crawl_data.get('word_count', 0)} words
 Structured data: {len(crawl_data.get('structured_data', []))} schemas
 
-Provide a competitive analysis in the following JSON format. Return ONLY valid JSON, no other text:
+Provide a qualitative competitive analysis in the following JSON format. Return ONLY valid JSON, no other text:
 {{
-  "competitors": [
-    {{
-      "name": "domain",
-      "estimated_seo_score": <0-100>,
-      "estimated_aeo_score": <0-100>,
-      "estimated_geo_score": <0-100>,
-      "strengths": ["s1", "s2"],
-      "weaknesses": ["w1"]
-    }}
-  ],
-  "brand_position": "top/middle/bottom",
   "brand_advantages": ["a1", "a2"],
   "brand_disadvantages": ["d1"],
   "key_insights": ["i1", "i2", "i3"],
@@ -115,17 +353,36 @@ Provide a competitive analysis in the following JSON format. Return ONLY valid J
 }}"""
 
     recommendations = []
-    comparison = {}
 
     try:
-        # Invoke Claude 3 Haiku via Bedrock
+        data = _parse_json(_invoke_model(prompt, max_tokens=1500))
+
+        comparison = {
+            "brand_advantages": data.get("brand_advantages", []),
+            "brand_disadvantages": data.get("brand_disadvantages", []),
+            "key_insights": data.get("key_insights", []),
+        }
+
+        for rec in data.get("strategic_recommendations", []):
+            recommendations.append({"priority": "medium", "category": "Competitor Strategy", "action": rec})
+            
+    except Exception as e:
+        print(f"[Competitor] AI analysis error: {e}")
+        comparison = {"brand_advantages": [], "brand_disadvantages": [], "key_insights": ["Competitive analysis was partially completed"]}
+
+    return comparison, recommendations
+
+
+def _invoke_model(prompt, max_tokens):
+    get_limiter("bedrock").acquire()
+    with timed_call("bedrock") as call:
         response = bedrock_runtime.invoke_model(
             modelId=MODEL_ID,
             contentType='application/json',
             accept='application/json',
             body=json.dumps({
                 "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2000,
+                "max_tokens": max_tokens,
                 "temperature": 0.3,
                 "messages": [
                     {
@@ -135,42 +392,19 @@ Provide a competitive analysis in the following JSON format. Return ONLY valid J
                 ]
             })
         )
-        
-        response_body = json.loads(response['body'].read())
-        ai_response = response_body['content'][0]['text']
-        
-        data = _parse_json(ai_response)
-
-        ai_comps = data.get("competitors", [])
-        for i, comp in enumerate(competitors[:5]):
-            if i < len(ai_comps):
-                comp.update(ai_comps[i])
-            else:
-                comp.update({"estimated_seo_score": 50, "estimated_aeo_score": 50, "estimated_geo_score": 50, "strengths": [], "weaknesses": []})
+        call.record_usage(response)
+    response_body = json.loads(response['body'].read())
+    return response_body['content'][0]['text']
 
-        comparison = {
-            "brand_position": data.get("brand_position", "middle"),
-            "brand_advantages": data.get("brand_advantages", []),
-            "brand_disadvantages": data.get("brand_disadvantages", []),
-            "key_insights": data.get("key_insights", []),
-        }
 
-        for rec in data.get("strategic_recommendations", []):
-            recommendations.append({"priority": "medium", "category": "Competitor Strategy", "action": rec})
-            
+def _search_competitors(query):
+    try:
+        get_limiter("ddg").acquire()
+        with timed_call("ddg"):
+            return list(DDGS().text(query, max_results=10))
     except Exception as e:
-        print(f"[Competitor] AI analysis error: {e}")
-        for comp in competitors:
-            comp.update({"estimated_seo_score": 50, "estimated_aeo_score": 50, "estimated_geo_score": 50, "strengths": [], "weaknesses": []})
-        comparison = {"brand_position": "unknown", "brand_advantages": [], "brand_disadvantages": [], "key_insights": ["Competitive analysis was partially completed"]}
-
-    return {
-        "competitors_found": len(competitors),
-        "competitors": competitors[:5],
-        "comparison": comparison,
-        "recommendations": recommendations,
-        "summary": f"Found {len(competitors)} competitors for {brand_name}. Position: {comparison.get('brand_position', 'N/A')}.",
-    }
+        print(f"[Competitor] DuckDuckGo error for '{query}': {e}")
+        return []
 
 
 def _parse_json(text):
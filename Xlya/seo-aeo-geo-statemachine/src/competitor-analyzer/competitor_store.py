@@ -0,0 +1,186 @@
+"""
+XYLA INSIGHTS — Competitor Intelligence Store
+Cross-tenant cache of competitor discovery and crawl results.
+
+Two kinds of items live in competitor-intel-table (hash key: store_key):
+
+  segment#<keyword>|<industry>   ranked DuckDuckGo results for that pair
+  domain#<domain>                compact page features, their fingerprint and
+                                 cached qualitative notes (strengths/weaknesses)
+
+Notes are shared by every tenant, so they must be written from a prompt that
+sees only the competitor's own page, never a requesting brand.
+
+Entries are fresh for COMPETITOR_STORE_TTL_HOURS; stale entries are still
+returned (flagged) so callers refresh only what is stale. DynamoDB TTL removes
+items nobody has refreshed for a long time.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import boto3
+from botocore.exceptions import ClientError
+
+COMPETITOR_STORE_TABLE = os.environ.get("COMPETITOR_STORE_TABLE", "competitor-intel-table")
+COMPETITOR_STORE_TTL_HOURS = float(os.environ.get("COMPETITOR_STORE_TTL_HOURS", "72"))
+
+# Items expire from the table entirely after this many freshness windows
+EXPIRY_MULTIPLIER = 10
+BATCH_GET_LIMIT = 100
+
+# Brand-neutral notes; the older notes_json was written from brand-relative
+# prompts and is ignored
+NOTES_ATTRIBUTE = "profile_notes_json"
+
+dynamodb = boto3.resource("dynamodb")
+
+
+def normalize(text):
+    text = re.sub(r"[^\w\s-]", " ", (text or "").lower())
+    return " ".join(text.split())
+
+
+def segment_key(keyword, industry):
+    return f"segment#{normalize(keyword)}|{normalize(industry)}"
+
+
+def domain_key(domain):
+    return f"domain#{domain.lower()}"
+
+
+def compact_features(features):
+    """Only the fields analyze_seo and the comparison need"""
+    headings = features.get("headings", {})
+    images = features.get("images", {})
+    return {
+        "url": features.get("url", ""),
+        "title": features.get("title", ""),
+        "description": features.get("description", ""),
+        "statusCode": features.get("statusCode", 0),
+        "headings": {"h1": headings.get("h1", []), "h2": headings.get("h2", [])},
+        "links": features.get("links", {}),
+        "images": {"total": images.get("total", 0), "with_alt": images.get("with_alt", 0)},
+        "structured_data": features.get("structured_data", []),
+        "has_robots_meta": features.get("has_robots_meta", False),
+        "has_canonical": features.get("has_canonical", False),
+        "has_sitemap_link": features.get("has_sitemap_link", False),
+        "word_count": features.get("word_count", 0),
+    }
+
+
+def fingerprint(features):
+    canonical = json.dumps(features, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class CompetitorStore:
+    def __init__(self, table_name=COMPETITOR_STORE_TABLE, ttl_hours=COMPETITOR_STORE_TTL_HOURS):
+        self.table_name = table_name
+        self.table = dynamodb.Table(table_name)
+        self.ttl_seconds = int(ttl_hours * 3600)
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+    def get_segments(self, keywords, industry):
+        """{keyword: {"results": [...], "fresh": bool}} for keywords present in the store"""
+        keys = {segment_key(kw, industry): kw for kw in keywords}
+        items = self._batch_get(list(keys))
+        segments = {}
+        for key, item in items.items():
+            segments[keys[key]] = {
+                "results": json.loads(item.get("results_json", "[]")),
+                "fresh": self._is_fresh(item),
+            }
+        return segments
+
+    def get_domains(self, domains):
+        """{domain: {"features", "fingerprint", "strengths", "weaknesses", "fresh"}}"""
+        keys = {domain_key(d): d for d in domains}
+        items = self._batch_get(list(keys))
+        records = {}
+        for key, item in items.items():
+            notes = json.loads(item.get(NOTES_ATTRIBUTE, "{}"))
+            records[keys[key]] = {
+                "features": json.loads(item.get("features_json", "{}")),
+                "fingerprint": item.get("fingerprint", ""),
+                "strengths": notes.get("strengths"),
+                "weaknesses": notes.get("weaknesses"),
+                "fresh": self._is_fresh(item),
+            }
+        return records
+
+    # ---------------------------
+    # Writes (best effort: a failed write only costs a future cache miss)
+    # ---------------------------
+    def put_segment(self, keyword, industry, results):
+        self._put({
+            "store_key": segment_key(keyword, industry),
+            "keyword": normalize(keyword),
+            "industry": normalize(industry),
+            "results_json": json.dumps(results, separators=(",", ":")),
+        })
+
+    def put_domain(self, domain, features, previous=None):
+        features = compact_features(features)
+        new_fingerprint = fingerprint(features)
+        item = {
+            "store_key": domain_key(domain),
+            "domain": domain.lower(),
+            "features_json": json.dumps(features, separators=(",", ":")),
+            "fingerprint": new_fingerprint,
+        }
+        # Qualitative notes survive a refresh only if the page did not change
+        if previous and previous.get("fingerprint") == new_fingerprint and previous.get("strengths") is not None:
+            item[NOTES_ATTRIBUTE] = json.dumps({"strengths": previous["strengths"], "weaknesses": previous["weaknesses"]})
+        self._put(item)
+        return features, new_fingerprint
+
+    def put_notes(self, domain, strengths, weaknesses):
+        try:
+            self.table.update_item(
+                Key={"store_key": domain_key(domain)},
+                UpdateExpression="SET #notes = :n",
+                ConditionExpression="attribute_exists(store_key)",
+                ExpressionAttributeNames={"#notes": NOTES_ATTRIBUTE},
+                ExpressionAttributeValues={":n": json.dumps({"strengths": strengths, "weaknesses": weaknesses})},
+            )
+        except ClientError as e:
+            print(f"[CompetitorStore] Notes write skipped for {domain}: {e}")
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+    def _is_fresh(self, item):
+        return time.time() - int(item.get("refreshed_at", 0)) < self.ttl_seconds
+
+    def _put(self, item):
+        now = int(time.time())
+        item["refreshed_at"] = now
+        item["expires_at"] = now + self.ttl_seconds * EXPIRY_MULTIPLIER
+        try:
+            self.table.put_item(Item=item)
+        except ClientError as e:
+            print(f"[CompetitorStore] Write failed for {item['store_key']}: {e}")
+
+    def _batch_get(self, keys):
+        items = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), BATCH_GET_LIMIT):
+            request = {self.table_name: {"Keys": [{"store_key": k} for k in unique_keys[i:i + BATCH_GET_LIMIT]]}}
+            attempt = 0
+            while request and attempt < 5:
+                try:
+                    response = dynamodb.batch_get_item(RequestItems=request)
+                except ClientError as e:
+                    print(f"[CompetitorStore] Batch read failed: {e}")
+                    return items
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    items[item["store_key"]] = item
+                request = response.get("UnprocessedKeys") or None
+                if request:
+                    attempt += 1
+                    time.sleep(0.05 * (2 ** attempt))
+        return items
@@ -3,6 +3,8 @@ XYLA INSIGHTS — Crawler Lambda
 Triggered by S3 upload of a TXT initialization file.
 Reads the TXT file, extracts task data, then crawls the website using Firecrawl API.
 After successful crawl, triggers the seo-aeo-geo-SM Step Functions state machine.
+When invoked by the batch state machine (source == "batch") the task comes from
+the event itself and the pipeline input is returned instead of started here.
 """
 
 import os
@@ -11,6 +13,22 @@ import time
 import boto3
 from botocore.exceptions import ClientError
 
+from ws_helper import report_progress, flush_progress_on_exit
+from admission import release
+from checkpoint import save as save_checkpoint, crawl_inputs
+from metrics import instrumented, set_task, timed_call
+from profiling import profiled, requested as profile_requested, set_task as set_profile_task
+from page_features import (
+    extract_headings,
+    extract_links,
+    extract_images,
+    extract_meta_tags,
+    extract_structured_data,
+    check_robots_meta,
+    check_canonical,
+    check_sitemap,
+)
+
 FIRECRAWL_API_KEY = os.environ.get("FIRECRAWL_API_KEY", "")
 S3_BUCKET = os.environ.get("S3_BUCKET", "")
 STATE_MACHINE_ARN = os.environ.get("STATE_MACHINE_ARN", "")
@@ -20,46 +38,34 @@ s3_client = boto3.client("s3")
 stepfunctions_client = boto3.client("stepfunctions")
 
 
+@flush_progress_on_exit
+@instrumented("crawl")
+@profiled("crawl")
 def lambda_handler(event, context):
     # ===============================
-    # 1️⃣ Get S3 Event Info
+    # 1️⃣ Resolve Task (S3 upload or batch Map item)
     # ===============================
-    record = event["Records"][0]
-    bucket_name = record["s3"]["bucket"]["name"]
-    object_key = record["s3"]["object"]["key"]
-
-    print(f"[Crawler] Triggered by S3 object: {object_key}")
-
-    # ===============================
-    # 2️⃣ Read TXT file from S3
-    # ===============================
-    try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-        file_content = response["Body"].read().decode("utf-8")
-    except Exception as e:
-        print(f"[Crawler] Failed to read file from S3: {e}")
-        raise e
-
-    print("[Crawler] File content loaded")
-
-    # ===============================
-    # 3️⃣ Parse TXT content
-    # ===============================
-    parsed_data = {}
-    for line in file_content.split("\n"):
-        if ":" in line:
-            key, value = line.split(":", 1)
-            parsed_data[key.strip().lower().replace(" ", "_")] = value.strip()
+    from_batch = event.get("source") == "batch"
+    if from_batch:
+        parsed_data = event
+        print(f"[Crawler] Invoked by batch {event.get('batch_id')}")
+    else:
+        parsed_data = _read_start_file(event)
 
     task_id = parsed_data.get("task_id")
+    cognito_sub = parsed_data.get("cognito_sub")
     url = parsed_data.get("url")
     brand_name = parsed_data.get("brand_name")
     keywords = parsed_data.get("keywords")
     industry = parsed_data.get("industry")
 
+    set_task(task_id, cognito_sub)
+    set_profile_task(task_id)
     print(f"[Crawler] Task ID: {task_id}")
     print(f"[Crawler] URL: {url}")
 
+    report_progress(task_id, "crawling", 10, "Crawling website...", cognito_sub=cognito_sub)
+
     # ===============================
     # 4️⃣ Start Crawling (FIXED)
     # ===============================
@@ -78,12 +84,13 @@ def lambda_handler(event, context):
         print(f"[Crawler] Starting scrape for URL: {url}")
 
         # ✅ FIX: Use snake_case parameters and handle Document object response
-        scrape_result = firecrawl.scrape(
-            url,
-            formats=["markdown", "html"],      # List of strings as per docs
-            only_main_content=False,            # ✅ CORRECT: snake_case parameter
-            timeout=120000                      # Timeout in milliseconds
-        )
+        with timed_call("firecrawl"):
+            scrape_result = firecrawl.scrape(
+                url,
+                formats=["markdown", "html"],      # List of strings as per docs
+                only_main_content=False,            # ✅ CORRECT: snake_case parameter
+                timeout=120000                      # Timeout in milliseconds
+            )
 
         # Debug: Log the type of result (helpful for troubleshooting)
         print(f"[Crawler] Type of scrape_result: {type(scrape_result)}")
@@ -154,20 +161,21 @@ def lambda_handler(event, context):
             "markdown": markdown_content[:15000] if markdown_content else "",
             "html_snippet": html_content[:5000] if html_content else "",
             # Extracted data from BeautifulSoup
-            "headings": _extract_headings(soup),
-            "links": _extract_links(soup, url),
-            "images": _extract_images(soup),
-            "meta_tags": _extract_meta_tags(soup),
-            "structured_data": _extract_structured_data(soup),
+            "headings": extract_headings(soup),
+            "links": extract_links(soup, url),
+            "images": extract_images(soup),
+            "meta_tags": extract_meta_tags(soup),
+            "structured_data": extract_structured_data(soup),
             "word_count": len(markdown_content.split()) if markdown_content else 0,
-            "has_robots_meta": _check_robots_meta(soup),
-            "has_canonical": _check_canonical(soup),
-            "has_sitemap_link": _check_sitemap(soup),
+            "has_robots_meta": check_robots_meta(soup),
+            "has_canonical": check_canonical(soup),
+            "has_sitemap_link": check_sitemap(soup),
             "crawl_timestamp": time.time(),
         }
 
         crawl_success = True
         print(f"[Crawler] Successfully processed {url}")
+        report_progress(task_id, "crawled", 30, "Website crawled ✓", cognito_sub=cognito_sub)
 
         # ===============================
         # 5️⃣ Store Crawl Result to S3
@@ -194,31 +202,51 @@ def lambda_handler(event, context):
         crawl_data = _get_fallback_data(url)
         crawl_data["error"] = str(e)
 
+    # Prepare input for the state machine
+    state_machine_input = {
+        "task_id": task_id,
+        "crawl_data": crawl_data,
+        "s3_location": {
+            "bucket": S3_BUCKET,
+            "key": s3_key,
+            "url": f"s3://{S3_BUCKET}/{s3_key}" if s3_key else None
+        },
+        "metadata": {
+            "cognito_sub": cognito_sub,
+            "brand_name": brand_name,
+            "keywords": keywords,
+            "industry": industry,
+            "crawl_timestamp": time.time()
+        }
+    }
+
+    # A resume restarts from this input instead of crawling again
+    if crawl_success:
+        save_checkpoint(task_id, "crawl", crawl_inputs(parsed_data), state_machine_input)
+
+    # "profile: true" in the start file profiles every stage of this task
+    if profile_requested(parsed_data):
+        state_machine_input["profile"] = True
+
     # ===============================
     # 6️⃣ Trigger Step Functions State Machine
     # ===============================
+    if from_batch:
+        # The batch state machine runs the pipeline itself from pipeline_input
+        if not crawl_success:
+            report_progress(task_id, "failed", 30, "Crawl failed", cognito_sub=cognito_sub)
+            _release_slot(task_id, cognito_sub)
+        return {
+            "success": crawl_success,
+            "message": "Crawling website completed" if crawl_success else "Crawl failed",
+            "pipeline_input": state_machine_input,
+        }
+
     if crawl_success and STATE_MACHINE_ARN:
         try:
             # Create a unique execution name
             execution_name = f"{task_id}-{int(time.time())}"
-            
-            # Prepare input for the state machine
-            state_machine_input = {
-                "task_id": task_id,
-                "crawl_data": crawl_data,
-                "s3_location": {
-                    "bucket": S3_BUCKET,
-                    "key": s3_key,
-                    "url": f"s3://{S3_BUCKET}/{s3_key}" if s3_key else None
-                },
-                "metadata": {
-                    "brand_name": brand_name,
-                    "keywords": keywords,
-                    "industry": industry,
-                    "crawl_timestamp": time.time()
-                }
-            }
-            
+
             # Start the state machine execution
             response = stepfunctions_client.start_execution(
                 stateMachineArn=STATE_MACHINE_ARN,
@@ -230,10 +258,14 @@ def lambda_handler(event, context):
             
         except Exception as e:
             print(f"[Crawler] Failed to start state machine: {e}")
+            _release_slot(task_id, cognito_sub)
     elif not STATE_MACHINE_ARN:
         print("[Crawler] STATE_MACHINE_ARN not configured. Skipping state machine trigger.")
+        _release_slot(task_id, cognito_sub)
     else:
         print("[Crawler] Crawl was not successful. Skipping state machine trigger.")
+        report_progress(task_id, "failed", 30, "Crawl failed", cognito_sub=cognito_sub)
+        _release_slot(task_id, cognito_sub)
 
     return {
         "success": crawl_success,
@@ -245,139 +277,42 @@ def lambda_handler(event, context):
 
 
 # ============================================================
-# HTML Parsing Helpers (These remain the same - they work correctly)
+# Helpers
 # ============================================================
 
-def _extract_headings(soup):
-    """Extract all headings (h1-h6) from the page"""
-    if not soup:
-        return {"h1": [], "h2": [], "h3": [], "h4": [], "h5": [], "h6": []}
-
-    headings = {}
-    for level in range(1, 7):
-        tag = f"h{level}"
-        headings[tag] = [h.get_text(strip=True) for h in soup.find_all(tag)][:20]
-
-    return headings
-
-
-def _extract_links(soup, base_url):
-    """Extract and categorize links from the page"""
-    if not soup:
-        return {"internal": 0, "external": 0, "nofollow": 0, "total": 0}
-
-    from urllib.parse import urlparse
-
-    base_domain = urlparse(base_url).netloc
-    links = soup.find_all("a", href=True)
-
-    internal = external = nofollow = 0
-
-    for link in links:
-        href = link.get("href", "")
-        rel = link.get("rel", [])
-
-        if "nofollow" in rel:
-            nofollow += 1
-
-        parsed = urlparse(href)
-
-        if parsed.netloc == "" or parsed.netloc == base_domain:
-            internal += 1
-        else:
-            external += 1
-
-    return {
-        "internal": internal,
-        "external": external,
-        "nofollow": nofollow,
-        "total": len(links),
-    }
-
-
-def _extract_images(soup):
-    """Extract image information including alt text"""
-    if not soup:
-        return {"total": 0, "with_alt": 0, "without_alt": 0, "alt_texts": []}
-
-    images = soup.find_all("img")
-
-    with_alt = sum(1 for img in images if img.get("alt", "").strip())
-    alt_texts = [img.get("alt", "") for img in images if img.get("alt", "").strip()]
-
-    return {
-        "total": len(images),
-        "with_alt": with_alt,
-        "without_alt": len(images) - with_alt,
-        "alt_texts": alt_texts[:20],
-    }
-
+def _read_start_file(event):
+    """Read and parse the TXT initialization file named in the S3 event"""
+    record = event["Records"][0]
+    bucket_name = record["s3"]["bucket"]["name"]
+    object_key = record["s3"]["object"]["key"]
 
-def _extract_meta_tags(soup):
-    """Extract all meta tags from the page"""
-    if not soup:
-        return []
+    print(f"[Crawler] Triggered by S3 object: {object_key}")
 
-    metas = []
-    for meta in soup.find_all("meta"):
-        tag_data = {}
-        for attr in ["name", "property", "content", "charset", "http-equiv"]:
-            val = meta.get(attr)
-            if val:
-                tag_data[attr] = val
-        if tag_data:
-            metas.append(tag_data)
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+        file_content = response["Body"].read().decode("utf-8")
+    except Exception as e:
+        print(f"[Crawler] Failed to read file from S3: {e}")
+        raise e
 
-    return metas[:30]
+    print("[Crawler] File content loaded")
 
+    parsed_data = {}
+    for line in file_content.split("\n"):
+        if ":" in line:
+            key, value = line.split(":", 1)
+            parsed_data[key.strip().lower().replace(" ", "_")] = value.strip()
+    return parsed_data
 
-def _extract_structured_data(soup):
-    """Extract structured data (JSON-LD) from the page"""
-    if not soup:
-        return []
 
-    schemas = []
-    for script in soup.find_all("script", type="application/ld+json"):
-        try:
-            if script.string:
-                data = json.loads(script.string)
-                if isinstance(data, dict):
-                    schemas.append({
-                        "type": data.get("@type", "Unknown"),
-                        "found": True
-                    })
-                elif isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            schemas.append({
-                                "type": item.get("@type", "Unknown"),
-                                "found": True
-                            })
-        except Exception:
-            continue
-
-    return schemas
-
-
-def _check_robots_meta(soup):
-    """Check if page has robots meta tag"""
-    if not soup:
-        return False
-    return soup.find("meta", attrs={"name": "robots"}) is not None
-
-
-def _check_canonical(soup):
-    """Check if page has canonical link"""
-    if not soup:
-        return False
-    return soup.find("link", attrs={"rel": "canonical"}) is not None
-
-
-def _check_sitemap(soup):
-    """Check if page contains sitemap reference"""
-    if not soup:
-        return False
-    return "sitemap" in str(soup).lower()
+def _release_slot(task_id, cognito_sub):
+    """No pipeline will run for this task, so hand its admission slot back"""
+    if not task_id or not cognito_sub:
+        return
+    try:
+        release(cognito_sub, task_id)
+    except ClientError as e:
+        print(f"[Crawler] Could not release admission slot for {task_id}: {e}")
 
 
 def _get_fallback_data(url):
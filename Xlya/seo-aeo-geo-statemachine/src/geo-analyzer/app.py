@@ -2,23 +2,44 @@
 XYLA INSIGHTS — GEO Analyzer Lambda
 Step Functions: GEO (Generative Engine Optimization) analysis.
 Uses Amazon Bedrock Claude 3 Haiku + DuckDuckGo for AI presence scoring.
+The scoring steps run as a task graph, fanned out per keyword (or keyword cluster),
+so wall time is the longest path rather than the sum of calls.
 Runs inside the Parallel state. Sends WebSocket progress updates.
 """
 import os
 import json
 import re
+import time
+import random
 import boto3
 
-from ws_helper import send_progress_update, update_analysis_status
+from ws_helper import report_progress, flush_progress_on_exit
+from task_graph import TaskGraph, deadline_from_context
+from rate_limit import get_limiter
+from checkpoint import checkpointed
+from metrics import instrumented, timed_call
 
 # Initialize Bedrock client
 bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
 MODEL_ID = "openai.gpt-oss-120b-1:0"
 
+# Upper bound for the GEO step graph; stays inside the 180 s Parallel branch timeout
+GEO_DEADLINE_SECONDS = float(os.environ.get("GEO_DEADLINE_SECONDS", "150"))
 
+# Multi-keyword fan-out: keywords beyond GEO_MAX_KEYWORD_GROUPS are clustered together
+GEO_MAX_KEYWORD_GROUPS = int(os.environ.get("GEO_MAX_KEYWORD_GROUPS", "12"))
+GEO_MAX_CONCURRENCY = int(os.environ.get("GEO_MAX_CONCURRENCY", "6"))
+
+# Factor weights used for a single keyword's score (AI Presence Index is brand-wide)
+KEYWORD_WEIGHTS = {"ai_brand_presence": 0.25, "content_uniqueness": 0.15, "topical_authority": 0.20, "ai_friendliness": 0.10, "web_presence": 0.15}
+
+
+@flush_progress_on_exit
+@instrumented("geo")
+@checkpointed("geo")
 def lambda_handler(event, context):
     # Extract task_id from the input - it's at the root level
-    task_id = event["task_id"]
+    task_id = event.get("task_id")
     
     # Extract crawl_data and metadata from the nested structure
     crawl_data = event.get("crawl_data", {})
@@ -38,33 +59,212 @@ def lambda_handler(event, context):
     if not industry:
         industry = event.get("industry", "")
 
+    cognito_sub = event.get("metadata", {}).get("cognito_sub")
+
     print(f"[GEO] Starting GEO analysis for task {task_id}")
 
-    send_progress_update(task_id, "analyzing_geo", 70, "Running GEO analysis & AI presence scan...")
-    update_analysis_status(task_id, "analyzing_geo", 70)
+    report_progress(task_id, "analyzing_geo", 70, "Running GEO analysis & AI presence scan...", cognito_sub=cognito_sub)
 
-    geo_result = _analyze_geo(crawl_data, brand_name, keywords, industry)
+    geo_result = _analyze_geo(crawl_data, brand_name, keywords, industry, deadline_from_context(context, GEO_DEADLINE_SECONDS))
 
     score = geo_result["overall_score"]
-    send_progress_update(task_id, "analyzing_geo", 80, f"GEO analysis complete — Score: {score}/100 ✓")
-    update_analysis_status(task_id, "analyzing_geo", 80)
+    report_progress(task_id, "analyzing_geo", 80, f"GEO analysis complete — Score: {score}/100 ✓", cognito_sub=cognito_sub)
 
     return {
         "message": "Running GEO analysis & AI presence scan...",
         "geo_data": geo_result,
+        "degraded": bool(geo_result["degraded"]),
     }
 
 
-def _analyze_geo(crawl_data, brand_name, keywords, industry):
-    from duckduckgo_search import DDGS
+def _analyze_geo(crawl_data, brand_name, keywords, industry, deadline_seconds=GEO_DEADLINE_SECONDS):
+    keyword_groups = _cluster_keywords(keywords, GEO_MAX_KEYWORD_GROUPS) or [[""]]
+    print(f"[GEO] {len(keywords)} keyword(s) in {len(keyword_groups)} group(s)")
 
-    factors = {}
+    # Brand simulation and web search run per keyword group and are independent;
+    # only the AI Presence Index needs the citation counts, so it runs last.
+    graph = TaskGraph(deadline_seconds=deadline_seconds, max_workers=GEO_MAX_CONCURRENCY, label="GEO")
+    for i, group in enumerate(keyword_groups):
+        graph.add(
+            f"brand_presence:{i}",
+            lambda group=group: _simulate_brand_presence(crawl_data, brand_name, " / ".join(group), industry),
+            fallback=_brand_presence_fallback(),
+        )
+        graph.add(
+            f"web_presence:{i}",
+            lambda group=group: _search_web_presence(brand_name, group[0]),
+            fallback=_web_presence_fallback(),
+        )
+
+    web_steps = [f"web_presence:{i}" for i in range(len(keyword_groups))]
+    graph.add(
+        "ai_presence",
+        lambda **web: _calculate_ai_presence(
+            crawl_data, brand_name, keywords, industry,
+            round(sum(w["citation_count"] for w in web.values()) / len(web)),
+        ),
+        depends_on=web_steps,
+        fallback=_ai_presence_fallback(),
+    )
+    results = graph.run()
+    print(f"[GEO] Step timings: {graph.timings}")
+
+    # Per-keyword scores
+    per_keyword = []
+    group_factors = []
     recommendations = []
+    for i, group in enumerate(keyword_groups):
+        brand = results[f"brand_presence:{i}"]
+        web = results[f"web_presence:{i}"]
+        factors = {**brand["factors"], **web["factors"]}
+        group_factors.append(factors)
+        recommendations.extend(brand["recommendations"] + web["recommendations"])
+
+        keyword_weight = sum(KEYWORD_WEIGHTS.values())
+        keyword_score = sum(factors[k]["score"] * w for k, w in KEYWORD_WEIGHTS.items()) / keyword_weight
+        per_keyword.append({
+            "keyword": group[0],
+            "keywords": group,
+            "score": round(keyword_score, 1),
+            "ai_brand_presence": factors["ai_brand_presence"]["score"],
+            "web_presence": factors["web_presence"]["score"],
+            "citation_count": web["citation_count"],
+        })
+
+    factors = _merge_factors(group_factors)
+    factors.update(results["ai_presence"]["factors"])
+    recommendations.extend(results["ai_presence"]["recommendations"])
+    recommendations = _dedupe_recommendations(recommendations)
+
+    ai_presence_index = results["ai_presence"]["ai_presence_index"]
 
-    # --- 1. AI Brand Mention Simulation using Bedrock Claude 3 Haiku ---
-    brand_prompt = f"""You are simulating multiple AI search engines. A user asks about "{keywords[0] if keywords else ''}" in the "{industry}" industry.
+    # Overall GEO Score
+    weights = {"ai_brand_presence": 0.25, "content_uniqueness": 0.15, "topical_authority": 0.20, "ai_friendliness": 0.10, "web_presence": 0.15, "ai_presence_index": 0.15}
+    overall_score = sum(factors[k]["score"] * weights.get(k, 0.1) for k in factors if k in weights)
+
+    if overall_score >= 75:
+        summary = f"{brand_name} has excellent GEO ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
+    elif overall_score >= 50:
+        summary = f"{brand_name} has moderate GEO readiness ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
+    else:
+        summary = f"{brand_name} has low GEO readiness ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
 
-Generate a realistic AI-generated answer to the query: "What are the best {keywords[0] if keywords else ''} solutions in {industry}?"
+    if len(per_keyword) > 1:
+        best = max(per_keyword, key=lambda k: k["score"])
+        worst = min(per_keyword, key=lambda k: k["score"])
+        summary += f" Strongest keyword: \"{best['keyword']}\" ({best['score']:.0f}); weakest: \"{worst['keyword']}\" ({worst['score']:.0f})."
+
+    return {
+        "overall_score": round(overall_score, 1),
+        "ai_presence_index": ai_presence_index,
+        "factors": factors,
+        "keyword_scores": per_keyword,
+        "recommendations": recommendations,
+        "summary": summary,
+        "degraded": sorted(graph.errors),
+    }
+
+
+# ============================================================
+# Keyword grouping & aggregation
+# ============================================================
+def _cluster_keywords(keywords, max_groups):
+    """Dedupe keywords, then merge the most similar ones until at most max_groups remain"""
+    seen = set()
+    groups = []
+    for kw in keywords:
+        norm = " ".join(kw.lower().split())
+        if norm and norm not in seen:
+            seen.add(norm)
+            groups.append([kw])
+
+    while len(groups) > max_groups:
+        best = None
+        for i in range(len(groups)):
+            tokens_i = _tokens(groups[i])
+            for j in range(i + 1, len(groups)):
+                tokens_j = _tokens(groups[j])
+                similarity = len(tokens_i & tokens_j) / len(tokens_i | tokens_j)
+                if best is None or similarity > best[0]:
+                    best = (similarity, i, j)
+        _, i, j = best
+        groups[i].extend(groups.pop(j))
+
+    return groups
+
+
+def _tokens(group):
+    return {token for kw in group for token in kw.lower().split()}
+
+
+def _merge_factors(group_factors):
+    """Average each factor's score across keyword groups, keeping the first group's details"""
+    merged = {}
+    for name in group_factors[0]:
+        first = group_factors[0][name]
+        scores = [factors[name]["score"] for factors in group_factors]
+        merged[name] = dict(first)
+        merged[name]["score"] = round(sum(scores) / len(scores), 1)
+        if len(group_factors) > 1:
+            merged[name]["findings"] = list(first.get("findings", [])) + [f"Averaged across {len(group_factors)} keyword groups"]
+    return merged
+
+
+def _dedupe_recommendations(recommendations):
+    seen = set()
+    unique = []
+    for rec in recommendations:
+        key = rec["action"].strip().lower()
+        if key not in seen:
+            seen.add(key)
+            unique.append(rec)
+    return unique
+
+
+def _invoke_model(prompt, max_tokens, max_retries=3):
+    request_body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": 0.3,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    })
+
+    for attempt in range(max_retries):
+        get_limiter("bedrock").acquire()
+        try:
+            with timed_call("bedrock") as call:
+                response = bedrock_runtime.invoke_model(
+                    modelId=MODEL_ID,
+                    contentType="application/json",
+                    accept="application/json",
+                    body=request_body,
+                )
+                call.record_usage(response)
+            break
+        except Exception as e:
+            if "ThrottlingException" in str(e) and attempt < max_retries - 1:
+                wait_time = (2 ** attempt) + random.uniform(0, 1)
+                print(f"[GEO] Throttled. Retrying in {wait_time:.2f} seconds... (attempt {attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+            else:
+                raise
+
+    response_body = json.loads(response['body'].read())
+    return _parse_json(response_body['content'][0]['text'])
+
+
+# ============================================================
+# 1. AI Brand Mention Simulation using Bedrock
+# ============================================================
+def _simulate_brand_presence(crawl_data, brand_name, keyword, industry):
+    brand_prompt = f"""You are simulating multiple AI search engines. A user asks about "{keyword}" in the "{industry}" industry.
+
+Generate a realistic AI-generated answer to the query: "What are the best {keyword} solutions in {industry}?"
 
 Then evaluate whether the brand "{brand_name}" ({crawl_data.get('url', '')}) would likely be mentioned.
 
@@ -84,49 +284,48 @@ Respond in JSON format only, with no additional text before or after:
 }}"""
 
     try:
-        # Call Bedrock Claude 3 Haiku
-        response = bedrock_runtime.invoke_model(
-            modelId=MODEL_ID,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1500,
-                "temperature": 0.3,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": brand_prompt
-                    }
-                ]
-            })
-        )
-        
-        response_body = json.loads(response['body'].read())
-        data = _parse_json(response_body['content'][0]['text'])
-
-        factors["ai_brand_presence"] = {"score": data.get("mention_likelihood_score", 40), "findings": data.get("findings", ["AI brand presence analyzed"]), "label": "AI Brand Presence", "sample_response": data.get("sample_ai_response_snippet", "")}
-        factors["content_uniqueness"] = {"score": data.get("content_uniqueness", 50), "findings": [f"Content uniqueness: {data.get('content_uniqueness', 50)}/100"], "label": "Content Uniqueness"}
-        factors["topical_authority"] = {"score": data.get("topical_authority", 50), "findings": [f"Topical authority: {data.get('topical_authority', 50)}/100"] + data.get("brand_authority_signals", []), "label": "Topical Authority"}
-        factors["ai_friendliness"] = {"score": data.get("ai_friendliness", 50), "findings": [f"AI-friendliness: {data.get('ai_friendliness', 50)}/100"], "label": "AI Content Friendliness"}
-
-        for imp in data.get("improvements", []):
-            recommendations.append({"priority": "high", "category": "GEO", "action": imp})
+        data = _invoke_model(brand_prompt, 1500)
     except Exception as e:
         print(f"[GEO] Brand simulation error: {e}")
-        factors["ai_brand_presence"] = {"score": 40, "findings": ["Partial analysis"], "label": "AI Brand Presence"}
-        factors["content_uniqueness"] = {"score": 50, "findings": ["Unable to fully assess"], "label": "Content Uniqueness"}
-        factors["topical_authority"] = {"score": 50, "findings": ["Unable to fully assess"], "label": "Topical Authority"}
-        factors["ai_friendliness"] = {"score": 50, "findings": ["Unable to fully assess"], "label": "AI Content Friendliness"}
+        return _brand_presence_fallback()
+
+    factors = {}
+    factors["ai_brand_presence"] = {"score": data.get("mention_likelihood_score", 40), "findings": data.get("findings", ["AI brand presence analyzed"]), "label": "AI Brand Presence", "sample_response": data.get("sample_ai_response_snippet", "")}
+    factors["content_uniqueness"] = {"score": data.get("content_uniqueness", 50), "findings": [f"Content uniqueness: {data.get('content_uniqueness', 50)}/100"], "label": "Content Uniqueness"}
+    factors["topical_authority"] = {"score": data.get("topical_authority", 50), "findings": [f"Topical authority: {data.get('topical_authority', 50)}/100"] + data.get("brand_authority_signals", []), "label": "Topical Authority"}
+    factors["ai_friendliness"] = {"score": data.get("ai_friendliness", 50), "findings": [f"AI-friendliness: {data.get('ai_friendliness', 50)}/100"], "label": "AI Content Friendliness"}
+
+    recommendations = [{"priority": "high", "category": "GEO", "action": imp} for imp in data.get("improvements", [])]
+    return {"factors": factors, "recommendations": recommendations}
+
 
-    # --- 2. Web Presence via DuckDuckGo ---
-    web_presence_score = 0
+def _brand_presence_fallback():
+    return {
+        "factors": {
+            "ai_brand_presence": {"score": 40, "findings": ["Partial analysis"], "label": "AI Brand Presence"},
+            "content_uniqueness": {"score": 50, "findings": ["Unable to fully assess"], "label": "Content Uniqueness"},
+            "topical_authority": {"score": 50, "findings": ["Unable to fully assess"], "label": "Topical Authority"},
+            "ai_friendliness": {"score": 50, "findings": ["Unable to fully assess"], "label": "AI Content Friendliness"},
+        },
+        "recommendations": [],
+    }
+
+
+# ============================================================
+# 2. Web Presence via DuckDuckGo
+# ============================================================
+def _search_web_presence(brand_name, keyword):
+    from duckduckgo_search import DDGS
+
+    recommendations = []
     web_findings = []
     citation_count = 0
     try:
         ddgs = DDGS()
-        search_query = f'"{brand_name}" {keywords[0] if keywords else ""}'
-        brand_results = list(ddgs.text(search_query, max_results=10))
+        search_query = f'"{brand_name}" {keyword}'
+        get_limiter("ddg").acquire()
+        with timed_call("ddg"):
+            brand_results = list(ddgs.text(search_query, max_results=10))
         citation_count = len(brand_results)
 
         if citation_count >= 8:
@@ -145,12 +344,27 @@ Respond in JSON format only, with no additional text before or after:
             recommendations.append({"priority": "critical", "category": "GEO - Web Presence", "action": "Urgently build web presence through content distribution and PR"})
     except Exception as e:
         print(f"[GEO] DuckDuckGo error: {e}")
-        web_presence_score = 40
-        web_findings.append("Web presence check partially completed")
+        return _web_presence_fallback()
+
+    return {
+        "factors": {"web_presence": {"score": web_presence_score, "findings": web_findings, "label": "Web Presence & Citations"}},
+        "recommendations": recommendations,
+        "citation_count": citation_count,
+    }
+
 
-    factors["web_presence"] = {"score": web_presence_score, "findings": web_findings, "label": "Web Presence & Citations"}
+def _web_presence_fallback():
+    return {
+        "factors": {"web_presence": {"score": 40, "findings": ["Web presence check partially completed"], "label": "Web Presence & Citations"}},
+        "recommendations": [],
+        "citation_count": 0,
+    }
 
-    # --- 3. AI Presence Index using Bedrock Claude 3 Haiku ---
+
+# ============================================================
+# 3. AI Presence Index using Bedrock (needs the citation count)
+# ============================================================
+def _calculate_ai_presence(crawl_data, brand_name, keywords, industry, citation_count):
     ai_presence_prompt = f"""Calculate an AI Presence Index for "{brand_name}" in "{industry}" for keywords: {', '.join(keywords) if keywords else ''}.
 
 Consider:
@@ -168,30 +382,15 @@ Respond in JSON format only, with no additional text before or after:
   "top_recommendations": ["rec1", "rec2", "rec3"]
 }}"""
 
-    ai_presence_index = 40
     try:
-        ai_response = bedrock_runtime.invoke_model(
-            modelId=MODEL_ID,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 800,
-                "temperature": 0.3,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": ai_presence_prompt
-                    }
-                ]
-            })
-        )
-        
-        ai_response_body = json.loads(ai_response['body'].read())
-        ai_data = _parse_json(ai_response_body['content'][0]['text'])
-        ai_presence_index = ai_data.get("ai_presence_index", 40)
+        ai_data = _invoke_model(ai_presence_prompt, 800)
+    except Exception as e:
+        print(f"[GEO] AI Presence error: {e}")
+        return _ai_presence_fallback()
 
-        factors["ai_presence_index"] = {
+    ai_presence_index = ai_data.get("ai_presence_index", 40)
+    factors = {
+        "ai_presence_index": {
             "score": ai_presence_index,
             "findings": [
                 ai_data.get("explanation", "AI presence analyzed"),
@@ -206,29 +405,16 @@ Respond in JSON format only, with no additional text before or after:
                 "perplexity": ai_data.get("perplexity_likelihood", 40),
             }
         }
-        for rec in ai_data.get("top_recommendations", []):
-            recommendations.append({"priority": "high", "category": "GEO - AI Presence", "action": rec})
-    except Exception as e:
-        print(f"[GEO] AI Presence error: {e}")
-        factors["ai_presence_index"] = {"score": 40, "findings": ["AI presence index could not be fully calculated"], "label": "AI Presence Index", "platform_scores": {"chatgpt": 40, "google_ai": 40, "perplexity": 40}}
-
-    # Overall GEO Score
-    weights = {"ai_brand_presence": 0.25, "content_uniqueness": 0.15, "topical_authority": 0.20, "ai_friendliness": 0.10, "web_presence": 0.15, "ai_presence_index": 0.15}
-    overall_score = sum(factors[k]["score"] * weights.get(k, 0.1) for k in factors if k in weights)
+    }
+    recommendations = [{"priority": "high", "category": "GEO - AI Presence", "action": rec} for rec in ai_data.get("top_recommendations", [])]
+    return {"factors": factors, "recommendations": recommendations, "ai_presence_index": ai_presence_index}
 
-    if overall_score >= 75:
-        summary = f"{brand_name} has excellent GEO ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
-    elif overall_score >= 50:
-        summary = f"{brand_name} has moderate GEO readiness ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
-    else:
-        summary = f"{brand_name} has low GEO readiness ({overall_score:.0f}/100). AI Presence Index: {ai_presence_index:.0f}/100."
 
+def _ai_presence_fallback():
     return {
-        "overall_score": round(overall_score, 1),
-        "ai_presence_index": ai_presence_index,
-        "factors": factors,
-        "recommendations": recommendations,
-        "summary": summary,
+        "factors": {"ai_presence_index": {"score": 40, "findings": ["AI presence index could not be fully calculated"], "label": "AI Presence Index", "platform_scores": {"chatgpt": 40, "google_ai": 40, "perplexity": 40}}},
+        "recommendations": [],
+        "ai_presence_index": 40,
     }
 
 
@@ -2,21 +2,30 @@ import os
 import json
 import uuid
 import time
+import hashlib
+from urllib.parse import urlparse
 import boto3
 from botocore.exceptions import ClientError
 
+from auth_middleware import authenticate
+from admission import try_admit, enqueue, release, ADMITTED
+from profiling import requested as profile_requested
+
 # AWS Clients
 dynamodb = boto3.resource("dynamodb")
 s3_client = boto3.client("s3")
 
 # Tables
-USERS_TABLE = "users-table"
 ANALYZER_TABLE = "seo-aeo-geo-analyzer-table"
 
 # S3
 S3_BUCKET = "xlya-bucket-dev"
 S3_PREFIX = "seo-aeo-geo-analyzer"
 
+# Duplicate submissions inside this window return the existing task
+SUBMISSION_DEDUP_WINDOW = int(os.environ.get("SUBMISSION_DEDUP_WINDOW", "900"))
+SUBMISSION_LOCK_PREFIX = "submit#"
+
 
 # ============================================================
 # CORS Response
@@ -27,7 +36,7 @@ def cors_response(status_code, body):
         "headers": {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization,Idempotency-Key",
             "Access-Control-Allow-Methods": "POST,OPTIONS",
         },
         "body": json.dumps(body),
@@ -35,40 +44,140 @@ def cors_response(status_code, body):
 
 
 # ============================================================
-# Lambda Handler
+# Submission Fingerprinting
 # ============================================================
-def lambda_handler(event, context):
+def _normalize_url(url):
+    parsed = urlparse(url if "://" in url else f"https://{url}")
+    host = (parsed.netloc or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parsed.path.rstrip("/")
+    query = f"?{parsed.query}" if parsed.query else ""
+    return f"{host}{path}{query}"
 
-    # ---------------------------
-    # Authorization Handling
-    # ---------------------------
-    headers = event.get("headers") or {}
-    auth_header = headers.get("Authorization") or headers.get("authorization")
 
-    if not auth_header:
-        return cors_response(
-            401, {"message": "Unauthorized: Missing Authorization header"}
+def _normalize_keywords(keywords):
+    return sorted({" ".join(k.lower().split()) for k in keywords.split(",") if k.strip()})
+
+
+def submission_fingerprint(cognito_sub, url, keywords, industry):
+    canonical = json.dumps(
+        [cognito_sub, _normalize_url(url), _normalize_keywords(keywords), " ".join(industry.lower().split())],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _lock_id(cognito_sub, fingerprint, idempotency_key):
+    # A client key identifies the submission on its own; otherwise the request content does
+    if idempotency_key:
+        digest = hashlib.sha256(f"{cognito_sub}|{idempotency_key}".encode("utf-8")).hexdigest()
+        return f"{SUBMISSION_LOCK_PREFIX}key#{digest[:32]}"
+    return f"{SUBMISSION_LOCK_PREFIX}fp#{fingerprint[:32]}"
+
+
+# ============================================================
+# Submission Lock
+# ============================================================
+def acquire_submission(analyzer_table, lock_id, cognito_sub, task_id, fingerprint):
+    """
+    Claim lock_id for task_id with a conditional write.
+    Returns None when claimed, otherwise the existing lock item.
+    """
+    now = int(time.time())
+    item = {
+        "task_id": lock_id,
+        "cognito_sub": cognito_sub,
+        "target_task_id": task_id,
+        "fingerprint": fingerprint,
+        "expires_at": now + SUBMISSION_DEDUP_WINDOW,
+    }
+    try:
+        analyzer_table.put_item(
+            Item=item,
+            ConditionExpression="attribute_not_exists(task_id) OR expires_at < :now",
+            ExpressionAttributeValues={":now": now},
         )
+        return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
 
-    if auth_header.lower().startswith("bearer "):
-        cognito_sub = auth_header.split(" ", 1)[1]
-    else:
-        cognito_sub = auth_header
+    existing = analyzer_table.get_item(
+        Key={"task_id": lock_id, "cognito_sub": cognito_sub}, ConsistentRead=True
+    ).get("Item")
+    if existing is None:
+        # Lock vanished between the write and the read; try once more
+        return acquire_submission(analyzer_table, lock_id, cognito_sub, task_id, fingerprint)
+    return existing
+
+
+def takeover_submission(analyzer_table, lock_id, cognito_sub, task_id, fingerprint, previous_task_id):
+    """Re-point a lock whose task failed; only one concurrent retry wins"""
+    now = int(time.time())
+    try:
+        analyzer_table.put_item(
+            Item={
+                "task_id": lock_id,
+                "cognito_sub": cognito_sub,
+                "target_task_id": task_id,
+                "fingerprint": fingerprint,
+                "expires_at": now + SUBMISSION_DEDUP_WINDOW,
+            },
+            ConditionExpression="target_task_id = :prev",
+            ExpressionAttributeValues={":prev": previous_task_id},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
 
-    # ---------------------------
-    # Validate User from users-table
-    # ---------------------------
-    users_table = dynamodb.Table(USERS_TABLE)
 
+def release_submission(analyzer_table, lock_id, cognito_sub, task_id):
     try:
-        response = users_table.get_item(Key={"cognito_sub": cognito_sub})
-        user = response.get("Item")
+        analyzer_table.delete_item(
+            Key={"task_id": lock_id, "cognito_sub": cognito_sub},
+            ConditionExpression="target_task_id = :t",
+            ExpressionAttributeValues={":t": task_id},
+        )
+    except ClientError as e:
+        print(f"[Orchestrator] Could not release submission lock {lock_id}: {e}")
 
-        if not user:
-            return cors_response(404, {"message": "User not found"})
 
+def mark_task_failed(analyzer_table, task_id, cognito_sub, reason):
+    try:
+        analyzer_table.update_item(
+            Key={"task_id": task_id, "cognito_sub": cognito_sub},
+            UpdateExpression="SET #st = :s, status_message = :m",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={":s": "failed", ":m": reason},
+        )
     except ClientError as e:
-        return cors_response(500, {"message": str(e)})
+        print(f"[Orchestrator] Could not mark task {task_id} failed: {e}")
+
+
+def get_task_status(analyzer_table, task_id, cognito_sub):
+    item = analyzer_table.get_item(
+        Key={"task_id": task_id, "cognito_sub": cognito_sub},
+        ProjectionExpression="#st, progress",
+        ExpressionAttributeNames={"#st": "status"},
+    ).get("Item")
+    return item or {"status": "initializing", "progress": "0"}
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    headers = event.get("headers") or {}
+    cognito_sub, user, auth_error = authenticate(event, attributes=["coins"])
+    if auth_error:
+        return cors_response(*auth_error)
 
     # ---------------------------
     # Parse Body
@@ -89,12 +198,57 @@ def lambda_handler(event, context):
             {"message": "Missing required fields: url, brand_name, keywords, industry"},
         )
 
+    # "profile": true profiles every stage of this task (see profiling.py)
+    profile = profile_requested(body)
+
+    idempotency_key = str(
+        headers.get("Idempotency-Key") or headers.get("idempotency-key") or body.get("idempotency_key") or ""
+    ).strip()
+
     # ---------------------------
     # Generate Task ID
     # ---------------------------
     task_id = str(uuid.uuid4())[:8]
     created_at = str(int(time.time()))
 
+    # ---------------------------
+    # Coalesce Duplicate Submissions
+    # ---------------------------
+    analyzer_table = dynamodb.Table(ANALYZER_TABLE)
+    fingerprint = submission_fingerprint(cognito_sub, url, keywords, industry)
+    lock_id = _lock_id(cognito_sub, fingerprint, idempotency_key)
+
+    try:
+        existing = acquire_submission(analyzer_table, lock_id, cognito_sub, task_id, fingerprint)
+        if existing is not None:
+            if existing.get("fingerprint") != fingerprint:
+                return cors_response(
+                    409,
+                    {"message": "Idempotency-Key was already used for a different request"},
+                )
+
+            existing_task_id = existing["target_task_id"]
+            current = get_task_status(analyzer_table, existing_task_id, cognito_sub)
+
+            # A failed run should not block the user from trying again
+            retry = current.get("status") == "failed" and takeover_submission(
+                analyzer_table, lock_id, cognito_sub, task_id, fingerprint, existing_task_id
+            )
+            if not retry:
+                print(f"[Orchestrator] Duplicate submission coalesced into task {existing_task_id}")
+                return cors_response(
+                    200,
+                    {
+                        "task_id": existing_task_id,
+                        "status": current.get("status"),
+                        "progress": current.get("progress"),
+                        "duplicate": True,
+                        "message": "An identical analysis is already in progress.",
+                    },
+                )
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
     # ---------------------------
     # Create S3 File
     # ---------------------------
@@ -106,25 +260,27 @@ def lambda_handler(event, context):
     Keywords: {keywords}
     Industry: {industry}
     Created At: {created_at}
+    Profile: {str(profile).lower()}
     """
 
     s3_key = f"{S3_PREFIX}/start_{task_id}_{created_at}.txt"
 
+    # ---------------------------
+    # Admission Control
+    # ---------------------------
+    # Over the per-user or global running cap the task is queued; the
+    # admission controller writes the start file once a slot frees up
     try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key,
-            Body=file_content.encode("utf-8"),
-            ContentType="text/plain",
-        )
+        admitted = try_admit(cognito_sub, task_id) == ADMITTED
     except ClientError as e:
-        return cors_response(500, {"message": f"S3 upload failed: {str(e)}"})
+        release_submission(analyzer_table, lock_id, cognito_sub, task_id)
+        return cors_response(500, {"message": f"Admission error: {str(e)}"})
+
+    status = "initializing" if admitted else "queued"
 
     # ---------------------------
     # Store Metadata in DynamoDB
     # ---------------------------
-    analyzer_table = dynamodb.Table(ANALYZER_TABLE)
-
     try:
         analyzer_table.put_item(
             Item={
@@ -135,15 +291,60 @@ def lambda_handler(event, context):
                 "brand_name": brand_name,
                 "keywords": keywords,
                 "industry": industry,
-                "status": "initializing",
+                "status": status,
                 "progress": "0",
                 "s3_start_file": f"s3://{S3_BUCKET}/{s3_key}",
                 "state_machine_path": f"s3://{S3_BUCKET}/{s3_key}",
+                "submission_fingerprint": fingerprint,
+                "profile": profile,
             }
         )
     except ClientError as e:
+        if admitted:
+            release(cognito_sub, task_id)
+        release_submission(analyzer_table, lock_id, cognito_sub, task_id)
         return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
 
+    # The record is written before the start file, so a failure here leaves
+    # nothing running: no record for retries to coalesce onto, no slot held
+    if admitted:
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET,
+                Key=s3_key,
+                Body=file_content.encode("utf-8"),
+                ContentType="text/plain",
+            )
+        except ClientError as e:
+            mark_task_failed(analyzer_table, task_id, cognito_sub, f"S3 upload failed: {e}")
+            release(cognito_sub, task_id)
+            release_submission(analyzer_table, lock_id, cognito_sub, task_id)
+            return cors_response(500, {"message": f"S3 upload failed: {str(e)}"})
+
+    if not admitted:
+        try:
+            enqueue(
+                cognito_sub,
+                task_id,
+                {"type": "start_file", "bucket": S3_BUCKET, "key": s3_key, "body": file_content},
+                coins=user.get("coins", 0),
+            )
+        except ClientError as e:
+            # Nothing will dispatch this task; a "queued" record would never move
+            mark_task_failed(analyzer_table, task_id, cognito_sub, f"Queueing failed: {e}")
+            release_submission(analyzer_table, lock_id, cognito_sub, task_id)
+            return cors_response(500, {"message": f"Queueing failed: {str(e)}"})
+
+        return cors_response(
+            200,
+            {
+                "task_id": task_id,
+                "status": "queued",
+                "message": "Analysis queued; it will start when a slot frees up.",
+                "next_step": "Admission controller will write the start file.",
+            },
+        )
+
     # ---------------------------
     # Success Response
     # ---------------------------
@@ -0,0 +1,170 @@
+"""
+XYLA INSIGHTS — Quick Audit Lambda
+Synchronous single-page audit: crawls one URL and returns the scores in the
+same HTTP response, with no S3 start file, state machine or polling.
+
+The SEO score is deterministic and always included. The LLM-backed AEO and
+GEO analyzers are opt-in ("include": ["aeo", "geo"]); they are invoked as
+RequestResponse Lambda calls in parallel under one deadline, and an analyzer
+that misses it is reported in "degraded" instead of failing the audit.
+"""
+import os
+import json
+import time
+import boto3
+from botocore.config import Config
+
+from auth_middleware import authenticate
+from page_features import crawl_page
+from seo_scoring import analyze_seo
+from task_graph import TaskGraph, deadline_from_context
+
+# Seconds for the single-page fetch
+QUICK_AUDIT_CRAWL_TIMEOUT = float(os.environ.get("QUICK_AUDIT_CRAWL_TIMEOUT", "8"))
+# Upper bound for the analyzers; stays under the 29 s API Gateway integration limit
+QUICK_AUDIT_DEADLINE_SECONDS = float(os.environ.get("QUICK_AUDIT_DEADLINE_SECONDS", "20"))
+
+AEO_ANALYZER_FUNCTION = os.environ.get("AEO_ANALYZER_FUNCTION", "aeo-analyzer")
+GEO_ANALYZER_FUNCTION = os.environ.get("GEO_ANALYZER_FUNCTION", "geo-analyzer")
+OPTIONAL_ANALYZERS = ("aeo", "geo")
+
+# AWS Clients (no retries: a retried analyzer call would not fit the deadline)
+lambda_client = boto3.client(
+    "lambda",
+    config=Config(read_timeout=QUICK_AUDIT_DEADLINE_SECONDS + 5, retries={"max_attempts": 0}),
+)
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Methods": "POST,OPTIONS",
+        },
+        "body": json.dumps(body),
+    }
+
+
+# ============================================================
+# Analyzer Invocation
+# ============================================================
+def invoke_analyzer(function_name, crawl_data, metadata, result_key):
+    """Run a pipeline analyzer Lambda synchronously and return its result block"""
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType="RequestResponse",
+        # No task_id: the analyzers skip progress updates and task writes without one
+        Payload=json.dumps({"task_id": None, "crawl_data": crawl_data, "metadata": metadata}),
+    )
+    payload = json.loads(response["Payload"].read() or b"{}")
+    if response.get("FunctionError"):
+        raise RuntimeError(f"{function_name} failed: {payload.get('errorMessage', 'unknown error')}")
+    return payload[result_key]
+
+
+def _parse_include(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return None
+    include = {str(item).strip().lower() for item in value if str(item).strip()}
+    return include if include <= set(OPTIONAL_ANALYZERS) else None
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+    started_at = time.monotonic()
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    cognito_sub, _user, auth_error = authenticate(event)
+    if auth_error:
+        return cors_response(*auth_error)
+
+    # ---------------------------
+    # Parse Body
+    # ---------------------------
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except (json.JSONDecodeError, TypeError):
+        return cors_response(400, {"message": "Invalid JSON body"})
+
+    url = str(body.get("url", "")).strip()
+    brand_name = str(body.get("brand_name", "")).strip()
+    keywords_str = str(body.get("keywords", "")).strip()
+    industry = str(body.get("industry", "")).strip()
+    keywords = [kw.strip() for kw in keywords_str.split(",") if kw.strip()]
+
+    if not url:
+        return cors_response(400, {"message": "Missing required field: url"})
+
+    include = _parse_include(body.get("include", []))
+    if include is None:
+        return cors_response(
+            400, {"message": f"include may only contain: {', '.join(OPTIONAL_ANALYZERS)}"}
+        )
+    if include and not brand_name:
+        return cors_response(400, {"message": "brand_name is required for AEO/GEO analysis"})
+
+    # ---------------------------
+    # Crawl Single Page
+    # ---------------------------
+    try:
+        crawl_data = crawl_page(url, timeout=QUICK_AUDIT_CRAWL_TIMEOUT, include_text=bool(include))
+    except Exception as e:
+        print(f"[QuickAudit] Crawl failed for {url}: {e}")
+        return cors_response(502, {"message": f"Could not fetch {url}: {str(e)}"})
+
+    crawl_ms = round((time.monotonic() - started_at) * 1000)
+    print(f"[QuickAudit] Crawled {crawl_data['url']} for {cognito_sub} in {crawl_ms} ms")
+
+    # ---------------------------
+    # Run Analyzers
+    # ---------------------------
+    metadata = {"brand_name": brand_name, "keywords": keywords_str, "industry": industry}
+
+    graph = TaskGraph(
+        deadline_seconds=deadline_from_context(context, QUICK_AUDIT_DEADLINE_SECONDS, reserve_seconds=2),
+        label="QuickAudit",
+    )
+    graph.add("seo", lambda: analyze_seo(crawl_data, keywords))
+    if "aeo" in include:
+        graph.add("aeo", lambda: invoke_analyzer(AEO_ANALYZER_FUNCTION, crawl_data, metadata, "aeo_data"))
+    if "geo" in include:
+        graph.add("geo", lambda: invoke_analyzer(GEO_ANALYZER_FUNCTION, crawl_data, metadata, "geo_data"))
+    results = graph.run()
+
+    if results["seo"] is None:
+        return cors_response(500, {"message": f"SEO analysis failed: {graph.errors.get('seo')}"})
+
+    # ---------------------------
+    # Success Response
+    # ---------------------------
+    scores = {
+        name: result["overall_score"] for name, result in results.items() if result is not None
+    }
+    response_body = {
+        "url": crawl_data["url"],
+        "status_code": crawl_data["statusCode"],
+        "scores": scores,
+        "degraded": sorted(graph.errors),
+        "timings_ms": {
+            "crawl": crawl_ms,
+            **{name: round(seconds * 1000) for name, seconds in graph.timings.items()},
+            "total": round((time.monotonic() - started_at) * 1000),
+        },
+    }
+    for name, result in results.items():
+        if result is not None:
+            response_body[f"{name}_data"] = result
+
+    return cors_response(200, response_body)
@@ -0,0 +1,245 @@
+"""
+XYLA INSIGHTS — Resume Task Lambda
+Restarts a failed or stalled analysis from its first missing stage.
+
+  POST {"task_id": "<id>"}
+
+Every stage checkpoints its output to S3 keyed by a hash of its inputs (see
+checkpoint.py). When the crawl is checkpointed, a new seo-aeo-geo-SM execution
+is started from the stored pipeline input; stages that already completed on
+that input return their checkpoint immediately, so only the missing or failed
+stages do real work. Without a crawl checkpoint the task restarts from the
+start file, exactly like a new submission.
+
+Resumes go through admission control like any other pipeline start.
+"""
+import os
+import json
+import time
+import boto3
+from botocore.exceptions import ClientError
+
+from auth_middleware import authenticate
+from admission import try_admit, enqueue, release, ADMITTED, ALREADY_CLAIMED
+from checkpoint import PIPELINE_STAGES, load, exists, crawl_inputs, stage_inputs
+from profiling import requested as profile_requested
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+s3_client = boto3.client("s3")
+stepfunctions_client = boto3.client("stepfunctions")
+
+# Tables
+ANALYZER_TABLE = "seo-aeo-geo-analyzer-table"
+
+# S3
+S3_BUCKET = os.environ.get("S3_BUCKET", "xlya-bucket-dev")
+S3_PREFIX = "seo-aeo-geo-analyzer"
+
+STATE_MACHINE_ARN = os.environ.get("STATE_MACHINE_ARN", "")
+
+# Tasks in these states are still owned by the pipeline or the admission queue
+NOT_RESUMABLE = {"completed", "queued"}
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Content-Type,Authorization",
+            "Access-Control-Allow-Methods": "POST,OPTIONS",
+        },
+        "body": json.dumps(body),
+    }
+
+
+# ============================================================
+# Resume Planning
+# ============================================================
+def plan_resume(task_id, task):
+    """
+    Returns (pipeline_input, reused_stages). pipeline_input is None when the
+    crawl has no checkpoint and the task has to start over.
+    """
+    pipeline_input = load(task_id, "crawl", crawl_inputs(task))
+    if pipeline_input is None:
+        return None, []
+
+    inputs = stage_inputs(pipeline_input)
+    reused = ["crawl"] + [
+        stage for stage in PIPELINE_STAGES[1:] if exists(task_id, stage, inputs)
+    ]
+    return pipeline_input, reused
+
+
+def start_file_action(task_id, cognito_sub, task, created_at):
+    # Same TXT file the orchestrator writes; its upload triggers the crawler
+    body = f"""
+    Task ID: {task_id}
+    Cognito Sub: {cognito_sub}
+    URL: {task.get("url", "")}
+    Brand Name: {task.get("brand_name", "")}
+    Keywords: {task.get("keywords", "")}
+    Industry: {task.get("industry", "")}
+    Created At: {created_at}
+    Profile: {str(bool(task.get("profile"))).lower()}
+    """
+    return {
+        "type": "start_file",
+        "bucket": S3_BUCKET,
+        "key": f"{S3_PREFIX}/start_{task_id}_{created_at}.txt",
+        "body": body,
+    }
+
+
+def start_execution_action(task_id, pipeline_input):
+    return {
+        "type": "start_execution",
+        "state_machine_arn": STATE_MACHINE_ARN,
+        "name": f"{task_id}-resume-{int(time.time())}",
+        "input": json.dumps(pipeline_input),
+    }
+
+
+def run_action(action):
+    if action["type"] == "start_execution":
+        response = stepfunctions_client.start_execution(
+            stateMachineArn=action["state_machine_arn"],
+            name=action["name"],
+            input=action["input"],
+        )
+        print(f"[ResumeTask] Started execution: {response['executionArn']}")
+    else:
+        s3_client.put_object(
+            Bucket=action["bucket"],
+            Key=action["key"],
+            Body=action["body"].encode("utf-8"),
+            ContentType="text/plain",
+        )
+        print(f"[ResumeTask] Wrote start file s3://{action['bucket']}/{action['key']}")
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    cognito_sub, user, auth_error = authenticate(event, attributes=["coins"])
+    if auth_error:
+        return cors_response(*auth_error)
+
+    # ---------------------------
+    # Parse Body
+    # ---------------------------
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except (json.JSONDecodeError, TypeError):
+        return cors_response(400, {"message": "Invalid JSON body"})
+
+    task_id = str(body.get("task_id", "")).strip()
+    if not task_id:
+        return cors_response(400, {"message": "Missing required field: task_id"})
+
+    # ---------------------------
+    # Load Task
+    # ---------------------------
+    analyzer_table = dynamodb.Table(ANALYZER_TABLE)
+    try:
+        task = analyzer_table.get_item(
+            Key={"task_id": task_id, "cognito_sub": cognito_sub}, ConsistentRead=True
+        ).get("Item")
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
+    if not task or "url" not in task:
+        return cors_response(404, {"message": "Task not found"})
+    if task.get("status") in NOT_RESUMABLE:
+        return cors_response(409, {"message": f"Task is {task['status']} and cannot be resumed"})
+
+    # ---------------------------
+    # Plan From Checkpoints
+    # ---------------------------
+    pipeline_input, reused = plan_resume(task_id, task)
+    if pipeline_input is not None and not STATE_MACHINE_ARN:
+        return cors_response(500, {"message": "STATE_MACHINE_ARN not configured"})
+
+    # A task submitted with "profile": true stays profiled; the resume request can ask too
+    if profile_requested(body):
+        task["profile"] = True
+    if task.get("profile") and pipeline_input is not None:
+        pipeline_input["profile"] = True
+
+    if pipeline_input is None:
+        action = start_file_action(task_id, cognito_sub, task, str(int(time.time())))
+    else:
+        action = start_execution_action(task_id, pipeline_input)
+
+    missing = [stage for stage in PIPELINE_STAGES if stage not in reused]
+    resume_from = missing[0] if missing else "scoring"
+    print(f"[ResumeTask] Task {task_id}: reusing {reused or 'nothing'}, resuming from {resume_from}")
+
+    # ---------------------------
+    # Admission Control
+    # ---------------------------
+    try:
+        outcome = try_admit(cognito_sub, task_id)
+    except ClientError as e:
+        return cors_response(500, {"message": f"Admission error: {str(e)}"})
+
+    if outcome == ALREADY_CLAIMED:
+        # The slot lease is held until the running execution ends
+        return cors_response(409, {"message": "Task is still running"})
+
+    if outcome == ADMITTED:
+        try:
+            run_action(action)
+        except ClientError as e:
+            release(cognito_sub, task_id)
+            return cors_response(500, {"message": f"Resume failed: {str(e)}"})
+        status = "initializing"
+    else:
+        try:
+            enqueue(cognito_sub, task_id, action, coins=user.get("coins", 0))
+        except ClientError as e:
+            return cors_response(500, {"message": f"Queueing failed: {str(e)}"})
+        status = "queued"
+
+    # ---------------------------
+    # Update Task Record
+    # ---------------------------
+    try:
+        analyzer_table.update_item(
+            Key={"task_id": task_id, "cognito_sub": cognito_sub},
+            UpdateExpression="SET #st = :s, resumed_at = :t, resume_from = :r ADD resume_count :one",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={
+                ":s": status,
+                ":t": str(int(time.time())),
+                ":r": resume_from,
+                ":one": 1,
+            },
+        )
+    except ClientError as e:
+        print(f"[ResumeTask] Could not update task {task_id}: {e}")
+
+    # ---------------------------
+    # Success Response
+    # ---------------------------
+    return cors_response(
+        202,
+        {
+            "task_id": task_id,
+            "status": status,
+            "resume_from": resume_from,
+            "reused_stages": reused,
+            "message": "Analysis resumed." if status == "initializing" else "Resume queued; it will start when a slot frees up.",
+        },
+    )
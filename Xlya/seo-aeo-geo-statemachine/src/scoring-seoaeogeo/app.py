@@ -1,48 +1,113 @@
 """
-XYLA INSIGHTS — SEO Analyzer Lambda
-Step Functions Step 2: Performs technical SEO audit on crawled website data.
+XYLA INSIGHTS — Final Scoring Lambda
+Step Functions Step 4: Aggregates the SEO, AEO and GEO stage scores into the
+task's final_scores, saves them on the task record and marks the task
+completed (through report_progress, so WebSocket clients see it too).
 """
+import os
+import time
+from decimal import Decimal
+import boto3
+from botocore.exceptions import ClientError
 
+from ws_helper import report_progress, flush_progress_on_exit
+from metrics import instrumented
+
+dynamodb = boto3.resource("dynamodb")
+
+ANALYZER_TABLE = os.environ.get("SEOAEOGEOANALYZERTABLE", "seo-aeo-geo-analyzer-table")
+
+# Weight of each stage in the overall score; stages without a score are left out
+FINAL_WEIGHTS = {"seo": 0.4, "aeo": 0.3, "geo": 0.3}
+
+
+@flush_progress_on_exit
+@instrumented("scoring")
 def lambda_handler(event, context):
     """
-    Expected Input from Step Functions:
+    Expected Input from Step Functions (the whole pipeline state):
 
     {
       "task_id": "...",
       "crawl_data": {...},
-      "metadata": {
-          "brand_name": "...",
-          "keywords": "kw1, kw2",
-          "industry": "..."
-      }
+      "metadata": {"cognito_sub": "...", "keywords": "kw1, kw2", ...},
+      "seo_result": {"seo_data": {...}},
+      "parallel_results": [{"aeo_data": {...}}, {"geo_data": {...}}, {"competitor_data": {...}}]
     }
     """
 
     task_id = event.get("task_id")
 
     metadata = event.get("metadata", {})
+    cognito_sub = metadata.get("cognito_sub")
     keywords_str = metadata.get("keywords", "")
     keywords = [kw.strip() for kw in keywords_str.split(",") if kw.strip()]
 
-    crawl_data = event.get("crawl_data", {})
+    print(f"[Scoring] Computing final scores for task {task_id}")
 
-    print(f"[SEO] Starting SEO analysis for task {task_id}")
-    
-    # Print status message
-    status_message = "Running SEO audit..."
-    print(status_message)
+    # SeoAnalysis already scored the page; re-score only if it did not
+    seo_data = (event.get("seo_result") or {}).get("seo_data") or _analyze_seo(event.get("crawl_data", {}), keywords)
+    stages = {"seo_data": seo_data}
+    for branch in event.get("parallel_results") or []:
+        for key in ("aeo_data", "geo_data", "competitor_data"):
+            if isinstance(branch, dict) and key in branch:
+                stages[key] = branch[key]
 
-    seo_result = _analyze_seo(crawl_data, keywords)
+    final_scores = compute_final_scores(stages)
+    save_final_scores(task_id, cognito_sub, final_scores)
+    report_progress(
+        task_id, "completed", 100,
+        f"Analysis complete — overall score {final_scores['overall']:.0f}/100 ✓",
+        cognito_sub=cognito_sub,
+    )
 
     return {
         "task_id": task_id,
-        "seo_data": seo_result,
-        "message": status_message  # Add the message to the output
+        "final_scores": final_scores,
+        "seo_data": seo_data,
+        "message": "Analysis complete",
     }
 
 
+def compute_final_scores(stages):
+    scores = {}
+    for stage in FINAL_WEIGHTS:
+        score = (stages.get(f"{stage}_data") or {}).get("overall_score")
+        if score is not None:
+            scores[stage] = round(float(score), 1)
+
+    weight = sum(FINAL_WEIGHTS[stage] for stage in scores)
+    overall = sum(scores[stage] * FINAL_WEIGHTS[stage] for stage in scores) / weight if weight else 0.0
+
+    final_scores = {**scores, "overall": round(overall, 1)}
+    geo = stages.get("geo_data") or {}
+    if geo.get("ai_presence_index") is not None:
+        final_scores["ai_presence_index"] = round(float(geo["ai_presence_index"]), 1)
+    comparison = (stages.get("competitor_data") or {}).get("comparison") or {}
+    if comparison.get("brand_position"):
+        final_scores["competitor_position"] = comparison["brand_position"]
+    return final_scores
+
+
+def save_final_scores(task_id, cognito_sub, final_scores):
+    """Scores go on the record before the completed status, so a client reacting to it finds them"""
+    if not task_id or not cognito_sub:
+        print(f"[Scoring] Cannot save final scores for task {task_id}: owner unknown")
+        return
+    try:
+        dynamodb.Table(ANALYZER_TABLE).update_item(
+            Key={"task_id": task_id, "cognito_sub": cognito_sub},
+            UpdateExpression="SET final_scores = :f, completed_at = :t",
+            ExpressionAttributeValues={
+                ":f": {k: Decimal(str(v)) if isinstance(v, float) else v for k, v in final_scores.items()},
+                ":t": str(int(time.time())),
+            },
+        )
+    except ClientError as e:
+        print(f"[Scoring] Could not save final scores for task {task_id}: {e}")
+
+
 def _analyze_seo(crawl_data: dict, keywords: list) -> dict:
-    # ... rest of your existing code remains exactly the same ...
     factors = {}
     recommendations = []
 
@@ -0,0 +1,204 @@
+"""
+XYLA INSIGHTS — Task History Lambda
+Read API over seo-aeo-geo-analyzer-table for the calling user.
+
+  GET ?task_id=<id>                      status and final scores of one task
+  GET ?limit=&cursor=&status=a,b         the user's tasks, newest first
+
+Listing queries the cognito_sub-index GSI (range key created_at) with a
+projection of summary fields and an opaque cursor built from
+LastEvaluatedKey. Every response carries an ETag; a request whose
+If-None-Match matches gets an empty 304 so polling clients stay cheap.
+"""
+import os
+import json
+import base64
+import hashlib
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+from auth_middleware import authenticate
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+
+# Tables
+ANALYZER_TABLE = "seo-aeo-geo-analyzer-table"
+HISTORY_INDEX = "cognito_sub-index"
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("HISTORY_DEFAULT_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "100"))
+# Upper bound on GSI pages read to fill one filtered page
+MAX_QUERY_PAGES = 5
+
+SUMMARY_FIELDS = [
+    "task_id", "url", "brand_name", "keywords", "industry", "#st", "progress",
+    "created_at", "updated_at", "batch_id",
+]
+STATUS_FIELDS = [
+    "task_id", "url", "brand_name", "#st", "progress", "status_message",
+    "created_at", "updated_at", "batch_id", "final_scores", "stage_metrics",
+]
+FIELD_NAMES = {"#st": "status"}
+
+
+# ============================================================
+# CORS Response
+# ============================================================
+def cors_response(status_code, body, extra_headers=None):
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "Content-Type,Authorization,If-None-Match",
+        "Access-Control-Allow-Methods": "GET,OPTIONS",
+        "Access-Control-Expose-Headers": "ETag",
+    }
+    headers.update(extra_headers or {})
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": json.dumps(body, default=_json_default) if body is not None else "",
+    }
+
+
+def _json_default(value):
+    # DynamoDB numbers come back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def conditional_response(headers, body):
+    """200 with an ETag, or an empty 304 when the client already has this body"""
+    payload = json.dumps(body, default=_json_default, sort_keys=True)
+    etag = '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = headers.get("If-None-Match") or headers.get("if-none-match") or ""
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return cors_response(304, None, cache_headers)
+    return cors_response(200, body, cache_headers)
+
+
+# ============================================================
+# Cursor Helpers
+# ============================================================
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor, cognito_sub):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    # A cursor is only valid for the user it was issued to
+    if not isinstance(key, dict) or key.get("cognito_sub") != cognito_sub:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+# ============================================================
+# Queries
+# ============================================================
+def list_tasks(cognito_sub, limit, cursor=None, statuses=None):
+    table = dynamodb.Table(ANALYZER_TABLE)
+    kwargs = {
+        "IndexName": HISTORY_INDEX,
+        "KeyConditionExpression": Key("cognito_sub").eq(cognito_sub),
+        "ScanIndexForward": False,
+        "ProjectionExpression": ", ".join(SUMMARY_FIELDS),
+        "ExpressionAttributeNames": dict(FIELD_NAMES),
+    }
+    if statuses:
+        kwargs["FilterExpression"] = Attr("status").is_in(statuses)
+    if cursor:
+        kwargs["ExclusiveStartKey"] = cursor
+
+    items = []
+    last_key = None
+    for _ in range(MAX_QUERY_PAGES):
+        kwargs["Limit"] = limit - len(items)
+        response = table.query(**kwargs)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key or len(items) >= limit:
+            break
+        kwargs["ExclusiveStartKey"] = last_key
+
+    return items, last_key
+
+
+def get_task(cognito_sub, task_id):
+    response = dynamodb.Table(ANALYZER_TABLE).get_item(
+        Key={"task_id": task_id, "cognito_sub": cognito_sub},
+        ProjectionExpression=", ".join(STATUS_FIELDS),
+        ExpressionAttributeNames=dict(FIELD_NAMES),
+    )
+    return response.get("Item")
+
+
+# ============================================================
+# Lambda Handler
+# ============================================================
+def lambda_handler(event, context):
+
+    # ---------------------------
+    # Authorization Handling
+    # ---------------------------
+    headers = event.get("headers") or {}
+    cognito_sub, _user, auth_error = authenticate(event)
+    if auth_error:
+        return cors_response(*auth_error)
+
+    params = event.get("queryStringParameters") or {}
+
+    # ---------------------------
+    # Single Task Status
+    # ---------------------------
+    task_id = (params.get("task_id") or "").strip()
+    if task_id:
+        try:
+            task = get_task(cognito_sub, task_id)
+        except ClientError as e:
+            return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+        if not task:
+            return cors_response(404, {"message": "Task not found"})
+        return conditional_response(headers, {"task": task})
+
+    # ---------------------------
+    # Task History
+    # ---------------------------
+    try:
+        limit = int(params.get("limit") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        return cors_response(400, {"message": "limit must be an integer"})
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    statuses = [s.strip() for s in (params.get("status") or "").split(",") if s.strip()]
+
+    cursor = None
+    if params.get("cursor"):
+        try:
+            cursor = decode_cursor(params["cursor"], cognito_sub)
+        except ValueError as e:
+            return cors_response(400, {"message": str(e)})
+
+    try:
+        items, last_key = list_tasks(cognito_sub, limit, cursor, statuses)
+    except ClientError as e:
+        return cors_response(500, {"message": f"DynamoDB error: {str(e)}"})
+
+    return conditional_response(
+        headers,
+        {
+            "tasks": items,
+            "count": len(items),
+            "next_cursor": encode_cursor(last_key),
+        },
+    )
@@ -0,0 +1,68 @@
+"""
+XYLA INSIGHTS — WebSocket Connection Lambda
+Handles $connect / $disconnect for the progress WebSocket API.
+Clients connect with ?task_id=<task_id>&token=<cognito_sub> and are registered
+against that task so the pipeline Lambdas can push progress events to them.
+A connection is only accepted for a task owned by the token's user.
+"""
+import boto3
+from botocore.exceptions import ClientError
+
+from ws_helper import register_connection, drop_connection
+
+# AWS Clients
+dynamodb = boto3.resource("dynamodb")
+
+# Tables
+ANALYZER_TABLE = "seo-aeo-geo-analyzer-table"
+
+
+def owns_task(task_id, cognito_sub):
+    response = dynamodb.Table(ANALYZER_TABLE).get_item(
+        Key={"task_id": task_id, "cognito_sub": cognito_sub},
+        ProjectionExpression="task_id",
+    )
+    return "Item" in response
+
+
+def lambda_handler(event, context):
+    request_context = event.get("requestContext", {})
+    route_key = request_context.get("routeKey")
+    connection_id = request_context.get("connectionId")
+    params = event.get("queryStringParameters") or {}
+
+    print(f"[WS] {route_key} for connection {connection_id}")
+
+    if route_key == "$connect":
+        task_id = params.get("task_id")
+        if not task_id:
+            return {"statusCode": 400, "body": "Missing task_id"}
+
+        token = params.get("token") or ""
+        cognito_sub = token.split(" ", 1)[1] if token.lower().startswith("bearer ") else token
+        if not cognito_sub:
+            return {"statusCode": 401, "body": "Missing token"}
+
+        try:
+            if not owns_task(task_id, cognito_sub):
+                print(f"[WS] Rejected connection {connection_id}: task {task_id} not owned by caller")
+                return {"statusCode": 403, "body": "Forbidden"}
+        except ClientError as e:
+            print(f"[WS] Failed to check task ownership: {e}")
+            return {"statusCode": 500, "body": "Failed to register connection"}
+
+        try:
+            register_connection(task_id, connection_id, cognito_sub)
+        except ClientError as e:
+            print(f"[WS] Failed to register connection: {e}")
+            return {"statusCode": 500, "body": "Failed to register connection"}
+        return {"statusCode": 200, "body": "Connected"}
+
+    if route_key == "$disconnect":
+        try:
+            drop_connection(connection_id)
+        except ClientError as e:
+            print(f"[WS] Failed to drop connection: {e}")
+        return {"statusCode": 200, "body": "Disconnected"}
+
+    return {"statusCode": 200, "body": "OK"}